@@ -0,0 +1,233 @@
+"""
+Contrôle d'admission : limitation de débit et délestage avant le traitement.
+
+- Seaux à jetons par groupe de routes (auth, reads, writes, estimation), par
+  utilisateur authentifié et par adresse IP : un client qui boucle (onglet
+  bloqué, script) reçoit 429 + Retry-After sans pénaliser les autres. Derrière
+  un proxy de confiance (nginx du frontend), l'adresse est celle que le proxy
+  ajoute à X-Forwarded-For.
+- Plafond global de requêtes en cours dérivé de la taille du pool de connexions :
+  au-delà, ou si le pool est épuisé, 503 + Retry-After tout de suite plutôt
+  qu'une attente de connexion qui ralentirait tout le monde.
+Les limites sont propres à chaque processus (WEB_CONCURRENCY multiplie le débit admis).
+"""
+import ipaddress
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import jwt
+from fastapi_users.jwt import decode_jwt
+
+from metrics import ADMISSION, ADMISSION_REJECTED
+
+# Débit (requêtes par seconde) et rafale autorisés par utilisateur, format "débit/rafale"
+DEFAULT_LIMITS = {
+    "auth": "0.2/10",
+    "reads": "10/60",
+    "writes": "2/30",
+    "estimation": "0.2/5",
+}
+# Une adresse IP peut regrouper plusieurs utilisateurs (NAT, foyer)
+RATE_LIMIT_IP_FACTOR = float(os.getenv("RATE_LIMIT_IP_FACTOR", "4"))
+# Proxys dont on lit X-Forwarded-For (réseaux Docker par défaut : nginx du frontend)
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1,172.16.0.0/12")
+# Seaux gardés en mémoire (les plus anciens sont oubliés, donc remis à plein)
+RATE_LIMIT_KEYS = int(os.getenv("RATE_LIMIT_KEYS", "10000"))
+# Requêtes en cours admises sur la base ; 0 = capacité du pool (taille + dépassement)
+MAX_DB_IN_FLIGHT = int(os.getenv("MAX_DB_IN_FLIGHT", "0"))
+# Retry-After proposé quand le serveur est saturé (secondes)
+OVERLOAD_RETRY_AFTER = 1
+JWT_AUDIENCE = ["fastapi-users:auth"]
+
+
+def parse_limit(value: str) -> Tuple[float, float]:
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+
+def configured_limits() -> Dict[str, Tuple[float, float]]:
+    """Limites par groupe, surchargées par RATE_LIMIT_<GROUPE> (ex. RATE_LIMIT_READS=10/60, 0 = illimité)"""
+    return {group: parse_limit(os.getenv(f"RATE_LIMIT_{group.upper()}", default)) for group, default in DEFAULT_LIMITS.items()}
+
+
+def parse_networks(value: str) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip()]
+
+
+def route_group(method: str, path: str) -> Optional[str]:
+    """Groupe de limitation d'une requête ; None pour les routes non limitées (fichiers statiques, /metrics...)"""
+    if method == "OPTIONS":
+        return None
+    if path.startswith("/auth/"):
+        return "auth"
+    if path.startswith("/meals/estimate"):
+        return "estimation"
+    if path.startswith(("/meals", "/users")):
+        return "reads" if method in ("GET", "HEAD") else "writes"
+    return None
+
+
+class TokenBuckets:
+    """Seaux à jetons d'un même débit, indexés par clé (LRU borné)"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # clé -> (jetons, instant)
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Consomme un jeton ; retourne 0 si accepté, sinon l'attente avant le prochain jeton"""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI pur : refuse avant le routage, l'authentification et tout accès à la base"""
+
+    def __init__(
+        self,
+        app,
+        engine,
+        secret: str,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        trusted_proxies: str = TRUSTED_PROXIES,
+    ):
+        self.app = app
+        self.engine = engine
+        self.secret = secret
+        self.trusted_proxies = parse_networks(trusted_proxies)
+        self.in_flight = 0
+        self.users: Dict[str, TokenBuckets] = {}
+        self.ips: Dict[str, TokenBuckets] = {}
+        for group, (rate, burst) in (limits or configured_limits()).items():
+            if rate > 0:
+                self.users[group] = TokenBuckets(rate, burst)
+                self.ips[group] = TokenBuckets(rate * RATE_LIMIT_IP_FACTOR, burst * RATE_LIMIT_IP_FACTOR)
+        ADMISSION.labels("in_flight").set_function(lambda: self.in_flight)
+        ADMISSION.labels("capacity").set_function(lambda: self.capacity() or 0)
+
+    def capacity(self) -> Optional[int]:
+        """Requêtes simultanées admises ; None si le pool n'est pas borné"""
+        if MAX_DB_IN_FLIGHT:
+            return MAX_DB_IN_FLIGHT
+        pool = self.engine.sync_engine.pool
+        size, overflow = getattr(pool, "size", None), getattr(pool, "_max_overflow", -1)
+        if not callable(size) or overflow < 0:
+            return None
+        return size() + overflow
+
+    def pool_exhausted(self) -> bool:
+        pool = self.engine.sync_engine.pool
+        capacity = self.capacity()
+        return capacity is not None and callable(getattr(pool, "checkedout", None)) and pool.checkedout() >= capacity
+
+    def trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def client_ip(self, scope) -> Optional[str]:
+        """
+        Adresse du client : la connexion, ou derrière un proxy de confiance la
+        dernière adresse de X-Forwarded-For qui n'est pas un proxy de confiance
+        (celles placées avant par le client lui-même ne sont pas crues).
+        """
+        client = scope.get("client")
+        if not client:
+            return None
+        address = client[0]
+        if not self.trusted(address):
+            return address
+        forwarded = [
+            item.strip()
+            for name, value in scope.get("headers", ())
+            if name == b"x-forwarded-for"
+            for item in value.decode("latin-1").split(",")
+        ]
+        for hop in reversed(forwarded):
+            if hop and not self.trusted(hop):
+                return hop
+        return address
+
+    def user_key(self, scope) -> Optional[str]:
+        """Identifiant de l'utilisateur du jeton Bearer (signature vérifiée), sans requête SQL"""
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    return None
+                try:
+                    return decode_jwt(token, self.secret, JWT_AUDIENCE).get("sub")
+                except jwt.PyJWTError:
+                    return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        group = route_group(scope["method"], scope["path"])
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = 0.0
+        client = self.client_ip(scope)
+        if group in self.ips and client:
+            wait = self.ips[group].take(client)
+            reason = "ip"
+        user = self.user_key(scope)
+        if not wait and group in self.users and user is not None:
+            wait = self.users[group].take(user)
+            reason = "user"
+        if wait:
+            ADMISSION_REJECTED.labels(group, reason).inc()
+            await self.reject(send, 429, "Trop de requêtes, réessayez plus tard", wait)
+            return
+
+        # L'estimation attend le modèle, pas la base : sa file a sa propre limite (scheduler.py)
+        bounded = group != "estimation"
+        if bounded:
+            capacity = self.capacity()
+            if self.pool_exhausted() or (capacity is not None and self.in_flight >= capacity):
+                ADMISSION_REJECTED.labels(group, "overload").inc()
+                await self.reject(send, 503, "Serveur surchargé, réessayez plus tard", OVERLOAD_RETRY_AFTER)
+                return
+            self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if bounded:
+                self.in_flight -= 1
+
+    @staticmethod
+    async def reject(send, status: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Archive froide des repas anciens : un fichier Parquet (zstd) par mois.
+
+Les mois plus anciens que ARCHIVE_AFTER_MONTHS sont écrits dans
+MEAL_ARCHIVE_DIR/meal-AAAA-MM.parquet, triés par (user_id, date) pour que la
+lecture d'un utilisateur ne décompresse que ses row groups, puis retirés de
+meal (DROP de la partition si meal est partitionnée, voir partitions.py,
+DELETE sinon). Le fichier est écrit et renommé avant la suppression : après
+une interruption, un mois peut être à la fois en base et dans l'archive, la
+lecture et l'archivage suivant éliminent alors les doublons par id.
+
+Les cumuls (daily_totals, frequent_foods) ne sont pas modifiés : statistiques
+et autocomplétion couvrent toujours tout l'historique. La liste des repas et
+l'export complètent la base par l'archive quand la période demandée la
+recoupe ; les repas archivés sont en lecture seule (404 en modification) et
+absents de la recherche et de /meals/changes. Un repas saisi après coup dans
+un mois archivé reste en base jusqu'au passage suivant, qui le fusionne au
+fichier existant. Nécessite pyarrow.
+"""
+import argparse
+import asyncio
+import fcntl
+import os
+import re
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import delete, distinct, event, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from db import SessionLocal
+from export import EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, parquet_available, parquet_schema
+from invalidation import ARCHIVE_CHANGED, invalidation_bus
+from models import Meal
+from partitions import add_months, drop_partition, ensure_partitions, is_partitioned, month_start, monthly_partitions, partition_name
+from serialization import MEAL_READ_FIELDS
+from stats import bucket_expression
+
+MEAL_ARCHIVE_DIR = os.getenv("MEAL_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+# Âge (en mois) au-delà duquel un mois est archivé ; 0 = archivage désactivé
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "0"))
+# Intervalle entre deux passages de maintenance (partitions, archivage), en heures
+STORAGE_MAINTENANCE_INTERVAL = float(os.getenv("STORAGE_MAINTENANCE_INTERVAL", "24"))
+ARCHIVE_ROW_GROUP = 50_000
+ARCHIVE_DELETE_BATCH = 10_000
+# Clé du verrou consultatif Postgres qui sérialise la maintenance (voir migrations.py)
+STORAGE_LOCK_ID = 427_002
+ARCHIVE_FILE = re.compile(r"^meal-(\d{4})-(\d{2})\.parquet$")
+
+# Lignes lues dans l'archive, mêmes champs que les lignes de la base (MealRead, export)
+ArchivedMeal = namedtuple("ArchivedMeal", MEAL_READ_FIELDS)
+ArchivedExportRow = namedtuple("ArchivedExportRow", EXPORT_COLUMNS)
+
+
+def month_path(month: date) -> str:
+    return os.path.join(MEAL_ARCHIVE_DIR, f"meal-{month.year:04d}-{month.month:02d}.parquet")
+
+
+def scan_archive() -> List[date]:
+    """Mois présents dans MEAL_ARCHIVE_DIR, du plus ancien au plus récent (lecture du disque)"""
+    try:
+        names = os.listdir(MEAL_ARCHIVE_DIR)
+    except FileNotFoundError:
+        return []
+    months = []
+    for name in names:
+        match = ARCHIVE_FILE.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+class ArchiveIndex:
+    """
+    Mois archivés gardés en mémoire : les requêtes ne lisent pas le répertoire.
+    Rechargé au démarrage, après chaque archivage et, dans les autres workers,
+    sur l'événement ARCHIVE_CHANGED du bus d'invalidation.
+    """
+
+    def __init__(self):
+        self.months: List[date] = []
+        self.boundary: Optional[datetime] = None
+
+    def refresh(self, _=None) -> List[date]:
+        months = scan_archive()
+        boundary = None
+        if months:
+            end = add_months(months[-1], 1)
+            boundary = datetime(end.year, end.month, end.day)
+        self.months, self.boundary = months, boundary
+        return months
+
+
+archive_index = ArchiveIndex()
+
+
+def archived_months() -> List[date]:
+    """Mois présents dans l'archive, du plus ancien au plus récent"""
+    return archive_index.months
+
+
+def archive_boundary() -> Optional[datetime]:
+    """Fin du dernier mois archivé : avant, les repas peuvent être dans l'archive"""
+    return archive_index.boundary
+
+
+def archive_covers(start: Optional[datetime]) -> bool:
+    """La période commençant à `start` (None = depuis toujours) recoupe-t-elle l'archive ?"""
+    boundary = archive_index.boundary
+    return boundary is not None and (start is None or start < boundary)
+
+
+# Écriture
+
+def _arrow_batch(rows: Sequence):
+    import pyarrow as pa
+
+    return pa.Table.from_arrays([list(column) for column in zip(*rows)], schema=parquet_schema())
+
+
+async def _read_month(conn: AsyncConnection, month: date):
+    """Repas du mois en base, triés par (user_id, date, id), en table Arrow"""
+    import pyarrow as pa
+
+    table = Meal.__table__
+    end = add_months(month, 1)
+    query = (
+        select(*(table.c[name] for name in EXPORT_COLUMNS))
+        .where(table.c.date >= month, table.c.date < end)
+        .order_by(table.c.user_id, table.c.date, table.c.id)
+    )
+    batches = []
+    result = await conn.stream(query.execution_options(yield_per=ARCHIVE_ROW_GROUP))
+    async for rows in result.partitions():
+        # Requête dans la boucle, conversion Arrow dans un thread
+        batches.append(await asyncio.to_thread(_arrow_batch, rows))
+    return pa.concat_tables(batches) if batches else parquet_schema().empty_table()
+
+
+async def lock_storage(conn: AsyncConnection):
+    """
+    Sérialise archivage et création de partitions entre workers et CLI. Postgres :
+    verrou consultatif libéré à la fin de la transaction (comme les migrations) ;
+    SQLite : verrou de fichier, attendu dans un thread et tenu jusqu'à la fin de
+    la transaction.
+    """
+    sync_conn = conn.sync_connection
+    if sync_conn.info.get("storage_locked"):
+        return
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": STORAGE_LOCK_ID})
+    else:
+        os.makedirs(MEAL_ARCHIVE_DIR, exist_ok=True)
+        lock = open(os.path.join(MEAL_ARCHIVE_DIR, ".lock"), "a")
+        try:
+            await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+        except BaseException:
+            lock.close()
+            raise
+        # Libéré avec le fichier, à la fin de la transaction
+        event.listen(sync_conn, "commit", lambda _: lock.close(), once=True)
+        event.listen(sync_conn, "rollback", lambda _: lock.close(), once=True)
+    sync_conn.info["storage_locked"] = True
+
+    def unlocked(_):
+        sync_conn.info.pop("storage_locked", None)
+
+    event.listen(sync_conn, "commit", unlocked, once=True)
+    event.listen(sync_conn, "rollback", unlocked, once=True)
+
+
+def _write_atomically(table, path: str):
+    """Fichier temporaire propre à l'appel, synchronisé puis renommé"""
+    import pyarrow.parquet as pq
+
+    descriptor, temporary = tempfile.mkstemp(dir=MEAL_ARCHIVE_DIR, prefix=".meal-", suffix=".tmp")
+    os.close(descriptor)
+    try:
+        pq.write_table(table, temporary, compression="zstd", row_group_size=ARCHIVE_ROW_GROUP)
+        with open(temporary, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _merge_into_file(fresh, path: str):
+    """Fusionne les repas lus en base au fichier du mois (s'il existe) et l'écrit. Bloquant"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    table = fresh
+    if os.path.exists(path):
+        previous = pq.read_table(path, schema=parquet_schema())
+        # Doublons possibles après une interruption : la version en base l'emporte
+        previous = previous.filter(pc.invert(pc.is_in(previous["id"], value_set=fresh["id"])))
+        table = pa.concat_tables([previous, fresh]).sort_by(
+            [("user_id", "ascending"), ("date", "ascending"), ("id", "ascending")]
+        )
+    os.makedirs(MEAL_ARCHIVE_DIR, exist_ok=True)
+    _write_atomically(table, path)
+
+
+def _month_partition(conn: Connection, month: date) -> bool:
+    return is_partitioned(conn) and month in monthly_partitions(conn)
+
+
+async def archive_month(conn: AsyncConnection, month: date) -> int:
+    """
+    Archive un mois (fusion avec un fichier existant) puis le retire de meal ;
+    retourne le nombre de repas déplacés. À appeler sous lock_storage. Seules
+    les requêtes SQL passent dans la boucle ; Parquet (lecture, tri, zstd,
+    fsync) tourne dans un thread.
+    """
+    partition = await conn.run_sync(_month_partition, month)
+    if partition:
+        # Écritures du mois bloquées jusqu'au DROP : aucune ne se glisse entre lecture et suppression
+        await conn.execute(text(f"LOCK TABLE {partition_name(month)} IN SHARE MODE"))
+    fresh = await _read_month(conn, month)
+    if fresh.num_rows == 0:
+        return 0
+    await asyncio.to_thread(_merge_into_file, fresh, month_path(month))
+
+    if partition:
+        await conn.run_sync(drop_partition, month)
+    else:
+        # Seulement les repas écrits dans le fichier : un repas antidaté saisi
+        # depuis la lecture reste en base jusqu'au passage suivant
+        ids = fresh["id"].to_pylist()
+        for index in range(0, len(ids), ARCHIVE_DELETE_BATCH):
+            await conn.execute(delete(Meal).where(Meal.id.in_(ids[index:index + ARCHIVE_DELETE_BATCH])))
+    return fresh.num_rows
+
+
+async def archive_old_months(conn: AsyncConnection, older_than_months: int = ARCHIVE_AFTER_MONTHS) -> List[Tuple[date, int]]:
+    """Archive chaque mois antérieur à la limite ; retourne (mois, repas déplacés)"""
+    await lock_storage(conn)
+    cutoff = add_months(month_start(datetime.utcnow()), -older_than_months)
+    bucket = bucket_expression(Meal.date, "month", conn.dialect.name)
+    months = sorted(
+        month_start(value if isinstance(value, date) else date.fromisoformat(value))
+        for value in (await conn.execute(select(distinct(bucket)).where(Meal.date < cutoff))).scalars()
+    )
+    if conn.dialect.name != "postgresql":
+        # SQLite réattribue le plus grand id supprimé : le mois du dernier repas
+        # saisi reste en base, sans quoi un nouveau repas reprendrait un id archivé
+        newest = (await conn.execute(select(Meal.date).order_by(Meal.id.desc()).limit(1))).scalar()
+        months = [month for month in months if newest is None or month != month_start(newest)]
+    archived = [(month, await archive_month(conn, month)) for month in months]
+    if archived:
+        await asyncio.to_thread(archive_index.refresh)
+    return archived
+
+
+# Lecture
+
+def _month_filters(user_id: Optional[int], start: Optional[datetime], end: Optional[datetime]):
+    filters = []
+    if user_id is not None:
+        filters.append(("user_id", "=", user_id))
+    if start is not None:
+        filters.append(("date", ">=", start))
+    if end is not None:
+        filters.append(("date", "<", end))
+    return filters or None
+
+
+def _months_between(start: Optional[datetime], end: Optional[datetime]) -> List[date]:
+    return [
+        month for month in archived_months()
+        if (start is None or add_months(month, 1) > start.date()) and (end is None or month < end.date() + timedelta(days=1))
+    ]
+
+
+def _upper_bound(end: Optional[datetime], before: Optional[Tuple[datetime, int]]) -> Optional[datetime]:
+    """Borne large sur la date ; la comparaison exacte (date, id) au curseur est faite ensuite"""
+    if before is None:
+        return end
+    after_cursor = before[0] + timedelta(microseconds=1)
+    return min(end, after_cursor) if end else after_cursor
+
+
+def _read_archived_month(
+    month: date,
+    user_id: int,
+    start: Optional[datetime],
+    upper: Optional[datetime],
+    before: Optional[Tuple[datetime, int]],
+) -> List[ArchivedMeal]:
+    """Repas archivés d'un mois, du plus récent au plus ancien. Bloquant"""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(month_path(month), columns=list(MEAL_READ_FIELDS), filters=_month_filters(user_id, start, upper))
+    rows = [ArchivedMeal(**row) for row in table.to_pylist()]
+    if before is not None:
+        rows = [row for row in rows if (row.date, row.id) < before]
+    rows.sort(key=lambda row: (row.date, row.id), reverse=True)
+    return rows
+
+
+def read_archived(
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = None,
+) -> List[ArchivedMeal]:
+    """
+    Repas archivés d'un utilisateur dans [start, end), du plus récent au plus
+    ancien, strictement avant le curseur `before` (date, id). Bloquant : à
+    appeler via asyncio.to_thread.
+    """
+    upper = _upper_bound(end, before)
+    rows: List[ArchivedMeal] = []
+    for month in reversed(_months_between(start, upper)):
+        rows.extend(_read_archived_month(month, user_id, start, upper, before))
+        # Les mois sont disjoints : les plus anciens ne passeraient pas devant
+        if limit is not None and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+
+async def live_archived_ids(user_id: Optional[int], start: Optional[datetime], end: Optional[datetime]) -> Set[int]:
+    """
+    Repas encore en base dans la période archivée (archivage interrompu, repas
+    antidaté) : la version en base l'emporte sur celle de l'archive. Peu
+    nombreux, ils sont retirés des lectures de l'archive par id.
+    """
+    boundary = archive_boundary()
+    if boundary is None:
+        return set()
+    query = select(Meal.id).where(Meal.date < (min(end, boundary) if end else boundary))
+    if user_id is not None:
+        query = query.where(Meal.user_id == user_id)
+    if start is not None:
+        query = query.where(Meal.date >= start)
+    async with SessionLocal() as session:
+        return set((await session.execute(query)).scalars())
+
+
+async def archived_meal_partitions(
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+) -> AsyncIterator[List[ArchivedMeal]]:
+    """Repas archivés d'un utilisateur, un bloc par mois du plus récent au plus ancien, à fusionner avec la base"""
+    live = await live_archived_ids(user_id, start, end)
+    upper = _upper_bound(end, before)
+    for month in reversed(_months_between(start, upper)):
+        rows = await asyncio.to_thread(_read_archived_month, month, user_id, start, upper, before)
+        yield [row for row in rows if row.id not in live]
+
+
+async def complete_page(
+    rows: Sequence,
+    user_id: int,
+    limit: Optional[int],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+) -> List:
+    """
+    Complète par l'archive des lignes de la base triées du plus récent au plus
+    ancien (page de `limit` + 1 lignes au plus, comme le fait get_meals).
+    Sans effet si la page est pleine de repas plus récents que l'archive.
+    """
+    boundary = archive_boundary()
+    if boundary is None or (start is not None and start >= boundary):
+        return list(rows)
+    wanted = limit + 1 if limit else None
+    if wanted and len(rows) >= wanted and rows[-1].date >= boundary:
+        return list(rows)
+    archived = await asyncio.to_thread(read_archived, user_id, start, end, before, wanted)
+    if not archived:
+        return list(rows)
+    known = {row.id for row in rows}
+    merged = list(rows) + [row for row in archived if row.id not in known]
+    merged.sort(key=lambda row: (row.date, row.id), reverse=True)
+    return merged[:wanted] if wanted else merged
+
+
+async def archived_export_partitions(
+    user_id: Optional[int], start: Optional[date], end: Optional[date]
+) -> AsyncIterator[List[ArchivedExportRow]]:
+    """Blocs de lignes d'export archivées, triées par (date, id), à fusionner avec celles de la base"""
+    import pyarrow.parquet as pq
+
+    lower = datetime(start.year, start.month, start.day) if start else None
+    upper = datetime(end.year, end.month, end.day) + timedelta(days=1) if end else None
+    live = await live_archived_ids(user_id, lower, upper)
+    for month in _months_between(lower, upper):
+        # Avec le schéma : une colonne absente d'un fichier plus ancien est lue à null
+        table = await asyncio.to_thread(
+            pq.read_table, month_path(month), schema=parquet_schema(), columns=list(EXPORT_COLUMNS),
+            filters=_month_filters(user_id, lower, upper),
+        )
+        table = table.sort_by([("date", "ascending"), ("id", "ascending")])
+        for batch in table.to_batches(EXPORT_CHUNK_SIZE):
+            yield [ArchivedExportRow(**row) for row in batch.to_pylist() if row["id"] not in live]
+
+
+# Maintenance
+
+async def storage_maintenance(conn: AsyncConnection) -> Tuple[List[date], List[Tuple[date, int]]]:
+    """Partitions à venir puis archivage des mois anciens (si activé et pyarrow présent)"""
+    await lock_storage(conn)
+    created = await conn.run_sync(ensure_partitions)
+    archived = []
+    if ARCHIVE_AFTER_MONTHS > 0 and parquet_available():
+        archived = await archive_old_months(conn, ARCHIVE_AFTER_MONTHS)
+    return created, archived
+
+
+async def storage_maintenance_loop(engine):
+    """Passage périodique (tâche de fond du serveur)"""
+    if ARCHIVE_AFTER_MONTHS > 0 and not parquet_available():
+        print("⚠️ ARCHIVE_AFTER_MONTHS ignoré : installer pyarrow")
+    while True:
+        try:
+            async with engine.begin() as conn:
+                created, archived = await storage_maintenance(conn)
+            for month in created:
+                print(f"🗓️ Partition {month:%Y-%m} créée")
+            for month, count in archived:
+                print(f"📦 {month:%Y-%m} archivé ({count} repas)")
+            if archived:
+                await invalidation_bus.publish(ARCHIVE_CHANGED, 0)
+        except Exception as e:
+            print(f"⚠️ Maintenance du stockage : {e}")
+        await asyncio.sleep(STORAGE_MAINTENANCE_INTERVAL * 3600)
+
+
+async def main():
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Archive Parquet des repas anciens")
+    parser.add_argument("command", choices=["archive", "list"])
+    parser.add_argument("--months", type=int, default=ARCHIVE_AFTER_MONTHS or 24,
+                        help="Archiver les mois plus anciens que ce nombre de mois")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for month in scan_archive():
+            print(f"   {month:%Y-%m}  {os.path.getsize(month_path(month)) / 1024:.0f} Kio")
+        return
+    if not parquet_available():
+        raise SystemExit("❌ pyarrow est nécessaire pour l'archivage")
+    async with engine.begin() as conn:
+        archived = await archive_old_months(conn, args.months)
+    for month, count in archived:
+        print(f"📦 {month:%Y-%m} archivé ({count} repas)")
+    if archived:
+        # Les serveurs en cours rechargent leur index
+        await invalidation_bus.publish(ARCHIVE_CHANGED, 0)
+    print(f"✅ {len(archived)} mois archivés dans {MEAL_ARCHIVE_DIR}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
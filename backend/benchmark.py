@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Benchmark de charge de l'API repas, exécuté en processus.
+
+L'application FastAPI est appelée via un client ASGI (httpx) sur une base
+jetable (SQLite temporaire par défaut, ou BENCH_DATABASE_URL), peuplée avec
+generate_random_meal_data. Un mélange réaliste d'opérations (tableau de bord,
+statistiques du jour, ajouts, modifications, connexions) est joué par des
+clients concurrents ; le débit et les percentiles p50/p95/p99 par endpoint
+sont écrits dans un fichier JSON et comparés à une référence.
+
+    python benchmark.py --users 20 --days 365 --duration 30
+    python benchmark.py --save-baseline          # enregistre la référence
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+PASSWORD = "bench-password"
+
+# Poids relatifs des opérations dans le mélange
+OPERATIONS = {
+    "dashboard": 4,
+    "daily_stats": 6,
+    "list_day": 4,
+    "create": 3,
+    "update": 2,
+    "login": 1,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de l'API CalorieTrack")
+    parser.add_argument("--users", type=int, default=10, help="Utilisateurs générés")
+    parser.add_argument("--days", type=int, default=180, help="Jours d'historique par utilisateur")
+    parser.add_argument("--meals-per-day", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients simultanés")
+    parser.add_argument("--duration", type=float, default=20.0, help="Durée de la mesure (secondes)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Durée de chauffe non mesurée (secondes)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_result.json", help="Fichier de résultats")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Fichier de référence")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistrer le résultat comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Dégradation p95 tolérée (0.2 = +20 %%)")
+    return parser.parse_args()
+
+
+def configure_database() -> str:
+    """Base jetable : BENCH_DATABASE_URL si fourni, sinon un fichier SQLite temporaire"""
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        path = os.path.join(tempfile.mkdtemp(prefix="calorietrack-bench-"), "bench.db")
+        url = f"sqlite+aiosqlite:///{path}"
+    # Doit précéder l'import de db/main
+    os.environ["DATABASE_URL"] = url
+    # Les clients simulés dépassent volontairement les limites de débit par utilisateur
+    for group in ("AUTH", "READS", "WRITES", "ESTIMATION"):
+        os.environ.setdefault(f"RATE_LIMIT_{group}", "0")
+    return url
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def seed(args, rng):
+    """Crée les utilisateurs et leur historique ; retourne {email: [ids de repas]}"""
+    from sqlalchemy import insert, select
+
+    from db import engine
+    from migrations import migrate
+    from models import Meal, User
+    from passwords import password_pool
+    from foods import rebuild_frequent_foods
+    from rollup import rebuild_daily_totals
+    from seed_data import generate_random_meal_data
+
+    await migrate(engine)
+    # generate_random_meal_data utilise le générateur global
+    random.seed(args.seed)
+    # Un seul hachage pour tous les utilisateurs (même mot de passe)
+    hashed_password = password_pool.hash(PASSWORD)
+    meal_types = ["breakfast", "lunch", "dinner"]
+    start_day = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=args.days)
+
+    async with engine.begin() as conn:
+        emails = [f"bench{i}@example.com" for i in range(args.users)]
+        await conn.execute(insert(User), [
+            {"email": email, "hashed_password": hashed_password, "is_active": True,
+             "is_superuser": False, "is_verified": True}
+            for email in emails
+        ])
+        users = (await conn.execute(select(User.id, User.email))).all()
+        for user_id, _ in users:
+            rows = []
+            for day in range(args.days):
+                for slot in range(args.meals_per_day):
+                    meal_type = meal_types[slot % len(meal_types)]
+                    data = generate_random_meal_data(meal_type)
+                    rows.append({**data, "user_id": user_id,
+                                 "date": start_day + timedelta(days=day, hours=5 * slot)})
+            await conn.execute(insert(Meal), rows)
+        await conn.run_sync(rebuild_daily_totals)
+        await conn.run_sync(rebuild_frequent_foods)
+        meals = (await conn.execute(select(Meal.id, Meal.user_id))).all()
+
+    ids_by_user = {}
+    for meal_id, user_id in meals:
+        ids_by_user.setdefault(user_id, []).append(meal_id)
+    return {email: ids_by_user.get(user_id, []) for user_id, email in users}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.errors = {name: 0 for name in OPERATIONS}
+        self.active = False
+
+    def record(self, name, elapsed, ok):
+        if not self.active:
+            return
+        self.latencies[name].append(elapsed)
+        if not ok:
+            self.errors[name] += 1
+
+
+async def run_workload(args, rng, meal_ids):
+    import httpx
+
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    recorder = Recorder()
+    names = list(OPERATIONS)
+    weights = [OPERATIONS[name] for name in names]
+    today = date.today()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = {}
+        for email in meal_ids:
+            response = await client.post("/auth/jwt/login", data={"username": email, "password": PASSWORD})
+            response.raise_for_status()
+            tokens[email] = response.json()["access_token"]
+        emails = list(tokens)
+
+        async def operation(name, email):
+            headers = {"Authorization": f"Bearer {tokens[email]}"}
+            some_day = (today - timedelta(days=rng.randrange(args.days))).isoformat()
+            if name == "dashboard":
+                return await client.get("/meals/stats/range", headers=headers, params={
+                    "from": (today - timedelta(days=29)).isoformat(), "to": today.isoformat(),
+                    "granularity": "day", "macros": "calories,proteins,carbohydrates,fats",
+                })
+            if name == "daily_stats":
+                return await client.get("/meals/stats/daily", headers=headers, params={"date_filter": some_day})
+            if name == "list_day":
+                return await client.get("/meals/", headers=headers, params={"date_filter": some_day})
+            if name == "create":
+                return await client.post("/meals/", headers=headers, json={
+                    "name": "Bench", "calories": rng.randint(100, 900), "proteins": rng.randint(0, 60),
+                    "meal_type": "snack", "date": f"{some_day}T16:00:00",
+                })
+            if name == "update":
+                meal_id = rng.choice(meal_ids[email])
+                return await client.put(f"/meals/{meal_id}", headers=headers,
+                                        json={"calories": rng.randint(100, 900)})
+            return await client.post("/auth/jwt/login", data={"username": email, "password": PASSWORD})
+
+        async def worker(deadline):
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await operation(name, rng.choice(emails))
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                recorder.record(name, time.perf_counter() - start, ok)
+
+        if args.warmup > 0:
+            await asyncio.gather(*(worker(time.perf_counter() + args.warmup) for _ in range(args.concurrency)))
+        recorder.active = True
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(started + args.duration) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    total = 0
+    for name, values in recorder.latencies.items():
+        values = sorted(values)
+        total += len(values)
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors[name],
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+    return {"elapsed_s": round(elapsed, 2), "total_rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+
+def compare(result, baseline, tolerance):
+    """Liste des endpoints dont le p95 s'est dégradé au-delà de la tolérance"""
+    regressions = []
+    for name, current in result["endpoints"].items():
+        reference = baseline.get("endpoints", {}).get(name)
+        if not reference or not reference["p95_ms"] or not current["count"]:
+            continue
+        ratio = current["p95_ms"] / reference["p95_ms"]
+        status = "❌" if ratio > 1 + tolerance else "✅"
+        print(f"   {status} {name:12} p95 {reference['p95_ms']:8.2f} ms -> {current['p95_ms']:8.2f} ms ({ratio - 1:+.0%})")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+async def main():
+    args = parse_args()
+    database_url = configure_database()
+    rng = random.Random(args.seed)
+
+    print(f"🌱 Génération : {args.users} utilisateurs × {args.days} jours × {args.meals_per_day} repas")
+    meal_ids = await seed(args, rng)
+    print(f"🏁 Mesure : {args.concurrency} clients pendant {args.duration:.0f} s")
+    recorder, elapsed = await run_workload(args, rng, meal_ids)
+
+    result = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "database": database_url.split("://")[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "save_baseline")},
+        **summarize(recorder, elapsed),
+    }
+
+    print(f"\n{'endpoint':12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erreurs':>8}")
+    for name, stats in result["endpoints"].items():
+        print(f"{name:12} {stats['throughput_rps']:8.1f} {stats['p50_ms']:8.2f} {stats['p95_ms']:8.2f} "
+              f"{stats['p99_ms']:8.2f} {stats['errors']:8d}")
+    print(f"Total : {result['total_rps']:.1f} req/s")
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"📝 Résultats écrits dans {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"📌 Référence enregistrée dans {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        print(f"🔎 Comparaison avec {args.baseline}")
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️ Régressions : {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de la sérialisation d'une liste de repas.
+
+Compare, sur une base SQLite temporaire de N repas :
+- l'ancien chemin : objets ORM Meal -> validation MealRead par ligne ->
+  jsonable_encoder -> json.dumps (ce que faisait FastAPI avec response_model) ;
+- le chemin rapide : SELECT des colonnes de MealRead -> orjson (serialization.py).
+
+    python benchmark_serialization.py --meals 5000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de sérialisation des repas")
+    parser.add_argument("--meals", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="calorietrack-serial-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import insert, select
+
+    from db import SessionLocal, engine
+    from migrations import migrate
+    from models import Meal, User
+    from schemas import MealRead
+    from seed_data import generate_random_meal_data
+    from serialization import encode_meals, meal_read_query
+
+    await migrate(engine)
+    async with engine.begin() as conn:
+        await conn.execute(insert(User).values(
+            id=1, email="serial@example.com", hashed_password="x",
+            is_active=True, is_superuser=False, is_verified=True,
+        ))
+        start = datetime(2020, 1, 1, 8)
+        await conn.execute(insert(Meal), [
+            {**generate_random_meal_data("lunch"), "user_id": 1, "date": start + timedelta(hours=8 * i)}
+            for i in range(args.meals)
+        ])
+
+    adapter = TypeAdapter(List[MealRead])
+
+    async def orm_path():
+        async with SessionLocal() as session:
+            meals = (await session.execute(select(Meal).where(Meal.user_id == 1))).scalars().all()
+        return json.dumps(jsonable_encoder(adapter.validate_python(meals, from_attributes=True))).encode()
+
+    async def fast_path():
+        async with SessionLocal() as session:
+            rows = (await session.execute(meal_read_query().where(Meal.user_id == 1))).all()
+        return encode_meals(rows)
+
+    # Les deux chemins doivent produire le même JSON
+    assert json.loads(await orm_path()) == json.loads(await fast_path()), "Sorties différentes"
+
+    results = {}
+    for name, fn in (("orm + MealRead", orm_path), ("colonnes + orjson", fast_path)):
+        timings = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            await fn()
+            timings.append(time.perf_counter() - t0)
+        results[name] = statistics.median(timings) * 1000
+        print(f"{name:20} médiane {results[name]:8.2f} ms ({args.meals} repas)")
+
+    slow, fast = results.values()
+    print(f"Accélération : x{slow / fast:.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
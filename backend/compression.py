@@ -0,0 +1,127 @@
+"""
+Compression HTTP : négociation d'Accept-Encoding (brotli, gzip) et middleware
+qui compresse les réponses de l'API au-delà d'une taille minimale.
+
+Seules les réponses émises en un bloc sont compressées : les flux (export,
+NDJSON, SSE) passent tels quels pour ne pas retarder leurs premiers octets, et
+une réponse portant déjà un Content-Encoding (fichiers précompressés, export
+gzip) n'est pas touchée. brotli est facultatif : sans le paquet, gzip seul.
+"""
+import gzip
+import os
+from typing import Dict, Iterable, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Taille minimale d'une réponse de l'API à compresser (octets)
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Niveaux rapides pour les réponses dynamiques (les fichiers statiques sont compressés au maximum une fois)
+API_LEVELS = {"br": 4, "gzip": 5}
+MAX_LEVELS = {"br": 11, "gzip": 9}
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/x-ndjson",
+    "application/xml", "image/svg+xml", "application/manifest+json", "application/wasm",
+)
+
+
+def brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def available_encodings() -> Sequence[str]:
+    """Encodages produits par ce serveur, par ordre de préférence"""
+    return ("br", "gzip") if brotli_available() else ("gzip",)
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        import brotli
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def negotiate(accept_encoding: Optional[str], encodings: Iterable[str]) -> Optional[str]:
+    """Meilleur encodage accepté par le client (q le plus haut, puis ordre de préférence) ; None = identité"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Middleware ASGI pur : compresse les réponses non diffusées en flux d'au moins `minimum_size` octets"""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if state["passthrough"]:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Retenu jusqu'au premier bloc : on ne sait qu'alors si la réponse est compressible
+                state["start"] = message
+                return
+            start, body = state["start"], message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            state["passthrough"] = True
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not compressible(headers.get("content-type"))
+            ):
+                await send(start)
+                await send(message)
+                return
+            compressed = compress(body, encoding, API_LEVELS[encoding])
+            headers.add_vary_header("Accept-Encoding")
+            if len(compressed) < len(body):
+                body = compressed
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                # Même ETag pour toutes les représentations : il devient faible
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["etag"] = "W/" + etag
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
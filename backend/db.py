@@ -1,12 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import create_engine
+from metrics import TimedAsyncQueuePool
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 SYNC_DATABASE_URL = DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+# Journalisation de chaque requête SQL (coûteuse, à réserver au débogage)
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-sync_engine = create_engine(SYNC_DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, poolclass=TimedAsyncQueuePool)
+sync_engine = create_engine(SYNC_DATABASE_URL, echo=SQL_ECHO)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
-Base = declarative_base() 
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,281 @@
+"""
+Estimation des calories et macros d'un repas décrit en texte libre (Ollama).
+
+Le modèle tourne sur le Raspberry Pi et répond en plusieurs secondes, alors que
+les utilisateurs décrivent souvent les mêmes repas. Les réponses sont donc mises
+en cache, indexées par la description normalisée (minuscules, sans accents,
+quantités converties, mots triés) et par le modèle :
+- un cache LRU en mémoire (quelques microsecondes) ;
+- la table estimate_cache (partagée entre processus, conservée au redémarrage).
+Les demandes absentes des deux passent par l'ordonnanceur (scheduler.py), qui
+limite les générations simultanées, fusionne les doublons et groupe les
+descriptions courtes.
+
+Tout serveur compatible avec l'API /api/generate d'Ollama convient, y compris
+le bouchon ollama_stub.py pour les tests (OLLAMA_URL=http://localhost:11435).
+"""
+import os
+import re
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from db import SessionLocal, engine
+from metrics import ESTIMATE_CACHE
+from models import EstimateCache
+from normalize import fold_text
+from rollup import dialect_insert
+from scheduler import GenerationJob, GenerationScheduler
+from schemas import MealEstimate
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+ESTIMATE_CACHE_SIZE = int(os.getenv("ESTIMATE_CACHE_SIZE", "1000"))
+
+PROMPT = """Tu es un nutritionniste. Estime les valeurs nutritionnelles du repas suivant.
+Réponds uniquement avec un objet JSON de la forme :
+{{"name": "nom court du repas", "calories": kcal, "proteins": g, "carbohydrates": g, "fats": g, "fiber": g}}
+
+Repas : {description}"""
+
+BATCH_PROMPT = """Tu es un nutritionniste. Estime les valeurs nutritionnelles de chacun des {count} repas suivants.
+Réponds uniquement avec un objet JSON de la forme :
+{{"meals": [{{"name": "nom court du repas", "calories": kcal, "proteins": g, "carbohydrates": g, "fats": g, "fiber": g}}, ...]}}
+avec exactement un élément par repas, dans le même ordre.
+
+Repas :
+{descriptions}"""
+
+
+class EstimationError(Exception):
+    """Réponse du modèle inexploitable"""
+
+
+class EstimationUnavailable(Exception):
+    """Modèle injoignable ou trop lent"""
+
+
+STOP_WORDS = {"a", "au", "aux", "avec", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les", "sur"}
+NUMBER_WORDS = {"un": 1, "une": 1, "deux": 2, "trois": 3, "quatre": 4, "cinq": 5, "six": 6, "demi": 0.5}
+# Unité -> (unité de référence, facteur)
+UNITS = {
+    "g": ("g", 1), "gr": ("g", 1), "gramme": ("g", 1), "grammes": ("g", 1), "kg": ("g", 1000),
+    "ml": ("ml", 1), "cl": ("ml", 10), "dl": ("ml", 100), "l": ("ml", 1000),
+    "litre": ("ml", 1000), "litres": ("ml", 1000),
+}
+_TOKEN = re.compile(r"\d+(?:\.\d+)?|[a-z]+")
+
+
+def singular(word: str) -> str:
+    if len(word) > 3 and word[-1] in "sx" and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_description(description: str) -> str:
+    """
+    Clé de cache d'une description : « 2 Œufs, café au lait » et
+    « café lait deux oeufs » donnent toutes deux « cafe lait oeuf@2 ».
+    Une quantité (200 g, 2, deux, 0,5 l) s'attache au mot qui la suit, ou au
+    précédent en fin de description ; une quantité de 1 est implicite.
+    """
+    tokens: List[str] = []
+    pending: Optional[str] = None
+    raw = _TOKEN.findall(fold_text(description))
+    index = 0
+    while index < len(raw):
+        token = raw[index]
+        index += 1
+        value = float(token) if token[0].isdigit() else NUMBER_WORDS.get(token)
+        if value is not None:
+            unit = ""
+            if index < len(raw) and raw[index] in UNITS:
+                unit, factor = UNITS[raw[index]]
+                value *= factor
+                index += 1
+            pending = None if (value == 1 and not unit) else f"{value:g}{unit}"
+            continue
+        if token in STOP_WORDS:
+            continue
+        word = singular(token)
+        if pending:
+            word, pending = f"{word}@{pending}", None
+        tokens.append(word)
+    if pending and tokens:
+        tokens[-1] = f"{tokens[-1]}@{pending}"
+    return " ".join(sorted(tokens))
+
+
+class EstimateLRU:
+    """Cache LRU borné (modèle, clé normalisée) -> estimation"""
+
+    def __init__(self, max_size: int = ESTIMATE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+
+    def get(self, model: str, key: str) -> Optional[Dict]:
+        entry = self._entries.get((model, key))
+        if entry is not None:
+            self._entries.move_to_end((model, key))
+        return entry
+
+    def set(self, model: str, key: str, estimate: Dict):
+        if self.max_size <= 0:
+            return
+        self._entries[(model, key)] = estimate
+        self._entries.move_to_end((model, key))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class OllamaBackend:
+    """Client de l'API /api/generate d'Ollama (réponse JSON, température nulle)"""
+
+    def __init__(self, url: str = OLLAMA_URL, model: str = OLLAMA_MODEL, timeout: float = OLLAMA_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Jetons de la réponse, au fil de la génération"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.url, timeout=self.timeout)
+        try:
+            async with self._client.stream("POST", "/api/generate", json={
+                "model": self.model,
+                "prompt": prompt,
+                "format": "json",
+                "stream": True,
+                # Même entrée, même sortie : condition pour que le cache soit juste
+                "options": {"temperature": 0},
+            }) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    if not isinstance(chunk, dict):
+                        raise EstimationError(f"Réponse d'Ollama illisible : {line[:80]!r}")
+                    if chunk.get("error"):
+                        raise EstimationUnavailable(f"Ollama ({self.url}) : {chunk['error']}")
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+        except httpx.HTTPError as e:
+            raise EstimationUnavailable(f"Ollama ({self.url}) : {e}") from e
+        except (orjson.JSONDecodeError, KeyError) as e:
+            # Ligne NDJSON tronquée ou inattendue : réponse du modèle inexploitable
+            raise EstimationError(f"Réponse d'Ollama illisible : {e}") from e
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def render_prompt(descriptions: List[str]) -> str:
+    """Prompt simple, ou prompt groupé numéroté pour plusieurs descriptions courtes"""
+    descriptions = [" ".join(description.split()) for description in descriptions]
+    if len(descriptions) == 1:
+        return PROMPT.format(description=descriptions[0])
+    listing = "\n".join(f"{i}. {description}" for i, description in enumerate(descriptions, 1))
+    return BATCH_PROMPT.format(count=len(descriptions), descriptions=listing)
+
+
+def parse_estimates(answer: str, count: int) -> List[Dict]:
+    """Valide la réponse du modèle (objet JSON, éventuellement entouré de texte)"""
+    match = re.search(r"\{.*\}", answer, re.DOTALL)
+    if not match:
+        raise EstimationError("Le modèle n'a pas renvoyé de JSON")
+    try:
+        data = orjson.loads(match.group(0))
+        if count == 1:
+            return [MealEstimate.model_validate(data).model_dump()]
+        meals = data.get("meals") if isinstance(data, dict) else None
+        if not isinstance(meals, list) or len(meals) != count:
+            raise EstimationError(f"Réponse groupée incomplète ({count} repas attendus)")
+        return [MealEstimate.model_validate(meal).model_dump() for meal in meals]
+    except (orjson.JSONDecodeError, ValidationError) as e:
+        raise EstimationError(f"Réponse du modèle invalide : {e}") from e
+
+
+class MealEstimator:
+    """Cache mémoire -> table estimate_cache -> modèle, via l'ordonnanceur"""
+
+    def __init__(self, backend=None, memory: Optional[EstimateLRU] = None):
+        # backend : tout objet exposant `model` et `async stream(prompt)` (itérateur de jetons)
+        self.backend = backend or OllamaBackend()
+        self.memory = memory if memory is not None else EstimateLRU()
+        self.scheduler = GenerationScheduler(self.backend, render_prompt, parse_estimates, self._remember)
+
+    async def submit(self, description: str) -> GenerationJob:
+        """
+        Demande d'estimation ; déjà terminée si la description est en cache.
+        Lève ValueError (description vide) ou QueueFull.
+        """
+        key = normalize_description(description)
+        if not key:
+            raise ValueError("Description vide")
+        model = self.backend.model
+
+        estimate = self.memory.get(model, key)
+        if estimate is not None:
+            ESTIMATE_CACHE.labels("memory").inc()
+            return GenerationJob.completed(key, description, estimate, "memory")
+
+        estimate = await self._load(model, key)
+        if estimate is not None:
+            ESTIMATE_CACHE.labels("database").inc()
+            self.memory.set(model, key, estimate)
+            return GenerationJob.completed(key, description, estimate, "database")
+
+        ESTIMATE_CACHE.labels("miss").inc()
+        return self.scheduler.submit(key, description)
+
+    async def estimate(self, description: str) -> Tuple[Dict, str]:
+        """Retourne (estimation, source) ; source vaut memory, database ou model"""
+        job = await self.submit(description)
+        return await job.wait(), job.source
+
+    async def _remember(self, job: GenerationJob, estimate: Dict):
+        await self._store(self.backend.model, job.key, job.text, estimate)
+        self.memory.set(self.backend.model, job.key, estimate)
+
+    async def _load(self, model: str, key: str) -> Optional[Dict]:
+        async with SessionLocal() as session:
+            result = await session.scalar(
+                select(EstimateCache.result).where(EstimateCache.model == model, EstimateCache.key == key)
+            )
+        return orjson.loads(result) if result else None
+
+    async def _store(self, model: str, key: str, description: str, estimate: Dict):
+        insert = dialect_insert(engine.dialect.name)
+        async with SessionLocal() as session:
+            await session.execute(
+                insert(EstimateCache)
+                .values(model=model, key=key, description=description, result=orjson.dumps(estimate).decode())
+                .on_conflict_do_nothing(index_elements=[EstimateCache.model, EstimateCache.key])
+            )
+            await session.commit()
+
+    async def aclose(self):
+        await self.scheduler.aclose()
+        close = getattr(self.backend, "aclose", None)
+        if close is not None:
+            await close()
+
+
+estimator = MealEstimator()
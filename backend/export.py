@@ -0,0 +1,219 @@
+"""
+Export des repas en flux (CSV, JSON Lines, Parquet) à mémoire constante
+"""
+import csv
+import io
+import zlib
+from collections import deque
+from datetime import date, timedelta
+from operator import attrgetter
+from typing import AsyncIterator, Optional
+
+import orjson
+from sqlalchemy import select
+
+from db import SessionLocal
+from models import Meal
+
+# Colonnes de la table meal : l'export complet (db/backup_db.sh) se restaure tel
+# quel avec \copy, état de synchronisation compris ; /meals/batch ignore les
+# colonnes qu'il ne connaît pas
+EXPORT_COLUMNS = (
+    "id", "user_id", "name", "description", "calories", "proteins",
+    "carbohydrates", "fats", "fiber", "meal_type", "date", "updated_at", "change_seq",
+)
+EXPORT_FORMATS = {
+    # format: (type MIME, extension)
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# Lignes lues par aller-retour du curseur côté serveur
+EXPORT_CHUNK_SIZE = 2000
+# Ordre des exports et de la liste des repas : base et archive fusionnées sur cette clé
+MEAL_ORDER = attrgetter("date", "id")
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_query(user_id: Optional[int], start: Optional[date], end: Optional[date]):
+    """Repas d'un utilisateur (ou de tous si user_id est None), bornés en date, triés par (date, id)"""
+    table = Meal.__table__
+    query = select(*(table.c[name] for name in EXPORT_COLUMNS)).order_by(table.c.date, table.c.id)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    if start:
+        query = query.where(table.c.date >= start)
+    if end:
+        query = query.where(table.c.date < end + timedelta(days=1))
+    return query
+
+
+async def iter_partitions(query, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[list]:
+    """Lit le résultat par blocs de chunk_size lignes via un curseur côté serveur"""
+    async with SessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def csv_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # En-tête seul si aucun repas
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def jsonl_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    async for rows in partitions:
+        yield b"".join(orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+class _DrainableSink(io.RawIOBase):
+    """Fichier en écriture seule vidé après chaque bloc ; tell() reste la position absolue exigée par Parquet"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_schema():
+    """Schéma Arrow des colonnes d'export (aussi celui de l'archive, voir archive.py)"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("name", pa.string()),
+        ("description", pa.string()), ("calories", pa.float64()), ("proteins", pa.float64()),
+        ("carbohydrates", pa.float64()), ("fats", pa.float64()), ("fiber", pa.float64()),
+        ("meal_type", pa.string()), ("date", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")), ("change_seq", pa.int64()),
+    ])
+
+
+async def parquet_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """Un row group par bloc lu, compressé en zstd par Parquet lui-même"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    async for rows in partitions:
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays([list(col) for col in columns], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compression gzip à la volée, bloc par bloc"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def _next_rows(source: AsyncIterator[list], pending: deque) -> bool:
+    """Remplit `pending` avec le bloc suivant non vide ; False quand le flux est épuisé"""
+    async for rows in source:
+        if rows:
+            pending.extend(rows)
+            return True
+    return False
+
+
+async def merge_partitions(
+    first: AsyncIterator[list],
+    second: AsyncIterator[list],
+    key=MEAL_ORDER,
+    reverse: bool = False,
+    limit: Optional[int] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[list]:
+    """
+    Fusionne deux flux de blocs triés selon `key` (décroissant si reverse) : seul
+    le bloc courant de chaque flux est en mémoire, les premières lignes partent
+    avant la lecture des suivantes. S'arrête après `limit` lignes.
+    """
+    sources = (first.__aiter__(), second.__aiter__())
+    pending = (deque(), deque())
+    live = [True, True]
+    merged = []
+    remaining = limit
+    try:
+        while remaining is None or remaining > 0:
+            for side in (0, 1):
+                if live[side] and not pending[side]:
+                    live[side] = await _next_rows(sources[side], pending[side])
+            if not pending[0] and not pending[1]:
+                break
+            if not pending[1] or not pending[0]:
+                # Un seul flux restant : son bloc passe tel quel
+                rows = list(pending[0] or pending[1])
+                (pending[0] or pending[1]).clear()
+                merged.extend(rows if remaining is None else rows[:remaining - len(merged)])
+            else:
+                head, other = key(pending[0][0]), key(pending[1][0])
+                side = 0 if (head >= other if reverse else head <= other) else 1
+                merged.append(pending[side].popleft())
+            if len(merged) >= chunk_size or (remaining is not None and len(merged) >= remaining):
+                if remaining is not None:
+                    remaining -= len(merged)
+                yield merged
+                merged = []
+        if merged:
+            yield merged
+    finally:
+        for source in sources:
+            await source.aclose()
+
+
+def export_stream(query, fmt: str, gzip: bool, archived: Optional[AsyncIterator[list]] = None) -> AsyncIterator[bytes]:
+    """`archived` : blocs lus dans l'archive (archive.py), fusionnés à ceux de la base par (date, id)"""
+    encoders = {"csv": csv_chunks, "jsonl": jsonl_chunks, "parquet": parquet_chunks}
+    partitions = iter_partitions(query)
+    if archived is not None:
+        partitions = merge_partitions(partitions, archived)
+    chunks = encoders[fmt](partitions)
+    # Parquet est déjà compressé
+    if gzip and fmt != "parquet":
+        chunks = gzip_chunks(chunks)
+    return chunks
+
+
+def export_filename(fmt: str, gzip: bool, suffix: str = "") -> str:
+    extension = EXPORT_FORMATS[fmt][1]
+    name = f"calorietrack{suffix}.{extension}"
+    return name + ".gz" if gzip and fmt != "parquet" else name
@@ -0,0 +1,178 @@
+"""
+Aliments fréquents : pour chaque utilisateur, les noms de repas déjà saisis
+(normalisés par food_key), leur nombre d'occurrences et le cumul de leurs macros.
+
+Comme daily_totals (rollup.py), la table frequent_foods est maintenue par deltas
+dans la même transaction que chaque écriture de repas : /meals/frequent lit
+quelques lignes par utilisateur au lieu d'agréger tout son historique.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import case, delete, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import FrequentFood, Meal
+from normalize import words
+from rollup import dialect_insert
+from stats import MACROS
+
+KEY_LENGTH = 255
+REBUILD_BATCH_SIZE = 5000
+
+
+def food_key(name: Optional[str]) -> str:
+    """« Café au Lait ! » et « cafe au lait » désignent le même aliment"""
+    return " ".join(words(name))[:KEY_LENGTH]
+
+
+def food_contribution(values: Mapping) -> Dict:
+    """Clé, nom, type, date et macros d'un repas (objet Meal ou dict de colonnes)"""
+    get = values.get if isinstance(values, Mapping) else lambda key: getattr(values, key)
+    return {
+        "key": food_key(get("name")),
+        "name": get("name"),
+        "meal_type": get("meal_type"),
+        "date": get("date"),
+        **{macro: float(get(macro) or 0) for macro in MACROS},
+    }
+
+
+def _accumulate(total: Optional[Dict], contribution: Dict) -> Dict:
+    """Ajoute un repas à un cumul ; le nom et le type retenus sont ceux du repas le plus récent"""
+    if total is None:
+        return {**contribution, "count": 1}
+    total["count"] += 1
+    for macro in MACROS:
+        total[macro] += contribution[macro]
+    if contribution["date"] >= total["date"]:
+        total.update(name=contribution["name"], meal_type=contribution["meal_type"], date=contribution["date"])
+    return total
+
+
+async def _apply_delta(session: AsyncSession, user_id: int, food: Dict, sign: int, count: int):
+    insert = dialect_insert(session.bind.dialect.name)
+    stmt = insert(FrequentFood).values(
+        user_id=user_id,
+        key=food["key"],
+        name=food["name"],
+        meal_type=food["meal_type"],
+        last_used=food["date"],
+        meal_count=sign * count,
+        **{macro: sign * food[macro] for macro in MACROS},
+    )
+    set_ = {
+        "meal_count": FrequentFood.meal_count + stmt.excluded.meal_count,
+        **{macro: getattr(FrequentFood, macro) + getattr(stmt.excluded, macro) for macro in MACROS},
+    }
+    if sign > 0:
+        newer = stmt.excluded.last_used >= FrequentFood.last_used
+        set_.update(
+            name=case((newer, stmt.excluded.name), else_=FrequentFood.name),
+            meal_type=case((newer, stmt.excluded.meal_type), else_=FrequentFood.meal_type),
+            last_used=case((newer, stmt.excluded.last_used), else_=FrequentFood.last_used),
+        )
+    await session.execute(stmt.on_conflict_do_update(index_elements=[FrequentFood.user_id, FrequentFood.key], set_=set_))
+    if sign < 0:
+        await session.execute(
+            delete(FrequentFood).where(
+                FrequentFood.user_id == user_id, FrequentFood.key == food["key"], FrequentFood.meal_count <= 0
+            )
+        )
+
+
+async def _record_foods(session: AsyncSession, user_id: int, meals: Iterable, sign: int):
+    foods: Dict[str, Dict] = {}
+    for meal in meals:
+        contribution = food_contribution(meal)
+        if contribution["key"]:
+            foods[contribution["key"]] = _accumulate(foods.get(contribution["key"]), contribution)
+    for food in foods.values():
+        await _apply_delta(session, user_id, food, sign, food["count"])
+
+
+async def record_foods_added(session: AsyncSession, user_id: int, meals: Iterable):
+    """Ajoute des repas aux aliments fréquents (un upsert par aliment distinct)"""
+    await _record_foods(session, user_id, meals, 1)
+
+
+async def record_foods_removed(session: AsyncSession, user_id: int, meals: Iterable):
+    await _record_foods(session, user_id, meals, -1)
+
+
+async def record_food_added(session: AsyncSession, user_id: int, meal):
+    await record_foods_added(session, user_id, [meal])
+
+
+async def record_food_removed(session: AsyncSession, user_id: int, meal):
+    contribution = food_contribution(meal)
+    if contribution["key"]:
+        await _apply_delta(session, user_id, contribution, -1, 1)
+
+
+async def record_food_changed(session: AsyncSession, user_id: int, before: Dict, after):
+    """`before` est le résultat de food_contribution capturé avant la modification"""
+    old, new = before, food_contribution(after)
+    if old == new:
+        return
+    if old["key"] and old["key"] == new["key"]:
+        diff = {**new, **{macro: new[macro] - old[macro] for macro in MACROS}}
+        await _apply_delta(session, user_id, diff, 1, 0)
+        return
+    if old["key"]:
+        await _apply_delta(session, user_id, old, -1, 1)
+    if new["key"]:
+        await _apply_delta(session, user_id, new, 1, 1)
+
+
+def rebuild_frequent_foods(conn: Connection, user_id: Optional[int] = None) -> int:
+    """
+    Recalcule frequent_foods depuis meal (tous les utilisateurs ou un seul) ;
+    retourne le nombre d'aliments. La clé étant normalisée en Python (accents),
+    les repas sont parcourus par lots plutôt qu'agrégés en SQL.
+    """
+    cleanup = delete(FrequentFood)
+    query = select(Meal.user_id, Meal.name, Meal.meal_type, Meal.date, *(getattr(Meal, m) for m in MACROS))
+    if user_id is not None:
+        cleanup = cleanup.where(FrequentFood.user_id == user_id)
+        query = query.where(Meal.user_id == user_id)
+    conn.execute(cleanup)
+
+    foods: Dict[tuple, Dict] = {}
+    for row in conn.execute(query.execution_options(yield_per=REBUILD_BATCH_SIZE)):
+        contribution = food_contribution(row._mapping)
+        if contribution["key"]:
+            key = (row.user_id, contribution["key"])
+            foods[key] = _accumulate(foods.get(key), contribution)
+
+    rows: List[Dict] = [
+        {
+            "user_id": owner, "key": key, "name": food["name"], "meal_type": food["meal_type"],
+            "meal_count": food["count"], "last_used": food["date"],
+            **{macro: food[macro] for macro in MACROS},
+        }
+        for (owner, key), food in foods.items()
+    ]
+    for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+        conn.execute(FrequentFood.__table__.insert(), rows[start:start + REBUILD_BATCH_SIZE])
+    return len(rows)
+
+
+def frequent_foods_query(user_id: int, limit: int, prefix: Optional[str] = None):
+    query = select(FrequentFood).where(FrequentFood.user_id == user_id)
+    if prefix:
+        query = query.where(FrequentFood.key.startswith(food_key(prefix), autoescape=True))
+    return query.order_by(FrequentFood.meal_count.desc(), FrequentFood.last_used.desc()).limit(limit)
+
+
+def frequent_food_payload(food: FrequentFood) -> Dict:
+    """Aliment fréquent et ses macros typiques (moyenne par repas)"""
+    count = max(food.meal_count, 1)
+    return {
+        "name": food.name,
+        "meal_type": food.meal_type,
+        "count": food.meal_count,
+        "last_used": food.last_used.isoformat() if isinstance(food.last_used, datetime) else food.last_used,
+        **{macro: round(getattr(food, macro) / count, 1) for macro in MACROS},
+    }
@@ -0,0 +1,70 @@
+"""
+Import de repas en masse (tableau JSON ou CSV au format de db/backup_db.sh)
+"""
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from schemas import MealCreate
+
+# Colonnes acceptées ; id et user_id du CSV exporté sont ignorés (le repas
+# est rattaché à l'utilisateur qui importe)
+MEAL_FIELDS = tuple(MealCreate.model_fields)
+
+_meal_list_adapter = TypeAdapter(List[MealCreate])
+
+
+def to_naive_utc(value: Optional[datetime]) -> datetime:
+    """Date UTC sans fuseau telle que stockée en base (maintenant par défaut)"""
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_csv_rows(content: str) -> List[Dict[str, Any]]:
+    """Lit un CSV avec en-tête ; les cellules vides prennent la valeur par défaut du schéma"""
+    reader = csv.DictReader(io.StringIO(content))
+    return [
+        {field: record[field] for field in MEAL_FIELDS if record.get(field) not in ("", None)}
+        for record in reader
+    ]
+
+
+def validate_meals(rows: List[Any]) -> Tuple[List[Tuple[int, MealCreate]], List[Dict[str, Any]]]:
+    """
+    Valide toutes les lignes en un seul passage pydantic.
+
+    En cas d'erreur, les index fautifs sont extraits de la ValidationError puis
+    les lignes restantes sont revalidées d'un bloc : une ligne invalide n'empêche
+    pas l'import des autres.
+    """
+    try:
+        meals = _meal_list_adapter.validate_python(rows)
+        return list(enumerate(meals)), []
+    except ValidationError as e:
+        errors_by_row: Dict[int, List[str]] = {}
+        for error in e.errors():
+            index = error["loc"][0]
+            field = ".".join(str(part) for part in error["loc"][1:]) or "ligne"
+            errors_by_row.setdefault(index, []).append(f"{field}: {error['msg']}")
+
+    valid_indexes = [i for i in range(len(rows)) if i not in errors_by_row]
+    meals = _meal_list_adapter.validate_python([rows[i] for i in valid_indexes])
+    errors = [{"row": i, "errors": msgs} for i, msgs in sorted(errors_by_row.items())]
+    return list(zip(valid_indexes, meals)), errors
+
+
+def meal_insert_rows(user_id: int, meals: List[MealCreate]) -> List[Dict[str, Any]]:
+    """Paramètres d'un INSERT multi-lignes sur la table meal"""
+    rows = []
+    for meal in meals:
+        values = meal.model_dump()
+        values["user_id"] = user_id
+        values["date"] = to_naive_utc(meal.date)
+        rows.append(values)
+    return rows
@@ -0,0 +1,199 @@
+"""
+Bus d'invalidation entre processus (plusieurs workers uvicorn).
+
+Les caches locaux à un processus (utilisateurs authentifiés, index de recherche)
+doivent oublier les données d'un utilisateur quand un autre worker les modifie.
+Chaque écriture publie un événement (type, user_id) :
+- Postgres : NOTIFY sur le canal calorietrack_invalidation, émis dans la
+  transaction de l'écriture (donc livré seulement si elle est validée) ; chaque
+  processus écoute avec une connexion asyncpg dédiée, reconnectée si besoin ;
+- en mémoire : les bus d'un même MemoryHub se livrent les événements à la
+  validation de la session (tests, SQLite, un seul processus).
+Un processus ne reçoit pas ses propres événements : l'appelant met son état
+local à jour lui-même. Après une coupure de l'écoute, des événements ont pu être
+perdus : les abonnés « reset » vident alors tous les caches.
+"""
+import asyncio
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import engine
+from metrics import INVALIDATION_EVENTS, INVALIDATION_RESETS
+
+CHANNEL = "calorietrack_invalidation"
+# memory ou postgres ; par défaut selon la base configurée
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "postgres" if engine.dialect.name == "postgresql" else "memory")
+# Vérification périodique de la connexion d'écoute (secondes)
+LISTEN_KEEPALIVE = 30.0
+RECONNECT_DELAY = 2.0
+
+# Types d'événements : données d'un utilisateur (compte) ou de ses repas
+USER_CHANGED = "user"
+MEALS_CHANGED = "meals"
+# Nouveaux mois dans l'archive (user_id sans objet : 0), voir archive.py
+ARCHIVE_CHANGED = "archive"
+
+
+class InvalidationBus(ABC):
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Callable[[int], None]]] = defaultdict(list)
+        self._reset_handlers: List[Callable[[], None]] = []
+
+    def subscribe(self, kind: str, handler: Callable[[int], None]):
+        """handler(user_id) est appelé pour chaque événement `kind` venu d'un autre processus"""
+        self._handlers[kind].append(handler)
+
+    def on_reset(self, handler: Callable[[], None]):
+        self._reset_handlers.append(handler)
+
+    @abstractmethod
+    async def publish(self, kind: str, user_id: int, session: Optional[AsyncSession] = None):
+        """
+        Publie un événement. Avec `session`, il part avec la transaction en cours
+        (abandonné si elle est annulée) ; sinon immédiatement.
+        """
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def deliver(self, message: Dict):
+        if message.get("origin") == self.origin:
+            return
+        INVALIDATION_EVENTS.labels(message["kind"], "received").inc()
+        for handler in self._handlers.get(message["kind"], []):
+            try:
+                handler(message["user_id"])
+            except Exception as e:
+                print(f"⚠️ Invalidation {message['kind']} ({message['user_id']}) : {e}")
+
+    def reset(self):
+        INVALIDATION_RESETS.inc()
+        for handler in self._reset_handlers:
+            handler()
+
+    def _message(self, kind: str, user_id: int) -> Dict:
+        INVALIDATION_EVENTS.labels(kind, "sent").inc()
+        return {"kind": kind, "user_id": user_id, "origin": self.origin}
+
+
+class MemoryHub:
+    """Ensemble de bus en mémoire qui se livrent leurs événements (un bus = un processus simulé)"""
+
+    def __init__(self):
+        self.buses: List["MemoryBus"] = []
+
+    def broadcast(self, messages: List[Dict]):
+        for bus in list(self.buses):
+            for message in messages:
+                bus.deliver(message)
+
+
+class MemoryBus(InvalidationBus):
+    def __init__(self, hub: Optional[MemoryHub] = None):
+        super().__init__()
+        self.hub = hub or MemoryHub()
+        self.hub.buses.append(self)
+
+    async def publish(self, kind: str, user_id: int, session: Optional[AsyncSession] = None):
+        message = self._message(kind, user_id)
+        if session is None:
+            self.hub.broadcast([message])
+            return
+        pending = session.info.get("invalidation_pending")
+        if pending is None:
+            pending = session.info["invalidation_pending"] = []
+            sync_session = session.sync_session
+
+            def after_commit(_):
+                self.hub.broadcast(session.info.pop("invalidation_pending", []))
+                event.remove(sync_session, "after_rollback", after_rollback)
+
+            def after_rollback(_):
+                session.info.pop("invalidation_pending", None)
+                event.remove(sync_session, "after_commit", after_commit)
+
+            event.listen(sync_session, "after_commit", after_commit, once=True)
+            event.listen(sync_session, "after_rollback", after_rollback, once=True)
+        pending.append(message)
+
+
+class PostgresBus(InvalidationBus):
+    def __init__(self, dsn: str):
+        super().__init__()
+        self.dsn = dsn
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, kind: str, user_id: int, session: Optional[AsyncSession] = None):
+        statement = text("SELECT pg_notify(:channel, :payload)")
+        params = {"channel": CHANNEL, "payload": json.dumps(self._message(kind, user_id))}
+        if session is not None:
+            await session.execute(statement, params)
+            return
+        async with engine.begin() as conn:
+            await conn.execute(statement, params)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.deliver(json.loads(payload))
+        except (ValueError, KeyError) as e:
+            print(f"⚠️ Événement d'invalidation illisible : {e}")
+
+    async def _listen(self):
+        import asyncpg
+
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(CHANNEL, self._on_notify)
+                if connected_before:
+                    # Événements manqués pendant la coupure : on repart de caches vides
+                    self.reset()
+                connected_before = True
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), LISTEN_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        await connection.fetchval("SELECT 1", timeout=5)
+            except asyncio.CancelledError:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+                raise
+            except Exception as e:
+                print(f"⚠️ Écoute des invalidations interrompue : {e}")
+            if connection is not None and not connection.is_closed():
+                connection.terminate()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+def create_bus() -> InvalidationBus:
+    if INVALIDATION_BUS == "postgres":
+        return PostgresBus(engine.url.set(drivername="postgresql").render_as_string(hide_password=False))
+    return MemoryBus()
+
+
+invalidation_bus = create_bus()
@@ -1,32 +1,106 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text, select
-from db import SessionLocal, engine, sync_engine, Base
+from sqlalchemy import text, select, insert
+from db import SessionLocal, engine
 # Importer les modèles APRÈS Base pour qu'ils soient enregistrés
-from models import User, Meal
+from models import User, Meal, DailyTotal
 from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import AuthenticationBackend, JWTStrategy, BearerTransport
 from fastapi_users.db import SQLAlchemyUserDatabase
 from user_manager import UserManager
-from schemas import UserRead, UserCreate, UserUpdate, MealCreate, MealRead, MealUpdate
+from passwords import password_pool
+from profiling import PROFILING, ProfilingMiddleware, capture_path, instrument_profiling, list_captures
+from auth_cache import user_cache
+from admission import AdmissionMiddleware
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, instrument_engine, instrument_password_pool, instrument_scheduler, instrument_user_cache, render_metrics
+from schemas import UserRead, UserCreate, UserUpdate, MealCreate, MealRead, MealUpdate, MealBulkUpdate, MealEstimateRequest, MealEstimateRead
+from estimation import EstimationError, EstimationUnavailable, estimator
+from scheduler import QueueFull, sse_events
+from export import EXPORT_FORMATS, export_filename, export_query, export_stream, iter_partitions, merge_partitions, parquet_available
+from ingest import parse_csv_rows, validate_meals, meal_insert_rows, to_naive_utc
+from migrations import migrate
+from archive import archive_covers, archive_index, archived_export_partitions, archived_meal_partitions, complete_page, storage_maintenance_loop
+from rollup import meal_contribution, record_meal_added, record_meals_added, record_meal_changed, record_meal_removed, record_meals_removed
+from foods import food_contribution, frequent_food_payload, frequent_foods_query, record_food_added, record_foods_added, record_food_changed, record_food_removed, record_foods_removed
+from search import search_indexes, search_meals
+from invalidation import ARCHIVE_CHANGED, MEALS_CHANGED, USER_CHANGED, invalidation_bus
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, apply_keyset, decode_cursor, encode_cursor
+from serialization import encode_meals, meal_read_query, ndjson_chunks
+from writes import delete_meals, update_meals
+from static_site import StaticSite
+from sync import changes_since, compaction_loop, record_tombstones
+from versions import bump_data_version, cache_headers, check_not_modified
+from stats import MACROS, GRANULARITIES, MAX_BUCKETS, all_time_averages, bucket_count, all_time_query, range_stats_query, range_stats_payload
+import asyncio
+import csv
 import os
+import orjson
+import jwt
 from typing import List, Optional
-from datetime import datetime, date, timedelta, timezone
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from datetime import datetime, date, timedelta
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi_users.authentication.strategy.jwt import JWTStrategy as BaseJWTStrategy
 
 class DebugJWTStrategy(BaseJWTStrategy):
     async def read_token(self, token: str, user_manager):
+        # Jeton déjà vérifié récemment : pas de décodage ni de SELECT sur user
+        if token is not None:
+            cached = user_cache.get(token)
+            if cached is not None:
+                return cached
         try:
-            return await super().read_token(token, user_manager)
+            user = await super().read_token(token, user_manager)
         except Exception as e:
             print(f"[JWT DEBUG] Erreur lors du décodage du token : {e}")
             raise
+        if user is not None:
+            user_cache.set(token, user, token_expiry(token))
+        return user
+
+def token_expiry(token: str) -> Optional[float]:
+    """Claim exp d'un jeton déjà validé par read_token"""
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
 
 app = FastAPI()
 
+# Authentification JWT
+SECRET = os.environ.get("SECRET", "changeme")
+
+# Profilage à la demande (X-Profile) ou par tirage ; rien n'est installé sans PROFILING
+if PROFILING:
+    app.add_middleware(ProfilingMiddleware, engine=engine, secret=SECRET)
+    instrument_profiling(engine)
+
+# Métriques (latence par route, SQL par requête, pool de connexions)
+instrument_engine(engine)
+instrument_user_cache(user_cache)
+instrument_scheduler(estimator.scheduler)
+instrument_password_pool(password_pool)
+
+# Caches locaux au processus, invalidés par les écritures des autres workers
+invalidation_bus.subscribe(USER_CHANGED, user_cache.invalidate_user)
+invalidation_bus.subscribe(USER_CHANGED, search_indexes.invalidate_user)
+invalidation_bus.subscribe(MEALS_CHANGED, search_indexes.invalidate_user)
+invalidation_bus.on_reset(user_cache.clear)
+invalidation_bus.on_reset(search_indexes.clear)
+invalidation_bus.subscribe(ARCHIVE_CHANGED, archive_index.refresh)
+invalidation_bus.on_reset(archive_index.refresh)
+
+# Compression des réponses de l'API (Accept-Encoding : br, gzip)
+app.add_middleware(CompressionMiddleware)
+
+# Limitation de débit et délestage (429 / 503 avant tout accès à la base)
+app.add_middleware(AdmissionMiddleware, engine=engine, secret=SECRET)
+
+# Middleware des métriques ajouté après l'admission, donc autour d'elle : les
+# requêtes refusées (429 / 503) comptent aussi dans le débit et la latence
+app.add_middleware(MetricsMiddleware)
+
 # Configuration CORS
 app.add_middleware(
     CORSMiddleware,
@@ -34,22 +108,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After", "X-Profile-Id"],
 )
 
-# Création de la table User si elle n'existe pas
-def create_db_and_tables():
-    # S'assurer que les modèles sont bien importés et enregistrés
-    import models  # Force l'import des modèles
-    # Créer les tables de manière synchrone
-    Base.metadata.create_all(bind=sync_engine)
-
-async def ensure_tables_exist():
-    """S'assure que les tables existent"""
-    try:
-        create_db_and_tables()
-    except Exception as e:
-        print(f"Erreur lors de la création des tables: {e}")
-
 async def get_user_db():
     async with SessionLocal() as session:
         yield SQLAlchemyUserDatabase(session, User)
@@ -57,9 +118,6 @@ async def get_user_db():
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
 
-# Authentification JWT
-SECRET = os.environ.get("SECRET", "changeme")
-
 def get_jwt_strategy() -> DebugJWTStrategy:
     return DebugJWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
@@ -97,15 +155,9 @@ async def create_meal(
     user: User = Depends(fastapi_users.current_user())
 ):
     """Créer un nouveau repas"""
-    await ensure_tables_exist()
     async with SessionLocal() as session:
         # Conversion UTC naive
-        date_value = meal.date
-        if date_value:
-            if date_value.tzinfo is not None:
-                date_value = date_value.astimezone(timezone.utc).replace(tzinfo=None)
-        else:
-            date_value = datetime.utcnow()
+        date_value = to_naive_utc(meal.date)
         db_meal = Meal(
             user_id=user.id,
             name=meal.name,
@@ -118,31 +170,294 @@ async def create_meal(
             meal_type=meal.meal_type,
             date=date_value
         )
+        db_meal.change_seq = await bump_data_version(session, user.id)
         session.add(db_meal)
+        await record_meal_added(session, user.id, db_meal)
+        await record_food_added(session, user.id, db_meal)
+        await invalidation_bus.publish(MEALS_CHANGED, user.id, session)
         await session.commit()
         await session.refresh(db_meal)
+        search_indexes.meals_added(user.id, [(db_meal.id, db_meal.name, db_meal.description)])
         return db_meal
 
+# Nombre maximal de lignes par import
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "10000"))
+
+@app.post("/meals/batch", tags=["meals"])
+async def create_meals_batch(
+    request: Request,
+    user: User = Depends(fastapi_users.current_user())
+):
+    """
+    Importer des repas en masse.
+
+    Accepte un tableau JSON de repas, un CSV brut (Content-Type: text/csv) ou un
+    fichier CSV envoyé en multipart (champ `file`), au format exporté par
+    db/backup_db.sh. Les lignes valides sont insérées en un seul INSERT
+    multi-lignes dans une transaction ; les lignes invalides sont signalées
+    individuellement sans bloquer l'import.
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Fichier CSV manquant (champ 'file')")
+            rows = parse_csv_rows((await upload.read()).decode("utf-8-sig"))
+        elif content_type.startswith("text/csv"):
+            rows = parse_csv_rows((await request.body()).decode("utf-8-sig"))
+        else:
+            rows = await request.json()
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        raise HTTPException(status_code=400, detail="Contenu illisible : tableau JSON ou CSV UTF-8 attendu")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Un tableau de repas est attendu")
+    if len(rows) > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"Trop de lignes (maximum {MAX_BATCH_ROWS})")
+
+    valid, errors = validate_meals(rows)
+    created = []
+    if valid:
+        rows = meal_insert_rows(user.id, [meal for _, meal in valid])
+        async with SessionLocal() as session:
+            change_seq = await bump_data_version(session, user.id)
+            for row in rows:
+                row["change_seq"] = change_seq
+            result = await session.execute(
+                insert(Meal).returning(Meal.id, sort_by_parameter_order=True),
+                rows,
+            )
+            ids = result.scalars().all()
+            await record_meals_added(session, user.id, rows)
+            await record_foods_added(session, user.id, rows)
+            await invalidation_bus.publish(MEALS_CHANGED, user.id, session)
+            await session.commit()
+        search_indexes.meals_added(user.id, [(meal_id, row["name"], row["description"]) for meal_id, row in zip(ids, rows)])
+        created = [{"row": index, "id": meal_id} for (index, _), meal_id in zip(valid, ids)]
+
+    return {
+        "inserted": len(created),
+        "rejected": len(errors),
+        "created": created,
+        "errors": errors,
+    }
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Lignes lues par aller-retour du curseur serveur en mode streaming
+STREAM_CHUNK_SIZE = 500
+
 @app.get("/meals/", response_model=List[MealRead], tags=["meals"])
 async def get_meals(
+    request: Request,
     user: User = Depends(fastapi_users.current_user()),
-    date_filter: Optional[str] = None
+    date_filter: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
 ):
-    """Récupérer tous les repas de l'utilisateur"""
+    """
+    Récupérer les repas de l'utilisateur, du plus récent au plus ancien.
+
+    Avec `limit` (ou `cursor`), la réponse est paginée et l'en-tête X-Next-Cursor
+    contient le curseur de la page suivante. Avec `Accept: application/x-ndjson`,
+    les repas sont envoyés un par ligne au fil de la lecture. Les lignes sont
+    encodées directement en JSON (voir serialization.py), sans objet ORM ni MealRead.
+    Les mois archivés (voir archive.py) complètent la base de façon transparente.
+    """
+    query = meal_read_query().where(Meal.user_id == user.id)
+
+    start = end = None
+    if date_filter:
+        try:
+            start = datetime.strptime(date_filter, "%Y-%m-%d")
+            end = start + timedelta(days=1)
+            query = query.where(Meal.date >= start).where(Meal.date < end)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez YYYY-MM-DD")
+
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    query = apply_keyset(query, before)
+    if cursor and not limit:
+        limit = DEFAULT_PAGE_SIZE
+
+    etag, not_modified = await check_not_modified(request, user.id)
+    if not_modified:
+        return not_modified
+    headers = cache_headers(etag)
+
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        if limit:
+            query = query.limit(limit)
+        partitions = iter_partitions(query, STREAM_CHUNK_SIZE)
+        if archive_covers(start):
+            # Repas archivés fusionnés au fil de l'envoi (même ordre, même limite)
+            partitions = merge_partitions(
+                partitions,
+                archived_meal_partitions(user.id, start, end, before),
+                reverse=True,
+                limit=limit,
+                chunk_size=STREAM_CHUNK_SIZE,
+            )
+        return StreamingResponse(
+            ndjson_chunks(partitions),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=headers,
+        )
+
     async with SessionLocal() as session:
-        query = select(Meal).where(Meal.user_id == user.id)
-        
-        if date_filter:
-            try:
-                filter_date = datetime.strptime(date_filter, "%Y-%m-%d").date()
-                query = query.where(Meal.date >= filter_date).where(Meal.date < filter_date + timedelta(days=1))
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez YYYY-MM-DD")
-        
-        query = query.order_by(Meal.date.desc())
-        result = await session.execute(query)
-        meals = result.scalars().all()
-        return meals
+        if limit:
+            # Une ligne de plus pour savoir s'il reste une page
+            result = await session.execute(query.limit(limit + 1))
+            rows = result.all()
+        else:
+            result = await session.execute(query)
+            rows = result.all()
+    rows = await complete_page(rows, user.id, limit, start, end, before)
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].date, rows[-1].id)
+    return Response(content=encode_meals(rows), media_type="application/json", headers=headers)
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    """Date YYYY-MM-DD d'un paramètre de requête (None si absent)"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez YYYY-MM-DD")
+
+def export_response(user_id: Optional[int], date_from, date_to, format: str, gzip: bool, suffix: str = ""):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format invalide. Valeurs possibles : {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Export Parquet indisponible : installer pyarrow")
+    start, end = parse_day(date_from), parse_day(date_to)
+    query = export_query(user_id, start, end)
+    gzip = gzip and format != "parquet"
+    filename = export_filename(format, gzip, suffix)
+    archived = None
+    if archive_covers(datetime(start.year, start.month, start.day) if start else None):
+        archived = archived_export_partitions(user_id, start, end)
+    return StreamingResponse(
+        export_stream(query, format, gzip, archived),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/meals/export", tags=["meals"])
+async def export_meals(
+    user: User = Depends(fastapi_users.current_user()),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    format: str = "csv",
+    gzip: bool = True,
+):
+    """Exporter ses repas (csv, jsonl ou parquet), en flux et compressé à la volée"""
+    return export_response(user.id, date_from, date_to, format, gzip)
+
+@app.get("/meals/export/all", tags=["meals"])
+async def export_all_meals(
+    user: User = Depends(fastapi_users.current_user(superuser=True)),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    format: str = "csv",
+    gzip: bool = True,
+):
+    """Exporter les repas de tous les utilisateurs (administrateurs), utilisé par db/backup_db.sh"""
+    return export_response(None, date_from, date_to, format, gzip, suffix="-all")
+
+async def submit_estimation(description: str):
+    try:
+        return await estimator.submit(description)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Description vide")
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Trop d'estimations en attente, réessayez plus tard",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+@app.post("/meals/estimate", response_model=MealEstimateRead, tags=["meals"])
+async def estimate_meal(
+    request: MealEstimateRequest,
+    user: User = Depends(fastapi_users.current_user())
+):
+    """Estimer calories et macros d'une description libre (modèle Ollama, avec cache)"""
+    job = await submit_estimation(request.description)
+    try:
+        estimate = await job.wait()
+    except EstimationUnavailable as e:
+        print(f"⚠️ Estimation impossible : {e}")
+        raise HTTPException(status_code=503, detail="Modèle d'estimation indisponible")
+    except EstimationError as e:
+        print(f"⚠️ Estimation impossible : {e}")
+        raise HTTPException(status_code=502, detail="Réponse du modèle invalide")
+    return {**estimate, "description": request.description, "source": job.source}
+
+@app.post("/meals/estimate/stream", tags=["meals"])
+async def estimate_meal_stream(
+    request: MealEstimateRequest,
+    user: User = Depends(fastapi_users.current_user())
+):
+    """
+    Même estimation en Server-Sent Events : queued (position), started,
+    token (ou progress pour un prompt groupé), puis result ou error
+    """
+    job = await submit_estimation(request.description)
+    return StreamingResponse(
+        sse_events(job),
+        media_type="text/event-stream",
+        # Pas de mise en tampon par nginx : les jetons arrivent au fil de l'eau
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/meals/search", response_model=List[MealRead], tags=["meals"])
+async def search_user_meals(
+    request: Request,
+    user: User = Depends(fastapi_users.current_user()),
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Rechercher ses repas par nom ou description (préfixe et fautes de frappe tolérés)"""
+    etag, not_modified = await check_not_modified(request, user.id)
+    if not_modified:
+        return not_modified
+    rows = await search_meals(user.id, q, limit)
+    return Response(encode_meals(rows), media_type="application/json", headers=cache_headers(etag))
+
+@app.get("/meals/frequent", tags=["meals"])
+async def get_frequent_foods(
+    request: Request,
+    user: User = Depends(fastapi_users.current_user()),
+    prefix: Optional[str] = Query(None, max_length=100),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Aliments les plus saisis et leurs macros typiques (autocomplétion)"""
+    etag, not_modified = await check_not_modified(request, user.id)
+    if not_modified:
+        return not_modified
+    async with SessionLocal() as session:
+        foods = (await session.execute(frequent_foods_query(user.id, limit, prefix))).scalars().all()
+    return Response(
+        orjson.dumps([frequent_food_payload(food) for food in foods]),
+        media_type="application/json",
+        headers=cache_headers(etag),
+    )
+
+@app.get("/meals/changes", tags=["meals"])
+async def get_meal_changes(
+    user: User = Depends(fastapi_users.current_user()),
+    since: int = Query(0, ge=0, description="Version reçue lors de la dernière synchronisation"),
+):
+    """Repas créés, modifiés ou supprimés depuis une version (synchronisation hors ligne)"""
+    async with SessionLocal() as session:
+        changes = await changes_since(session, user.id, since)
+    return Response(orjson.dumps(changes), media_type="application/json", headers={"Cache-Control": "private, no-store"})
 
 @app.get("/meals/{meal_id}", response_model=MealRead, tags=["meals"])
 async def get_meal(
@@ -159,6 +474,46 @@ async def get_meal(
             raise HTTPException(status_code=404, detail="Repas non trouvé")
         return meal
 
+@app.patch("/meals/", tags=["meals"])
+async def bulk_update_meals(
+    payload: MealBulkUpdate,
+    user: User = Depends(fastapi_users.current_user())
+):
+    """Modifier plusieurs repas à la fois (mêmes champs, ou décalage des dates)"""
+    values = payload.changes.dict(exclude_unset=True)
+    if "date" in values:
+        if payload.date_shift_minutes is not None:
+            raise HTTPException(status_code=400, detail="changes.date et date_shift_minutes sont exclusifs")
+        values["date"] = to_naive_utc(values["date"])
+    date_shift = timedelta(minutes=payload.date_shift_minutes) if payload.date_shift_minutes else None
+    if not values and date_shift is None:
+        raise HTTPException(status_code=400, detail="Aucune modification demandée")
+
+    ids = list(dict.fromkeys(payload.ids))
+    async with SessionLocal() as session:
+        values["change_seq"] = await bump_data_version(session, user.id)
+        changes = await update_meals(session, user.id, ids, values, date_shift)
+        if not changes:
+            await session.rollback()
+        else:
+            olds = [old for old, _ in changes]
+            news = [new for _, new in changes]
+            await record_meals_removed(session, user.id, olds)
+            await record_meals_added(session, user.id, news)
+            await record_foods_removed(session, user.id, olds)
+            await record_foods_added(session, user.id, news)
+            await invalidation_bus.publish(MEALS_CHANGED, user.id, session)
+            await session.commit()
+
+    meals = [new for _, new in changes]
+    search_indexes.meals_added(user.id, [(meal["id"], meal["name"], meal["description"]) for meal in meals])
+    updated = {meal["id"] for meal in meals}
+    return {
+        "updated": len(meals),
+        "not_found": [meal_id for meal_id in ids if meal_id not in updated],
+        "meals": [MealRead.model_validate(meal).model_dump(mode="json") for meal in meals],
+    }
+
 @app.put("/meals/{meal_id}", response_model=MealRead, tags=["meals"])
 async def update_meal(
     meal_id: int,
@@ -166,21 +521,31 @@ async def update_meal(
     user: User = Depends(fastapi_users.current_user())
 ):
     """Mettre à jour un repas"""
+    # Mettre à jour les champs fournis
+    update_data = meal_update.dict(exclude_unset=True)
+    if "date" in update_data:
+        update_data["date"] = to_naive_utc(update_data["date"])
     async with SessionLocal() as session:
-        result = await session.execute(
-            select(Meal).where(Meal.id == meal_id, Meal.user_id == user.id)
-        )
-        meal = result.scalar_one_or_none()
-        if not meal:
+        if not update_data:
+            meal = (await session.execute(
+                meal_read_query().where(Meal.id == meal_id, Meal.user_id == user.id)
+            )).first()
+            if not meal:
+                raise HTTPException(status_code=404, detail="Repas non trouvé")
+            return meal._asdict()
+
+        update_data["change_seq"] = await bump_data_version(session, user.id)
+        # Anciennes et nouvelles valeurs en une requête (voir writes.py)
+        changes = await update_meals(session, user.id, [meal_id], update_data)
+        if not changes:
             raise HTTPException(status_code=404, detail="Repas non trouvé")
-        
-        # Mettre à jour les champs fournis
-        update_data = meal_update.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(meal, field, value)
-        
+        old, meal = changes[0]
+
+        await record_meal_changed(session, user.id, meal_contribution(old), meal)
+        await record_food_changed(session, user.id, food_contribution(old), meal)
+        await invalidation_bus.publish(MEALS_CHANGED, user.id, session)
         await session.commit()
-        await session.refresh(meal)
+        search_indexes.meals_added(user.id, [(meal["id"], meal["name"], meal["description"])])
         return meal
 
 @app.delete("/meals/{meal_id}", tags=["meals"])
@@ -190,56 +555,121 @@ async def delete_meal(
 ):
     """Supprimer un repas"""
     async with SessionLocal() as session:
-        result = await session.execute(
-            select(Meal).where(Meal.id == meal_id, Meal.user_id == user.id)
-        )
-        meal = result.scalar_one_or_none()
-        if not meal:
+        change_seq = await bump_data_version(session, user.id)
+        deleted = await delete_meals(session, user.id, [meal_id])
+        if not deleted:
             raise HTTPException(status_code=404, detail="Repas non trouvé")
-        
-        await session.delete(meal)
+
+        await record_meal_removed(session, user.id, deleted[0])
+        await record_food_removed(session, user.id, deleted[0])
+        await record_tombstones(session, user.id, [meal_id], change_seq)
+        await invalidation_bus.publish(MEALS_CHANGED, user.id, session)
         await session.commit()
+        search_indexes.meal_removed(user.id, meal_id)
         return {"message": "Repas supprimé avec succès"}
 
 @app.get("/meals/stats/daily", tags=["meals"])
 async def get_daily_stats(
+    request: Request,
+    response: Response,
     user: User = Depends(fastapi_users.current_user()),
     date_filter: Optional[str] = None
 ):
-    """Récupérer les statistiques quotidiennes"""
+    """Récupérer les statistiques quotidiennes (lecture par clé primaire dans daily_totals)"""
+    day = parse_day(date_filter) or date.today()
+    etag, not_modified = await check_not_modified(request, user.id, day.isoformat())
+    if not_modified:
+        return not_modified
+    response.headers.update(cache_headers(etag))
     async with SessionLocal() as session:
-        query = select(Meal).where(Meal.user_id == user.id)
-        
-        if date_filter:
-            try:
-                filter_date = datetime.strptime(date_filter, "%Y-%m-%d").date()
-                query = query.where(Meal.date >= filter_date).where(Meal.date < filter_date + timedelta(days=1))
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez YYYY-MM-DD")
-        else:
-            # Par défaut, aujourd'hui
-            today = date.today()
-            query = query.where(Meal.date >= today).where(Meal.date < today + timedelta(days=1))
-        
+        totals = await session.get(DailyTotal, (user.id, day))
+
+    return {
+        "date": date_filter or day.isoformat(),
+        "total_calories": totals.calories if totals else 0,
+        "total_proteins": totals.proteins if totals else 0,
+        "total_carbohydrates": totals.carbohydrates if totals else 0,
+        "total_fats": totals.fats if totals else 0,
+        "total_fiber": totals.fiber if totals else 0,
+        "meal_count": totals.meal_count if totals else 0
+    }
+
+@app.get("/meals/stats/range", tags=["meals"])
+async def get_range_stats(
+    request: Request,
+    response: Response,
+    user: User = Depends(fastapi_users.current_user()),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    granularity: str = "day",
+    macros: str = ",".join(MACROS),
+    window: int = Query(7, ge=1, le=366),
+):
+    """Totaux par jour/semaine/mois et moyennes glissantes sur une période"""
+    try:
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else date.today()
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="La date de début doit précéder la date de fin")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Granularité invalide. Valeurs possibles : {', '.join(GRANULARITIES)}")
+    if bucket_count(start, end, granularity) > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Période trop longue : {MAX_BUCKETS} intervalles au plus, choisir une granularité plus large",
+        )
+    selected_macros = [m.strip() for m in macros.split(",") if m.strip()]
+    invalid = [m for m in selected_macros if m not in MACROS]
+    if invalid or not selected_macros:
+        raise HTTPException(status_code=400, detail=f"Macros invalides. Valeurs possibles : {', '.join(MACROS)}")
+
+    etag, not_modified = await check_not_modified(request, user.id, f"{start}|{end}")
+    if not_modified:
+        return not_modified
+    response.headers.update(cache_headers(etag))
+
+    async with SessionLocal() as session:
+        query = range_stats_query(user.id, start, end, granularity, selected_macros, engine.dialect.name)
         result = await session.execute(query)
-        meals = result.scalars().all()
-        
-        # Calculer les totaux
-        total_calories = sum(meal.calories for meal in meals)
-        total_proteins = sum(meal.proteins for meal in meals)
-        total_carbohydrates = sum(meal.carbohydrates for meal in meals)
-        total_fats = sum(meal.fats for meal in meals)
-        total_fiber = sum(meal.fiber or 0 for meal in meals)
-        
-        return {
-            "date": date_filter or today.isoformat(),
-            "total_calories": total_calories,
-            "total_proteins": total_proteins,
-            "total_carbohydrates": total_carbohydrates,
-            "total_fats": total_fats,
-            "total_fiber": total_fiber,
-            "meal_count": len(meals)
-        }
+        rows = result.all()
+        all_time = (await session.execute(all_time_query(user.id, end, selected_macros))).one()
+    buckets, averages = range_stats_payload(rows, selected_macros, start, end, granularity, window)
+
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "granularity": granularity,
+        "window": window,
+        "macros": selected_macros,
+        "buckets": buckets,
+        "averages": averages,
+        "all_time_averages": all_time_averages(all_time, end, selected_macros),
+    }
+
+# Jeton optionnel exigé pour lire /metrics (Authorization: Bearer <METRICS_TOKEN>)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Non autorisé")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/admin/profiles", include_in_schema=False)
+async def get_profiles(user: User = Depends(fastapi_users.current_user(superuser=True))):
+    """Captures de profilage (voir profiling.py), de la plus récente à la plus ancienne"""
+    return {"enabled": PROFILING, "profiles": await asyncio.to_thread(list_captures)}
+
+@app.get("/admin/profiles/{profile_id}", include_in_schema=False)
+async def download_profile(profile_id: str, user: User = Depends(fastapi_users.current_user(superuser=True))):
+    """Fichier speedscope d'une capture, à ouvrir sur https://www.speedscope.app"""
+    path = capture_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Capture introuvable")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
 
 @app.get("/health")
 def healthcheck():
@@ -265,31 +695,47 @@ async def test_users():
     except Exception as e:
         return {"error": str(e)}
 
-# Créer les tables au démarrage
+# Appliquer les migrations de schéma au démarrage (aucun DDL dans les requêtes)
 @app.on_event("startup")
 async def startup_event():
     try:
-        create_db_and_tables()
-        print("✅ Tables créées avec succès")
+        applied = await migrate(engine)
+        if applied:
+            print(f"✅ Migrations appliquées : {', '.join(str(v) for v in applied)}")
+        else:
+            print("✅ Schéma à jour")
     except Exception as e:
-        print(f"⚠️ Erreur lors de la création des tables: {e}")
-        print("Les tables seront créées lors de la première requête")
+        print(f"⚠️ Erreur lors des migrations: {e}")
+    await invalidation_bus.start()
+    if os.path.isdir(FRONTEND_DIST):
+        count = await asyncio.to_thread(static_site.scan)
+        print(f"✅ Frontend chargé ({count} fichiers)")
+    app.state.compaction = asyncio.create_task(compaction_loop(engine))
+    await asyncio.to_thread(archive_index.refresh)
+    app.state.storage_maintenance = asyncio.create_task(storage_maintenance_loop(engine))
+    await password_pool.start()
 
-FRONTEND_DIST = os.path.join(os.path.dirname(__file__), "../frontend/dist")
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.compaction.cancel()
+    app.state.storage_maintenance.cancel()
+    await invalidation_bus.stop()
+    await estimator.aclose()
+    password_pool.close()
 
-# Sert les fichiers statiques (JS, CSS, images, etc.)
-if os.path.exists(os.path.join(FRONTEND_DIST, "assets")):
-    app.mount("/assets", StaticFiles(directory=os.path.join(FRONTEND_DIST, "assets")), name="assets")
-if os.path.exists(os.path.join(FRONTEND_DIST, "static")):
-    app.mount("/static", StaticFiles(directory=os.path.join(FRONTEND_DIST, "static")), name="static")
+FRONTEND_DIST = os.path.join(os.path.dirname(__file__), "../frontend/dist")
+# Fichiers du frontend chargés et précompressés au démarrage (voir static_site.py)
+static_site = StaticSite(FRONTEND_DIST)
 
-# Sert index.html pour toutes les autres routes non-API
+# Sert les fichiers du frontend, et index.html pour toutes les autres routes non-API
 @app.get("/{full_path:path}")
-async def serve_react_app(full_path: str):
-    index_path = os.path.join(FRONTEND_DIST, "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
-    return {"error": "index.html not found"}
+async def serve_react_app(full_path: str, request: Request):
+    static_file = static_site.lookup(full_path)
+    if static_file is not None:
+        return static_file.response(request)
+    if static_site.index is None:
+        return {"error": "index.html not found"}
+    raise HTTPException(status_code=404, detail="Fichier introuvable")
 
 # Endpoint OPTIONS spécifique pour l'authentification
 @app.options("/auth/jwt/login")
@@ -0,0 +1,196 @@
+"""
+Métriques Prometheus : latence par route, requêtes en cours, requêtes SQL par
+requête HTTP, état du pool de connexions, caches applicatifs et pool de hachage
+des mots de passe.
+
+Tout est agrégé en mémoire (compteurs et histogrammes prometheus_client) et
+exposé sur /metrics ; le coût par requête se limite à quelques additions.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Buckets adaptés à un Raspberry Pi (de 5 ms à 10 s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "calorietrack_http_requests_total", "Requêtes HTTP traitées", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "calorietrack_http_request_duration_seconds", "Durée des requêtes HTTP", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge("calorietrack_http_requests_in_flight", "Requêtes HTTP en cours")
+
+SQL_STATEMENTS = Counter("calorietrack_sql_statements_total", "Requêtes SQL exécutées")
+SQL_DURATION = Histogram(
+    "calorietrack_sql_statement_duration_seconds", "Durée des requêtes SQL", buckets=LATENCY_BUCKETS
+)
+SQL_PER_REQUEST = Histogram(
+    "calorietrack_sql_statements_per_request", "Requêtes SQL par requête HTTP", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+SQL_TIME_PER_REQUEST = Histogram(
+    "calorietrack_sql_time_per_request_seconds", "Temps SQL cumulé par requête HTTP", ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+
+POOL_WAIT = Histogram(
+    "calorietrack_db_pool_checkout_seconds", "Attente pour obtenir une connexion du pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+POOL_SIZE = Gauge("calorietrack_db_pool_size", "Taille configurée du pool")
+POOL_CHECKED_OUT = Gauge("calorietrack_db_pool_checked_out", "Connexions empruntées")
+POOL_OVERFLOW = Gauge("calorietrack_db_pool_overflow", "Connexions en dépassement du pool")
+
+AUTH_CACHE = Gauge("calorietrack_auth_cache", "Cache des utilisateurs authentifiés", ["stat"])
+
+# Taux de succès = (memory + database) / total
+ESTIMATE_CACHE = Counter(
+    "calorietrack_estimate_cache_total", "Estimations par niveau de cache (memory, database, miss)", ["result"]
+)
+ESTIMATE_MODEL_LATENCY = Histogram(
+    "calorietrack_estimate_model_duration_seconds", "Durée des appels au modèle d'estimation",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+LLM_JOBS = Counter(
+    "calorietrack_llm_jobs_total", "Demandes de génération (generated, coalesced, rejected, failed)", ["result"]
+)
+LLM_BATCH = Histogram(
+    "calorietrack_llm_batch_size", "Descriptions par prompt envoyé au modèle", buckets=(1, 2, 3, 4, 6, 8, 16)
+)
+INVALIDATION_EVENTS = Counter(
+    "calorietrack_invalidation_events_total", "Événements d'invalidation entre processus", ["kind", "direction"]
+)
+INVALIDATION_RESETS = Counter(
+    "calorietrack_invalidation_resets_total", "Caches locaux vidés après une coupure de l'écoute"
+)
+LLM_SCHEDULER = Gauge("calorietrack_llm_scheduler", "File de l'ordonnanceur d'estimation", ["stat"])
+ADMISSION = Gauge("calorietrack_admission", "Requêtes en cours sur la base et plafond d'admission", ["stat"])
+ADMISSION_REJECTED = Counter(
+    "calorietrack_admission_rejected_total", "Requêtes refusées avant traitement (user, ip, overload)", ["group", "reason"]
+)
+PASSWORD_POOL = Gauge("calorietrack_password_pool", "Pool de hachage des mots de passe (workers, running, waiting)", ["stat"])
+PASSWORD_JOBS = Counter(
+    "calorietrack_password_jobs_total",
+    "Calculs de mots de passe (hash : done, rejected ; verify : valid, invalid, rehashed, rejected)",
+    ["operation", "result"],
+)
+PASSWORD_WAIT = Histogram(
+    "calorietrack_password_queue_wait_seconds", "Attente d'une place dans le pool de hachage", buckets=LATENCY_BUCKETS
+)
+PASSWORD_DURATION = Histogram(
+    "calorietrack_password_duration_seconds", "Durée d'un hachage ou d'une vérification", ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# [nombre de requêtes SQL, durée cumulée] de la requête HTTP courante
+_request_sql: ContextVar[Optional[list]] = ContextVar("request_sql", default=None)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Pool asyncio qui mesure le temps d'attente de chaque emprunt de connexion"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    SQL_STATEMENTS.inc()
+    SQL_DURATION.observe(elapsed)
+    current = _request_sql.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += elapsed
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Branche les événements SQL et les jauges du pool sur le moteur"""
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+    # Lecture paresseuse au moment du scrape ; le pool peut être recréé (dispose)
+    def pool_stat(name):
+        def read():
+            method = getattr(sync_engine.pool, name, None)
+            return method() if callable(method) else 0
+        return read
+
+    POOL_SIZE.set_function(pool_stat("size"))
+    POOL_CHECKED_OUT.set_function(pool_stat("checkedout"))
+    POOL_OVERFLOW.set_function(pool_stat("overflow"))
+
+
+def instrument_user_cache(cache):
+    for stat in ("size", "hits", "misses", "evictions", "invalidations"):
+        AUTH_CACHE.labels(stat).set_function(lambda stat=stat: cache.stats()[stat])
+
+
+def instrument_scheduler(scheduler):
+    for stat in ("pending", "running", "inflight"):
+        LLM_SCHEDULER.labels(stat).set_function(lambda stat=stat: scheduler.stats()[stat])
+
+
+def instrument_password_pool(pool):
+    for stat in ("workers", "running", "waiting"):
+        PASSWORD_POOL.labels(stat).set_function(lambda stat=stat: pool.stats()[stat])
+
+
+def _route_label(scope) -> str:
+    """Gabarit de la route (/meals/{meal_id}) plutôt que le chemin, pour borner la cardinalité"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI pur (compatible avec les réponses en flux)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            _request_sql.reset(token)
+            route = _route_label(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status["code"])).inc()
+            HTTP_LATENCY.labels(scope["method"], route).observe(elapsed)
+            SQL_PER_REQUEST.labels(route).observe(sql[0])
+            SQL_TIME_PER_REQUEST.labels(route).observe(sql[1])
+
+
+def render_metrics():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Migrations de schéma versionnées, appliquées une seule fois au démarrage.
+
+Les modèles (models.py) restent la référence pour une base neuve : create_all
+crée les tables complètes. Les migrations amènent une base existante au même
+état (index, colonnes ajoutées après coup) et sont idempotentes pour qu'un
+passage sur une base neuve soit sans effet. Les versions appliquées sont
+enregistrées dans la table schema_migrations.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Sequence
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from db import Base
+from foods import rebuild_frequent_foods
+from rollup import rebuild_daily_totals
+
+# Clé du verrou consultatif Postgres qui sérialise les migrations entre processus
+MIGRATION_LOCK_ID = 427_001
+
+migrations_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migrations_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Enregistre une fonction de migration (reçoit une connexion synchrone)"""
+    def decorator(fn: Callable[[Connection], None]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Version de migration en double : {version}")
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+    return decorator
+
+
+# Outils idempotents utilisables dans les migrations
+
+def create_index(conn: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False):
+    """Crée un index s'il n'existe pas encore"""
+    unique_sql = "UNIQUE " if unique else ""
+    cols = ", ".join(f'"{c}"' for c in columns)
+    conn.execute(text(f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON "{table}" ({cols})'))
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """Ajoute une colonne si elle n'existe pas (ddl = type et contraintes, ex. "INTEGER NOT NULL DEFAULT 0")"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}'))
+
+
+# Migrations (ordre croissant de version, ne jamais modifier une migration publiée)
+
+@migration(1, "Index composite (user_id, date) sur meal")
+def _meal_user_date_index(conn: Connection):
+    create_index(conn, "ix_meal_user_id_date", "meal", ["user_id", "date"])
+
+
+@migration(2, "Table de cumul daily_totals : remplissage initial depuis meal")
+def _daily_totals_backfill(conn: Connection):
+    rebuild_daily_totals(conn)
+
+
+@migration(3, "Recherche : index trigrammes sur meal.name et meal.description (Postgres)")
+def _meal_search_indexes(conn: Connection):
+    if conn.dialect.name != "postgresql":
+        return
+    try:
+        # Point de sauvegarde : un refus (droits insuffisants) n'annule pas la transaction
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as e:
+        print(f"⚠️ pg_trgm indisponible, la recherche utilisera l'index en mémoire : {e}")
+        return
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_meal_name_trgm ON meal USING gin (lower(name) gin_trgm_ops)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_meal_description_trgm "
+        "ON meal USING gin (lower(coalesce(description, '')) gin_trgm_ops)"
+    ))
+
+
+@migration(4, "Table frequent_foods : remplissage initial depuis meal")
+def _frequent_foods_backfill(conn: Connection):
+    rebuild_frequent_foods(conn)
+
+
+@migration(5, "Synchronisation : meal.updated_at, meal.change_seq, data_versions.compacted_seq")
+def _meal_change_tracking(conn: Connection):
+    # Pas de valeur par défaut non constante en SQLite : remplissage depuis la date du repas
+    add_column(conn, "meal", "updated_at", "TIMESTAMP")
+    conn.execute(text("UPDATE meal SET updated_at = date WHERE updated_at IS NULL"))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE meal ALTER COLUMN updated_at SET NOT NULL"))
+    add_column(conn, "meal", "change_seq", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "data_versions", "compacted_seq", "INTEGER NOT NULL DEFAULT 0")
+    create_index(conn, "ix_meal_user_id_change_seq", "meal", ["user_id", "change_seq"])
+
+
+def _apply_pending(conn: Connection) -> List[int]:
+    """Crée les tables manquantes puis applique les migrations non encore enregistrées"""
+    if conn.dialect.name == "postgresql":
+        # Libéré automatiquement à la fin de la transaction
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+    # S'assurer que les modèles sont bien importés et enregistrés
+    import models  # noqa: F401
+    Base.metadata.create_all(conn)
+    migrations_metadata.create_all(conn)
+
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    newly_applied = []
+    for m in sorted(MIGRATIONS, key=lambda m: m.version):
+        if m.version in applied:
+            continue
+        m.apply(conn)
+        conn.execute(schema_migrations.insert().values(version=m.version, description=m.description))
+        newly_applied.append(m.version)
+    return newly_applied
+
+
+async def migrate(engine: AsyncEngine) -> List[int]:
+    """Amène le schéma à la dernière version, en une transaction ; retourne les versions appliquées"""
+    async with engine.begin() as conn:
+        return await conn.run_sync(_apply_pending)
+
+
+async def main():
+    from db import engine
+
+    applied = await migrate(engine)
+    if applied:
+        print(f"✅ Migrations appliquées : {', '.join(str(v) for v in applied)}")
+    else:
+        print("✅ Schéma déjà à jour")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,8 @@
 from fastapi_users.db import SQLAlchemyBaseUserTable
 from db import Base
-from sqlalchemy import Integer, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy import Integer, String, DateTime, Date, Float, ForeignKey, Text, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from datetime import datetime
+from datetime import datetime, date
 
 class User(SQLAlchemyBaseUserTable[int], Base):
     __tablename__ = "user"
@@ -14,6 +14,12 @@ class User(SQLAlchemyBaseUserTable[int], Base):
 
 class Meal(Base):
     __tablename__ = "meal"
+    __table_args__ = (
+        # Toutes les requêtes filtrent sur user_id et bornent sur date
+        Index("ix_meal_user_id_date", "user_id", "date"),
+        # Synchronisation incrémentale (/meals/changes)
+        Index("ix_meal_user_id_change_seq", "user_id", "change_seq"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False)
@@ -30,5 +36,76 @@ class Meal(Base):
     meal_type: Mapped[str] = mapped_column(String(50), nullable=False)  # breakfast, lunch, dinner, snack
     date: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     
+    # Synchronisation : dernière modification et version des données de l'utilisateur à ce moment
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    change_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    
     # Relation avec l'utilisateur
     user: Mapped[User] = relationship("User", back_populates="meals")
+
+class DailyTotal(Base):
+    """Totaux nutritionnels par utilisateur et par jour (UTC), maintenus à chaque écriture de repas"""
+    __tablename__ = "daily_totals"
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    calories: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    proteins: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    carbohydrates: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    fats: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    fiber: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    meal_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class FrequentFood(Base):
+    """Aliments déjà saisis par un utilisateur (nom normalisé) : nombre de repas et cumul des macros"""
+    __tablename__ = "frequent_foods"
+    __table_args__ = (
+        Index("ix_frequent_foods_user_id_meal_count", "user_id", "meal_count"),
+    )
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # voir foods.food_key
+    name: Mapped[str] = mapped_column(String(255), nullable=False)  # dernier nom saisi
+    meal_type: Mapped[str] = mapped_column(String(50), nullable=False)  # dernier type de repas
+    meal_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_used: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    # Sommes sur meal_count repas (moyenne = somme / meal_count)
+    calories: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    proteins: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    carbohydrates: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    fats: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    fiber: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+
+class DataVersion(Base):
+    """Version des données d'un utilisateur, incrémentée à chaque écriture de repas (ETag)"""
+    __tablename__ = "data_versions"
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Plus haute version dont les suppressions ont été purgées (voir sync.py)
+    compacted_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class MealTombstone(Base):
+    """Repas supprimés, gardés un temps pour la synchronisation incrémentale (/meals/changes)"""
+    __tablename__ = "meal_tombstones"
+    __table_args__ = (
+        Index("ix_meal_tombstones_user_id_change_seq", "user_id", "change_seq"),
+    )
+
+    meal_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    change_seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class EstimateCache(Base):
+    """Estimations du modèle, indexées par description normalisée (voir estimation.py)"""
+    __tablename__ = "estimate_cache"
+
+    model: Mapped[str] = mapped_column(String(100), primary_key=True)
+    key: Mapped[str] = mapped_column(Text, primary_key=True)
+    description: Mapped[str] = mapped_column(Text, nullable=False)  # première description rencontrée
+    result: Mapped[str] = mapped_column(Text, nullable=False)  # JSON de MealEstimate
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
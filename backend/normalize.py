@@ -0,0 +1,23 @@
+"""
+Normalisation du texte saisi par les utilisateurs (noms de repas, descriptions) :
+minuscules, sans accents ni ligatures. Partagée par le cache d'estimation, la
+recherche et les aliments fréquents pour que « Café » et « cafe » se rejoignent.
+"""
+import re
+import unicodedata
+from typing import List
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def fold_text(text: str) -> str:
+    """Minuscules, sans accents ni ligatures, virgule décimale -> point"""
+    text = text.lower().replace("œ", "oe").replace("æ", "ae").replace("½", " 0.5 ")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"(\d),(\d)", r"\1.\2", text)
+
+
+def words(text: str) -> List[str]:
+    """Mots normalisés d'un texte, ponctuation retirée"""
+    return _WORD.findall(fold_text(text or ""))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Bouchon de l'API /api/generate d'Ollama, pour les tests et les benchmarks.
+
+Renvoie une estimation déterministe (dérivée d'un hachage de la description),
+ou une par ligne numérotée pour un prompt groupé, après un délai réglable qui
+simule la lenteur du modèle sur le Raspberry Pi ; en flux NDJSON si demandé.
+
+    STUB_DELAY=2 uvicorn ollama_stub:app --port 11435
+    OLLAMA_URL=http://localhost:11435 uvicorn main:app
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+STUB_DELAY = float(os.getenv("STUB_DELAY", "1.0"))
+
+app = FastAPI()
+calls = 0
+
+
+def fake_estimate(description: str) -> dict:
+    digest = hashlib.sha1(description.encode()).digest()
+    proteins, carbohydrates, fats = digest[0] % 50, digest[1] % 100, digest[2] % 40
+    return {
+        "name": description[:40].capitalize(),
+        "calories": proteins * 4 + carbohydrates * 4 + fats * 9,
+        "proteins": proteins,
+        "carbohydrates": carbohydrates,
+        "fats": fats,
+        "fiber": digest[3] % 10,
+    }
+
+
+def answer(prompt: str) -> str:
+    match = re.search(r"Repas :(.*)", prompt, re.DOTALL)
+    text = match.group(1).strip() if match else prompt
+    items = re.findall(r"^\d+\. (.*)$", text, re.MULTILINE)
+    if items:
+        return json.dumps({"meals": [fake_estimate(item) for item in items]})
+    return json.dumps(fake_estimate(text))
+
+
+@app.post("/api/generate")
+async def generate(body: dict):
+    global calls
+    calls += 1
+    response = answer(body.get("prompt", ""))
+    if not body.get("stream", True):
+        await asyncio.sleep(STUB_DELAY)
+        return {"model": body.get("model"), "response": response, "done": True}
+
+    async def chunks():
+        tokens = re.findall(r".{1,8}", response, re.DOTALL)
+        for token in tokens:
+            await asyncio.sleep(STUB_DELAY / len(tokens))
+            yield json.dumps({"model": body.get("model"), "response": token, "done": False}) + "\n"
+        yield json.dumps({"model": body.get("model"), "response": "", "done": True}) + "\n"
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@app.get("/stats")
+def stats():
+    return {"calls": calls}
@@ -0,0 +1,48 @@
+"""
+Pagination par curseur (keyset) sur (date, id) pour les listes de repas
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+from models import Meal
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(meal_date: datetime, meal_id: int) -> str:
+    """Curseur opaque désignant le dernier repas renvoyé"""
+    payload = json.dumps({"d": meal_date.isoformat(), "i": meal_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["d"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def apply_keyset(query, before: Optional[Tuple[datetime, int]]):
+    """
+    Trie du plus récent au plus ancien et reprend après le curseur décodé
+    (date, id) du dernier repas renvoyé.
+
+    La comparaison de tuples (date, id) < (d, i) reste servie par l'index
+    (user_id, date) : aucune page ne coûte plus qu'un parcours d'index borné,
+    contrairement à un OFFSET.
+    """
+    query = query.order_by(Meal.date.desc(), Meal.id.desc())
+    if before:
+        query = query.where(tuple_(Meal.date, Meal.id) < tuple_(*before))
+    return query
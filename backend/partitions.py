@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Partitionnement mensuel de la table meal (Postgres).
+
+Une fois convertie (python partitions.py convert), meal est partitionnée par
+intervalles sur date : une table meal_yAAAAmMM par mois, plus meal_default pour
+les dates hors des partitions existantes. Les requêtes bornées en date (jour du
+tableau de bord, statistiques, pages récentes) ne lisent qu'une ou deux
+partitions, et l'archivage (archive.py) retire un mois entier par DROP plutôt
+que par DELETE.
+
+Contraintes du partitionnement : la clé primaire devient (id, date) et l'id
+reste unique par la séquence ; une lecture par id seul sonde l'index de chaque
+partition (peu nombreuses une fois les anciens mois archivés).
+Les partitions des PARTITION_MONTHS_AHEAD prochains mois sont créées à l'avance
+au démarrage puis chaque jour. Sans conversion (ou sur SQLite), tout reste dans
+une seule table et ce module est sans effet.
+"""
+import argparse
+import asyncio
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Mois créés à l'avance
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+DEFAULT_PARTITION = "meal_default"
+PARTITION_NAME = re.compile(r"^meal_y(\d{4})m(\d{2})$")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"meal_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('meal')"
+    )).scalar())
+
+
+def monthly_partitions(conn: Connection) -> List[date]:
+    """Mois ayant une partition attachée à meal, du plus ancien au plus récent"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('meal')"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(conn: Connection, month: date):
+    """
+    Crée la partition d'un mois. Si meal_default contient déjà des repas de ce
+    mois, ils y sont déplacés (la création directe serait refusée).
+    """
+    name, end = partition_name(month), add_months(month, 1)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+    params = {"start": month, "end": end}
+    stray = conn.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end LIMIT 1"
+    ), params).scalar()
+    if not stray:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF meal FOR VALUES {bounds}"))
+        return
+    conn.execute(text(f"CREATE TABLE {name} (LIKE meal INCLUDING DEFAULTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), params)
+    conn.execute(text(f"ALTER TABLE meal ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def ensure_partitions(conn: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD, today: Optional[date] = None) -> List[date]:
+    """Crée les partitions manquantes du mois courant et des suivants ; retourne les mois créés"""
+    if not is_partitioned(conn):
+        return []
+    existing = set(monthly_partitions(conn))
+    current = month_start(today or datetime.utcnow())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_partition(conn, month)
+            created.append(month)
+    return created
+
+
+def drop_partition(conn: Connection, month: date) -> bool:
+    """Détache et supprime la partition d'un mois (après archivage) ; False si elle n'existe pas"""
+    if month not in monthly_partitions(conn):
+        return False
+    name = partition_name(month)
+    conn.execute(text(f"ALTER TABLE meal DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    return True
+
+
+def convert_to_partitioned(conn: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Remplace meal par une table partitionnée contenant les mêmes lignes ;
+    retourne le nombre de partitions mensuelles. À lancer application arrêtée.
+    """
+    if conn.dialect.name != "postgresql":
+        raise RuntimeError("Le partitionnement n'est disponible que sur Postgres")
+    if is_partitioned(conn):
+        return len(monthly_partitions(conn))
+
+    conn.execute(text("LOCK TABLE meal IN ACCESS EXCLUSIVE MODE"))
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('meal', 'id')")).scalar()
+    bounds = conn.execute(text("SELECT min(date), max(date) FROM meal")).first()
+
+    conn.execute(text("ALTER TABLE meal RENAME TO meal_heap"))
+    # La séquence appartient à la colonne de l'ancienne table : elle disparaîtrait avec elle
+    conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    conn.execute(text("CREATE TABLE meal (LIKE meal_heap INCLUDING DEFAULTS) PARTITION BY RANGE (date)"))
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF meal DEFAULT"))
+
+    today = month_start(datetime.utcnow())
+    first = month_start(bounds[0]) if bounds[0] else today
+    last = max(month_start(bounds[1]) if bounds[1] else today, add_months(today, months_ahead))
+    month, count = first, 0
+    while month <= last:
+        create_partition(conn, month)
+        month, count = add_months(month, 1), count + 1
+
+    conn.execute(text("INSERT INTO meal SELECT * FROM meal_heap"))
+    conn.execute(text("DROP TABLE meal_heap"))
+    conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY meal.id"))
+
+    # Contraintes et index recréés après le chargement (noms libérés par DROP TABLE)
+    conn.execute(text("ALTER TABLE meal ADD CONSTRAINT meal_pkey PRIMARY KEY (id, date)"))
+    conn.execute(text('ALTER TABLE meal ADD CONSTRAINT meal_user_id_fkey FOREIGN KEY (user_id) REFERENCES "user" (id)'))
+    conn.execute(text("CREATE INDEX ix_meal_user_id_date ON meal (user_id, date)"))
+    conn.execute(text("CREATE INDEX ix_meal_user_id_change_seq ON meal (user_id, change_seq)"))
+    if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+        conn.execute(text("CREATE INDEX ix_meal_name_trgm ON meal USING gin (lower(name) gin_trgm_ops)"))
+        conn.execute(text(
+            "CREATE INDEX ix_meal_description_trgm ON meal USING gin (lower(coalesce(description, '')) gin_trgm_ops)"
+        ))
+    return count
+
+
+async def main():
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Partitionnement mensuel de la table meal (Postgres)")
+    parser.add_argument("command", choices=["convert", "ensure", "list"])
+    parser.add_argument("--ahead", type=int, default=PARTITION_MONTHS_AHEAD, help="Mois à créer à l'avance")
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        if args.command == "convert":
+            count = await conn.run_sync(convert_to_partitioned, args.ahead)
+            print(f"✅ meal partitionnée ({count} partitions mensuelles)")
+        elif args.command == "ensure":
+            created = await conn.run_sync(ensure_partitions, args.ahead)
+            print(f"✅ {len(created)} partitions créées")
+        else:
+            months = await conn.run_sync(monthly_partitions)
+            for month in months:
+                print(f"   {partition_name(month)}")
+            print(f"✅ {len(months)} partitions mensuelles" if months else "ℹ️ meal n'est pas partitionnée")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
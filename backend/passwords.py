@@ -0,0 +1,185 @@
+"""
+Hachage et vérification des mots de passe hors de la boucle d'événements.
+
+Argon2 (ou bcrypt pour les anciens comptes) coûte des dizaines à centaines de
+millisecondes de CPU par appel : exécuté dans la boucle, chaque connexion gèle
+toutes les autres requêtes. Le pool envoie ce travail à PASSWORD_WORKERS
+processus (0 = threads du serveur, argon2 et bcrypt relâchant le GIL) :
+- au plus PASSWORD_WORKERS calculs à la fois, les suivants attendent leur tour ;
+- au-delà de PASSWORD_QUEUE_LIMIT en attente : PasswordQueueFull, traduit par
+  UserManager en 503 + Retry-After ;
+- les paramètres de coût (PASSWORD_ARGON2_*) sont ceux des nouveaux hachages ;
+  un mot de passe haché avec d'autres paramètres (ou en bcrypt) est rehaché à la
+  connexion suivante réussie (verify_and_update de pwdlib).
+Les méthodes synchrones (protocole PasswordHelper de fastapi-users) restent
+disponibles pour les chemins rares (mot de passe oublié, scripts).
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from pwdlib.hashers.bcrypt import BcryptHasher
+
+from metrics import PASSWORD_DURATION, PASSWORD_JOBS, PASSWORD_WAIT
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "64"))
+ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KIB = int(os.getenv("PASSWORD_ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "4"))
+# Threads utilisés quand PASSWORD_WORKERS vaut 0
+PASSWORD_THREADS = 2
+
+CostParameters = Tuple[int, int, int]
+COST_PARAMETERS: CostParameters = (ARGON2_TIME_COST, ARGON2_MEMORY_KIB, ARGON2_PARALLELISM)
+
+
+class PasswordQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Trop de mots de passe en attente, réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+def password_hash(parameters: CostParameters = COST_PARAMETERS) -> PasswordHash:
+    """Argon2 pour les nouveaux hachages ; bcrypt reconnu (et converti à la connexion)"""
+    time_cost, memory_kib, parallelism = parameters
+    return PasswordHash((
+        Argon2Hasher(time_cost=time_cost, memory_cost=memory_kib, parallelism=parallelism),
+        BcryptHasher(),
+    ))
+
+
+# Côté processus (ou thread) de calcul : fonctions de module, transmises par référence
+_worker_hash: Optional[PasswordHash] = None
+
+
+def _init_worker(parameters: CostParameters):
+    global _worker_hash
+    _worker_hash = password_hash(parameters)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _hash(password: str) -> Tuple[str, float]:
+    start = time.perf_counter()
+    hashed = _worker_hash.hash(password)
+    return hashed, time.perf_counter() - start
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[Tuple[bool, Optional[str]], float]:
+    start = time.perf_counter()
+    result = _worker_hash.verify_and_update(password, hashed_password)
+    return result, time.perf_counter() - start
+
+
+class PasswordPool:
+    def __init__(
+        self,
+        workers: int = PASSWORD_WORKERS,
+        queue_limit: int = PASSWORD_QUEUE_LIMIT,
+        parameters: CostParameters = COST_PARAMETERS,
+    ):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.parameters = parameters
+        self.password_hash = password_hash(parameters)
+        self.concurrency = workers or PASSWORD_THREADS
+        self.running = 0
+        self.waiting = 0
+        # Moyenne glissante d'un calcul (s), pour estimer Retry-After
+        self.average_duration = 0.3
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn : pas de fork d'un processus qui a déjà des threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.parameters,),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=PASSWORD_THREADS, thread_name_prefix="password",
+                    initializer=_init_worker, initargs=(self.parameters,),
+                )
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._executor
+
+    async def start(self):
+        """Démarre les processus avant la première connexion (le démarrage d'un processus coûte plus qu'un hachage)"""
+        executor = self._ensure_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, _ping) for _ in range(self.concurrency)))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    def retry_after(self) -> int:
+        backlog = self.waiting + self.running
+        return max(1, math.ceil(self.average_duration * backlog / self.concurrency))
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.concurrency, "running": self.running, "waiting": self.waiting}
+
+    async def _run(self, operation: str, function, *args):
+        executor = self._ensure_executor()
+        if self.waiting >= self.queue_limit:
+            PASSWORD_JOBS.labels(operation, "rejected").inc()
+            raise PasswordQueueFull(self.retry_after())
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        PASSWORD_WAIT.observe(time.perf_counter() - queued)
+        self.running += 1
+        try:
+            result, duration = await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+        finally:
+            self.running -= 1
+            self._slots.release()
+        self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+        PASSWORD_DURATION.labels(operation).observe(duration)
+        return result
+
+    async def hash_async(self, password: str) -> str:
+        hashed = await self._run("hash", _hash, password)
+        PASSWORD_JOBS.labels("hash", "done").inc()
+        return hashed
+
+    async def verify_and_update_async(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(mot de passe correct, nouveau hachage si les paramètres de coût ont changé)"""
+        verified, updated = await self._run("verify", _verify_and_update, password, hashed_password)
+        PASSWORD_JOBS.labels("verify", "rehashed" if updated else "valid" if verified else "invalid").inc()
+        return verified, updated
+
+    # Protocole PasswordHelper de fastapi-users (synchrone, dans la boucle)
+
+    def hash(self, password: str) -> str:
+        return self.password_hash.hash(password)
+
+    def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return self.password_hash.verify_and_update(plain_password, hashed_password)
+
+    def generate(self) -> str:
+        return secrets.token_urlsafe()
+
+
+password_pool = PasswordPool()
@@ -0,0 +1,339 @@
+"""
+Profilage à la demande d'une requête, pour les lenteurs qu'on ne reproduit pas.
+
+Désactivé par défaut (PROFILING=false) : ni middleware ni écouteur SQL ne sont
+installés, le coût est nul. Activé, une requête est profilée :
+- si elle porte l'en-tête X-Profile: 1 et le jeton d'un administrateur
+  (l'identifiant de la capture est renvoyé dans X-Profile-Id) ;
+- ou par tirage, pour une fraction PROFILE_SAMPLE_RATE des requêtes.
+
+Un thread échantillonne toutes les PROFILE_INTERVAL_MS la pile de la boucle
+quand la tâche de la requête s'exécute, ou sa chaîne d'await quand elle attend
+(base, modèle, thread) : le profil couvre le temps réel, dépendances comprises
+(current_user, SessionLocal). Les requêtes SQL et leur durée sont enregistrées
+à côté. Chaque capture est écrite au format speedscope (https://www.speedscope.app)
+dans PROFILE_DIR, dont seules les PROFILE_MAX_FILES plus récentes sont gardées ;
+/admin/profiles les liste et les sert aux administrateurs.
+"""
+import asyncio
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import jwt
+import orjson
+from fastapi_users.jwt import decode_jwt
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from admission import JWT_AUDIENCE
+from models import User
+
+PROFILING = os.getenv("PROFILING", "false").lower() in ("1", "true", "yes")
+# Fraction des requêtes profilées par tirage (0 = seulement sur demande)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_HEADER = b"x-profile"
+# Requêtes jamais profilées (lecture des captures elles-mêmes, scrape)
+PROFILE_EXCLUDED = ("/admin/profiles", "/metrics")
+PROFILE_FILE = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{6}\.speedscope\.json$")
+SQL_PREVIEW = 300
+
+# Capture de la requête courante (None hors requête profilée)
+_capture: ContextVar[Optional["Capture"]] = ContextVar("profile_capture", default=None)
+
+Frame = Tuple[str, str, int]
+
+
+class Capture:
+    """Échantillons de pile et requêtes SQL d'une requête profilée"""
+
+    def __init__(self, method: str, path: str, task: asyncio.Task, reason: str):
+        # Horodatage en tête : l'ordre des noms est celui des captures (anneau, liste)
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{secrets.token_hex(3)}"
+        self.method = method
+        self.path = path
+        self.task = task
+        self.reason = reason
+        self.status = None
+        self.start = time.perf_counter()
+        self.end = None
+        self.last_sample = self.start
+        # (pile de la racine à la feuille, durée représentée en secondes)
+        self.samples: List[Tuple[Tuple[Frame, ...], float]] = []
+        # (instant de début relatif, durée, requête)
+        self.statements: List[Tuple[float, float, str]] = []
+
+    @property
+    def filename(self) -> str:
+        return f"{self.id}.speedscope.json"
+
+    def speedscope(self) -> Dict:
+        frames: Dict[Frame, int] = {}
+
+        def index(frame: Frame) -> int:
+            return frames.setdefault(frame, len(frames))
+
+        samples = [[index(frame) for frame in stack] for stack, _ in self.samples]
+        weights = [round(weight * 1000, 3) for _, weight in self.samples]
+        total = round(((self.end or time.perf_counter()) - self.start) * 1000, 3)
+
+        events, cursor = [], 0.0
+        for offset, duration, statement in self.statements:
+            # Événements imbriqués exigés : deux sessions parallèles sont mises bout à bout
+            opened = max(round(offset * 1000, 3), cursor)
+            cursor = max(opened, round((offset + duration) * 1000, 3))
+            frame = index((" ".join(statement.split())[:SQL_PREVIEW], "SQL", 0))
+            events.append({"type": "O", "frame": frame, "at": opened})
+            events.append({"type": "C", "frame": frame, "at": cursor})
+
+        sql_time = sum(duration for _, duration, _ in self.statements) * 1000
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": (
+                f"{self.method} {self.path} -> {self.status} en {total:.0f} ms "
+                f"({len(self.statements)} requêtes SQL, {sql_time:.0f} ms ; {self.reason})"
+            ),
+            "exporter": "calorietrack profiling.py",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in frames]},
+            "profiles": [
+                {
+                    "type": "sampled", "name": "Requête", "unit": "milliseconds",
+                    "startValue": 0, "endValue": total, "samples": samples, "weights": weights,
+                },
+                {
+                    "type": "evented", "name": "SQL", "unit": "milliseconds",
+                    "startValue": 0, "endValue": max(total, cursor), "events": events,
+                },
+            ],
+        }
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return code.co_qualname, code.co_filename, code.co_firstlineno
+
+
+def _request_frames(frames) -> Tuple[Frame, ...]:
+    """Cadres sous ProfilingMiddleware.__call__ (boucle et serveur retirés), de la racine à la feuille"""
+    keys = []
+    for frame in frames:
+        if frame.f_code is ProfilingMiddleware.__call__.__code__:
+            keys = []
+            continue
+        keys.append(_frame_key(frame))
+    return tuple(keys)
+
+
+def _thread_stack(frame) -> List:
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_chain(task: asyncio.Task) -> List:
+    """Cadres d'une tâche suspendue, en suivant ses await (Task.get_stack s'arrête au premier)"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is not None:
+            frames.append(frame)
+        awaitable = (
+            getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+        )
+    return frames
+
+
+WAITING: Frame = ("(en attente)", "", 0)
+
+
+class Sampler:
+    """Thread d'échantillonnage partagé par les captures en cours, arrêté quand il n'y en a plus"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.captures: List[Capture] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, capture: Capture):
+        with self._lock:
+            self.loop = asyncio.get_running_loop()
+            self.loop_thread = threading.get_ident()
+            self.captures.append(capture)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, capture: Capture):
+        with self._lock:
+            self.captures.remove(capture)
+            capture.end = time.perf_counter()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.captures:
+                    self._thread = None
+                    return
+                self._sample()
+
+    def _sample(self):
+        now = time.perf_counter()
+        running = asyncio.current_task(self.loop)
+        loop_frame = sys._current_frames().get(self.loop_thread)
+        for capture in self.captures:
+            try:
+                if capture.task is running and loop_frame is not None:
+                    stack = _request_frames(_thread_stack(loop_frame))
+                else:
+                    stack = _request_frames(_await_chain(capture.task)) + (WAITING,)
+            except Exception:
+                # Chaîne de coroutines modifiée pendant la lecture : échantillon perdu
+                continue
+            capture.samples.append((stack, now - capture.last_sample))
+            capture.last_sample = now
+
+
+sampler = Sampler()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _capture.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    capture = _capture.get()
+    if capture is None or not conn.info.get("profile_start"):
+        return
+    start = conn.info["profile_start"].pop()
+    capture.statements.append((start - capture.start, time.perf_counter() - start, statement))
+
+
+def instrument_profiling(engine: AsyncEngine):
+    """Écouteurs SQL des captures (installés seulement si PROFILING est actif)"""
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# Anneau de fichiers
+
+def save_capture(capture: Capture, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES) -> str:
+    """Écrit la capture puis supprime les plus anciennes au-delà de max_files"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, capture.filename)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(orjson.dumps(capture.speedscope()))
+    os.replace(temporary, path)
+    names = sorted(name for name in os.listdir(directory) if PROFILE_FILE.match(name))
+    for name in names[:max(0, len(names) - max_files)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def list_captures(directory: str = PROFILE_DIR) -> List[Dict]:
+    """Captures présentes, de la plus récente à la plus ancienne"""
+    try:
+        names = sorted((name for name in os.listdir(directory) if PROFILE_FILE.match(name)), reverse=True)
+    except FileNotFoundError:
+        return []
+    captures = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as f:
+                title = orjson.loads(f.read()).get("name")
+            size = os.path.getsize(path)
+        except (OSError, orjson.JSONDecodeError):
+            continue
+        captures.append({"id": name[:-len(".speedscope.json")], "name": title, "size": size})
+    return captures
+
+
+def capture_path(capture_id: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Chemin d'une capture existante (None si l'identifiant est invalide ou inconnu)"""
+    name = f"{capture_id}.speedscope.json"
+    if not PROFILE_FILE.match(name):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI pur, ajouté seulement si PROFILING est actif"""
+
+    def __init__(self, app, engine: AsyncEngine, secret: str, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.engine = engine
+        self.secret = secret
+        self.sample_rate = sample_rate
+
+    async def requested_by_admin(self, scope) -> bool:
+        """En-tête X-Profile et jeton (signature vérifiée) d'un administrateur"""
+        headers = dict(scope.get("headers", ()))
+        if headers.get(PROFILE_HEADER, b"") in (b"", b"0"):
+            return False
+        scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            user_id = int(decode_jwt(token, self.secret, JWT_AUDIENCE)["sub"])
+        except (jwt.PyJWTError, KeyError, ValueError):
+            return False
+        async with self.engine.connect() as conn:
+            return bool(await conn.scalar(select(User.is_superuser).where(User.id == user_id)))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(PROFILE_EXCLUDED):
+            await self.app(scope, receive, send)
+            return
+        requested = await self.requested_by_admin(scope)
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        capture = Capture(scope["method"], scope["path"], asyncio.current_task(), "demandé" if requested else "tirage")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                capture.status = message["status"]
+                if requested:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", capture.id.encode())]}
+            await send(message)
+
+        token = _capture.set(capture)
+        sampler.add(capture)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.remove(capture)
+            _capture.reset(token)
+            # Réponse déjà envoyée : l'écriture ne retarde pas le client
+            try:
+                await asyncio.to_thread(save_capture, capture)
+            except OSError as e:
+                print(f"⚠️ Capture de profilage non enregistrée : {e}")
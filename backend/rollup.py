@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Table de cumul daily_totals : totaux par (utilisateur, jour) maintenus par deltas.
+
+Chaque écriture de repas ajoute ou retire sa contribution au jour concerné dans
+la même transaction que l'écriture elle-même (upsert ON CONFLICT). La commande
+`python rollup.py rebuild|check` recalcule la table depuis meal ou vérifie
+qu'elle est cohérente.
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import DailyTotal, Meal
+from stats import MACROS, bucket_expression
+
+# Écart toléré par check (cumul de deltas en virgule flottante)
+CHECK_TOLERANCE = 1e-6
+
+
+def meal_contribution(values: Mapping) -> Dict:
+    """Jour et macros d'un repas (objet Meal ou dict de colonnes)"""
+    get = values.get if isinstance(values, Mapping) else lambda key: getattr(values, key)
+    meal_date = get("date")
+    return {
+        "day": meal_date.date() if isinstance(meal_date, datetime) else meal_date,
+        **{macro: float(get(macro) or 0) for macro in MACROS},
+    }
+
+
+def dialect_insert(dialect_name: str):
+    """insert() du dialecte courant (Postgres ou SQLite), qui offre on_conflict_do_update"""
+    return (sqlite if dialect_name == "sqlite" else postgresql).insert
+
+
+async def _apply_delta(session: AsyncSession, user_id: int, day: date, sign: int, totals: Dict, count: int):
+    insert = dialect_insert(session.bind.dialect.name)
+    values = {macro: sign * totals[macro] for macro in MACROS}
+    stmt = insert(DailyTotal).values(user_id=user_id, day=day, meal_count=sign * count, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyTotal.user_id, DailyTotal.day],
+        set_={
+            "meal_count": DailyTotal.meal_count + stmt.excluded.meal_count,
+            **{macro: getattr(DailyTotal, macro) + getattr(stmt.excluded, macro) for macro in MACROS},
+        },
+    )
+    await session.execute(stmt)
+    if sign < 0:
+        # Jour vidé : on retire la ligne plutôt que de garder des zéros
+        await session.execute(
+            delete(DailyTotal).where(
+                DailyTotal.user_id == user_id, DailyTotal.day == day, DailyTotal.meal_count <= 0
+            )
+        )
+
+
+async def _record_meals(session: AsyncSession, user_id: int, meals: Iterable, sign: int):
+    by_day = defaultdict(lambda: {"count": 0, **{macro: 0.0 for macro in MACROS}})
+    for meal in meals:
+        contribution = meal_contribution(meal)
+        bucket = by_day[contribution["day"]]
+        bucket["count"] += 1
+        for macro in MACROS:
+            bucket[macro] += contribution[macro]
+    for day, totals in by_day.items():
+        await _apply_delta(session, user_id, day, sign, totals, totals["count"])
+
+
+async def record_meals_added(session: AsyncSession, user_id: int, meals: Iterable):
+    """Ajoute la contribution de repas (un upsert par jour touché)"""
+    await _record_meals(session, user_id, meals, 1)
+
+
+async def record_meals_removed(session: AsyncSession, user_id: int, meals: Iterable):
+    """Retire la contribution de repas (un upsert par jour touché)"""
+    await _record_meals(session, user_id, meals, -1)
+
+
+async def record_meal_added(session: AsyncSession, user_id: int, meal):
+    contribution = meal_contribution(meal)
+    await _apply_delta(session, user_id, contribution["day"], 1, contribution, 1)
+
+
+async def record_meal_removed(session: AsyncSession, user_id: int, meal):
+    contribution = meal_contribution(meal)
+    await _apply_delta(session, user_id, contribution["day"], -1, contribution, 1)
+
+
+async def record_meal_changed(session: AsyncSession, user_id: int, before: Dict, after):
+    """
+    Modification d'un repas : retrait de l'ancienne contribution, ajout de la
+    nouvelle (gère le changement de jour). `before` est le résultat de
+    meal_contribution capturé avant la modification.
+    """
+    old, new = before, meal_contribution(after)
+    if old == new:
+        return
+    if old["day"] == new["day"]:
+        diff = {macro: new[macro] - old[macro] for macro in MACROS}
+        await _apply_delta(session, user_id, new["day"], 1, diff, 0)
+        return
+    await _apply_delta(session, user_id, old["day"], -1, old, 1)
+    await _apply_delta(session, user_id, new["day"], 1, new, 1)
+
+
+def _recompute_query(conn: Connection, user_id: Optional[int], since: Optional[datetime] = None):
+    day = bucket_expression(Meal.date, "day", conn.dialect.name).label("day")
+    query = select(
+        Meal.user_id,
+        day,
+        *(func.sum(func.coalesce(getattr(Meal, macro), 0.0)).label(macro) for macro in MACROS),
+        func.count(Meal.id).label("meal_count"),
+    ).group_by(Meal.user_id, day)
+    if user_id is not None:
+        query = query.where(Meal.user_id == user_id)
+    if since is not None:
+        query = query.where(Meal.date >= since)
+    return query
+
+
+def rebuild_daily_totals(conn: Connection, user_id: Optional[int] = None, since: Optional[datetime] = None) -> int:
+    """
+    Recalcule daily_totals depuis meal (tous les utilisateurs ou un seul) ;
+    retourne le nombre de jours. `since` : jours antérieurs conservés tels quels
+    (mois archivés, absents de meal, voir archive.py).
+    """
+    cleanup = delete(DailyTotal)
+    if user_id is not None:
+        cleanup = cleanup.where(DailyTotal.user_id == user_id)
+    if since is not None:
+        cleanup = cleanup.where(DailyTotal.day >= since.date())
+    conn.execute(cleanup)
+    recompute = _recompute_query(conn, user_id, since).subquery()
+    columns = ["user_id", "day", *MACROS, "meal_count"]
+    result = conn.execute(
+        DailyTotal.__table__.insert().from_select(columns, select(*(recompute.c[c] for c in columns)))
+    )
+    return result.rowcount
+
+
+def check_daily_totals(conn: Connection, user_id: Optional[int] = None, since: Optional[datetime] = None) -> List[Dict]:
+    """Compare daily_totals aux totaux recalculés (à partir de `since`) ; retourne les jours divergents"""
+    expected = {
+        (row.user_id, str(row.day)[:10]): row._mapping
+        for row in conn.execute(_recompute_query(conn, user_id, since))
+    }
+    stored_query = select(DailyTotal.__table__)
+    if user_id is not None:
+        stored_query = stored_query.where(DailyTotal.user_id == user_id)
+    if since is not None:
+        stored_query = stored_query.where(DailyTotal.day >= since.date())
+    stored = {(row.user_id, str(row.day)[:10]): row._mapping for row in conn.execute(stored_query)}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want, have = expected.get(key), stored.get(key)
+        differs = (
+            want is None or have is None
+            or want["meal_count"] != have["meal_count"]
+            or any(abs(float(want[m] or 0) - float(have[m] or 0)) > CHECK_TOLERANCE for m in MACROS)
+        )
+        if differs:
+            mismatches.append({
+                "user_id": key[0],
+                "day": key[1],
+                "expected": dict(want) if want else None,
+                "stored": dict(have) if have else None,
+            })
+    return mismatches
+
+
+async def main():
+    from archive import archive_boundary, archive_index
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Maintenance de la table daily_totals")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user", type=int, default=None, help="Limiter à un utilisateur")
+    args = parser.parse_args()
+
+    # Les jours archivés ne sont plus dans meal : leurs totaux sont conservés
+    archive_index.refresh()
+    since = archive_boundary()
+    async with engine.begin() as conn:
+        if args.command == "rebuild":
+            count = await conn.run_sync(rebuild_daily_totals, args.user, since)
+            print(f"✅ daily_totals reconstruite ({count} jours)")
+        else:
+            mismatches = await conn.run_sync(check_daily_totals, args.user, since)
+            for m in mismatches:
+                print(f"❌ Utilisateur {m['user_id']}, {m['day']} : attendu {m['expected']}, stocké {m['stored']}")
+            print("✅ daily_totals cohérente" if not mismatches else f"⚠️ {len(mismatches)} jours incohérents")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
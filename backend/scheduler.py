@@ -0,0 +1,257 @@
+"""
+Ordonnanceur des générations du modèle d'estimation.
+
+Le Raspberry Pi ne fait tourner qu'une ou deux générations Ollama à la fois :
+les demandes passent par une file bornée servie par LLM_WORKERS tâches asyncio.
+- Une demande identique (même clé) à une demande en attente ou en cours la
+  rejoint au lieu de relancer le modèle.
+- Les descriptions courtes en attente sont regroupées, jusqu'à LLM_BATCH_SIZE,
+  dans un seul prompt structuré ; si la réponse groupée est inexploitable, chaque
+  demande est rejouée seule.
+- Chaque demande publie ses événements (queued, started, token/progress, result
+  ou error), relayés au client en Server-Sent Events. Les jetons d'un prompt
+  groupé concernent d'autres demandes : seul leur nombre est publié.
+- File pleine : QueueFull, traduit par l'API en 503 + Retry-After.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+from metrics import ESTIMATE_MODEL_LATENCY, LLM_BATCH, LLM_JOBS
+
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "1"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "32"))
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "4"))
+# Au-delà, une description est générée seule
+LLM_BATCH_MAX_CHARS = int(os.getenv("LLM_BATCH_MAX_CHARS", "60"))
+# Attente maximale pour compléter un lot (secondes)
+LLM_BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW", "0.05"))
+# Commentaire SSE envoyé pendant l'attente, pour les proxys qui coupent les flux muets
+SSE_HEARTBEAT = 15.0
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"File d'estimation pleine, réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+class GenerationJob:
+    """Une demande de génération et l'historique de ses événements (rejoué aux abonnés tardifs)"""
+
+    def __init__(self, key: str, text: str):
+        self.key = key
+        self.text = text
+        self.events: List[Tuple[str, Dict]] = []
+        self.done = False
+        self.result: Optional[Dict] = None
+        self.source = "model"
+        self.error: Optional[Exception] = None
+        self.batchable = True
+        self._changed = asyncio.Event()
+
+    @classmethod
+    def completed(cls, key: str, text: str, result: Dict, source: str) -> "GenerationJob":
+        job = cls(key, text)
+        job.finish(result, source)
+        return job
+
+    def publish(self, event: str, data: Dict):
+        self.events.append((event, data))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def finish(self, result: Dict, source: str = "model"):
+        self.result, self.source = result, source
+        self.done = True
+        self.publish("result", {**result, "source": source})
+
+    def fail(self, error: Exception):
+        self.error = error
+        self.done = True
+        self.publish("error", {"detail": str(error)})
+
+    async def stream(self, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Tuple[str, Dict]]]:
+        """Événements depuis le début ; None toutes les `heartbeat` secondes sans nouvel événement"""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def wait(self) -> Dict:
+        async for _ in self.stream():
+            pass
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def sse_events(job: GenerationJob) -> AsyncIterator[bytes]:
+    async for item in job.stream(heartbeat=SSE_HEARTBEAT):
+        if item is None:
+            yield b": ping\n\n"
+            continue
+        event, data = item
+        yield b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+class GenerationScheduler:
+    """
+    backend : objet exposant `async stream(prompt)` (itérateur de jetons) ;
+    render(textes) -> prompt ; parse(réponse, nombre) -> un résultat par texte ;
+    on_result(job, résultat) est appelé une fois par demande générée (mise en cache).
+    """
+
+    def __init__(
+        self,
+        backend,
+        render: Callable[[List[str]], str],
+        parse: Callable[[str, int], List[Dict]],
+        on_result: Callable[[GenerationJob, Dict], Awaitable[None]],
+        workers: int = LLM_WORKERS,
+        queue_limit: int = LLM_QUEUE_LIMIT,
+        batch_size: int = LLM_BATCH_SIZE,
+        batch_max_chars: int = LLM_BATCH_MAX_CHARS,
+        batch_window: float = LLM_BATCH_WINDOW,
+    ):
+        self.backend = backend
+        self.render = render
+        self.parse = parse
+        self.on_result = on_result
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self.batch_size = max(1, batch_size)
+        self.batch_max_chars = batch_max_chars
+        self.batch_window = batch_window
+        self.running = 0
+        # Durée moyenne (mobile) d'une génération, pour estimer Retry-After
+        self.average_duration = 5.0
+        self._pending: Deque[GenerationJob] = deque()
+        self._inflight: Dict[str, GenerationJob] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, key: str, text: str) -> GenerationJob:
+        job = self._inflight.get(key)
+        if job is not None:
+            LLM_JOBS.labels("coalesced").inc()
+            return job
+        if len(self._pending) >= self.queue_limit:
+            LLM_JOBS.labels("rejected").inc()
+            raise QueueFull(self.retry_after())
+        self._start_workers()
+        job = GenerationJob(key, text)
+        self._inflight[key] = job
+        self._pending.append(job)
+        job.publish("queued", {"position": len(self._pending), "running": self.running})
+        self._wakeup.set()
+        return job
+
+    def retry_after(self) -> int:
+        backlog = len(self._pending) + self.running
+        return max(1, math.ceil(self.average_duration * backlog / self.workers))
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "running": self.running, "inflight": len(self._inflight)}
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _start_workers(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _short(self, job: GenerationJob) -> bool:
+        return job.batchable and len(job.text) <= self.batch_max_chars
+
+    async def _worker(self):
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            batch = await self._take_batch()
+            self.running += 1
+            try:
+                await self._run(batch)
+            finally:
+                self.running -= 1
+                for job in batch:
+                    if job.done:
+                        self._inflight.pop(job.key, None)
+
+    async def _take_batch(self) -> List[GenerationJob]:
+        batch = [self._pending.popleft()]
+        if self.batch_size == 1 or not self._short(batch[0]):
+            return batch
+        if sum(1 for job in self._pending if self._short(job)) < self.batch_size - 1 and self.batch_window > 0:
+            # Laisse une chance aux demandes qui arrivent en même temps
+            await asyncio.sleep(self.batch_window)
+        for job in list(self._pending):
+            if len(batch) >= self.batch_size:
+                break
+            if self._short(job):
+                self._pending.remove(job)
+                batch.append(job)
+        return batch
+
+    async def _run(self, batch: List[GenerationJob]):
+        for job in batch:
+            job.publish("started", {"batch": len(batch)})
+        chunks = []
+        start = time.perf_counter()
+        try:
+            async for token in self.backend.stream(self.render([job.text for job in batch])):
+                chunks.append(token)
+                for job in batch:
+                    if len(batch) == 1:
+                        job.publish("token", {"text": token})
+                    else:
+                        job.publish("progress", {"tokens": len(chunks)})
+        except Exception as e:
+            LLM_JOBS.labels("failed").inc(len(batch))
+            for job in batch:
+                job.fail(e)
+            return
+        elapsed = time.perf_counter() - start
+        ESTIMATE_MODEL_LATENCY.observe(elapsed)
+        self.average_duration = 0.8 * self.average_duration + 0.2 * elapsed
+        LLM_BATCH.observe(len(batch))
+
+        try:
+            results = self.parse("".join(chunks), len(batch))
+        except Exception as e:
+            if len(batch) > 1:
+                # Réponse groupée inexploitable : chaque demande repasse seule, en tête de file
+                for job in reversed(batch):
+                    job.batchable = False
+                    self._pending.appendleft(job)
+                self._wakeup.set()
+                return
+            LLM_JOBS.labels("failed").inc()
+            batch[0].fail(e)
+            return
+
+        LLM_JOBS.labels("generated").inc(len(batch))
+        for job, result in zip(batch, results):
+            try:
+                await self.on_result(job, result)
+            except Exception as e:
+                print(f"⚠️ Estimation non mise en cache : {e}")
+            job.finish(result)
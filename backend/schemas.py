@@ -1,7 +1,7 @@
 from fastapi_users import schemas
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class UserRead(schemas.BaseUser[int]):
     pass
@@ -36,10 +36,32 @@ class MealUpdate(MealBase):
     fiber: Optional[float] = None
     meal_type: Optional[str] = None
 
+class MealBulkUpdate(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)
+    changes: MealUpdate = MealUpdate()
+    # Décalage relatif des dates (ex. erreur de fuseau horaire), exclusif de changes.date
+    date_shift_minutes: Optional[int] = None
+
 class MealRead(MealBase):
     id: int
     user_id: int
     date: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Estimation par le modèle
+class MealEstimateRequest(BaseModel):
+    description: str = Field(min_length=1, max_length=500)
+
+class MealEstimate(BaseModel):
+    name: str
+    calories: float = Field(ge=0)
+    proteins: float = Field(0.0, ge=0)  # grammes
+    carbohydrates: float = Field(0.0, ge=0)  # grammes
+    fats: float = Field(0.0, ge=0)  # grammes
+    fiber: float = Field(0.0, ge=0)  # grammes
+
+class MealEstimateRead(MealEstimate):
+    description: str
+    source: str  # memory, database ou model
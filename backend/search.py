@@ -0,0 +1,222 @@
+"""
+Recherche de repas par nom et description (préfixe et correspondance approchée).
+
+- Postgres avec pg_trgm : index GIN trigrammes sur lower(name) et
+  lower(description) (migration 3) ; préfixe, sous-chaîne et similarité de mots
+  (opérateur %>) sont servis par ces index.
+- Sinon (SQLite, extension absente) : index en mémoire par utilisateur, construit
+  à la première recherche puis tenu à jour à chaque écriture de repas. Préfixe
+  par dichotomie sur le vocabulaire trié, mots approchés par trigrammes.
+Dans les deux cas, une correspondance sur le nom compte plus que sur la description.
+"""
+import os
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import case, func, literal, literal_column, or_, select, text
+
+from db import SessionLocal, engine
+from models import Meal
+from normalize import words
+from serialization import meal_read_query
+
+# Utilisateurs dont l'index est gardé en mémoire (repli hors pg_trgm)
+SEARCH_INDEX_USERS = int(os.getenv("SEARCH_INDEX_USERS", "64"))
+# Similarité minimale (trigrammes) pour une correspondance approchée
+FUZZY_THRESHOLD = 0.4
+DESCRIPTION_WEIGHT = 0.5
+
+_trigram_available: Optional[bool] = None
+
+
+async def trigram_available() -> bool:
+    """pg_trgm est-il installé ? (vérifié une fois par processus)"""
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = False
+        if engine.dialect.name == "postgresql":
+            async with SessionLocal() as session:
+                _trigram_available = bool(
+                    await session.scalar(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+                )
+    return _trigram_available
+
+
+def trigram_search_query(user_id: int, q: str, limit: int):
+    """Recherche Postgres (index trigrammes), meilleures correspondances puis plus récentes"""
+    pattern = " ".join(q.lower().split())
+    name = func.lower(Meal.name)
+    # Même expression que l'index ix_meal_description_trgm
+    description = func.lower(func.coalesce(Meal.description, literal_column("''")))
+    score = func.greatest(
+        case((name.startswith(pattern, autoescape=True), 1.0), else_=0.0),
+        func.word_similarity(pattern, name),
+        DESCRIPTION_WEIGHT * func.word_similarity(pattern, description),
+    )
+    return (
+        meal_read_query()
+        .where(
+            Meal.user_id == user_id,
+            or_(
+                name.contains(pattern, autoescape=True),
+                name.op("%>")(literal(pattern)),
+                description.contains(pattern, autoescape=True),
+                description.op("%>")(literal(pattern)),
+            ),
+        )
+        .order_by(score.desc(), Meal.date.desc(), Meal.id.desc())
+        .limit(limit)
+    )
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class UserSearchIndex:
+    """Index inversé des repas d'un utilisateur : mot normalisé -> identifiants"""
+
+    def __init__(self):
+        self._fields: Dict[int, Tuple[Set[str], Set[str]]] = {}  # id -> (mots du nom, de la description)
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: Optional[List[str]] = None  # trié, reconstruit après modification
+        self._trigrams: Dict[str, Set[str]] = {}
+
+    def add(self, meal_id: int, name: Optional[str], description: Optional[str]):
+        self.remove(meal_id)
+        name_words, description_words = set(words(name)), set(words(description))
+        self._fields[meal_id] = (name_words, description_words)
+        for word in name_words | description_words:
+            if word not in self._postings:
+                self._postings[word] = set()
+                self._vocabulary = None
+            self._postings[word].add(meal_id)
+
+    def remove(self, meal_id: int):
+        fields = self._fields.pop(meal_id, None)
+        if fields is None:
+            return
+        for word in fields[0] | fields[1]:
+            ids = self._postings.get(word)
+            if ids is not None:
+                ids.discard(meal_id)
+                if not ids:
+                    del self._postings[word]
+                    self._trigrams.pop(word, None)
+                    self._vocabulary = None
+
+    def _matches(self, term: str) -> Dict[str, float]:
+        """Mots de l'index correspondant à un terme : exact 1, préfixe 0,8, approché ≤ 0,6"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        matches = {}
+        index = bisect_left(vocabulary, term)
+        while index < len(vocabulary) and vocabulary[index].startswith(term):
+            word = vocabulary[index]
+            matches[word] = 1.0 if word == term else 0.8
+            index += 1
+        if matches or len(term) < 3:
+            return matches
+        term_trigrams = trigrams(term)
+        for word in vocabulary:
+            if word not in self._trigrams:
+                self._trigrams[word] = trigrams(word)
+            score = similarity(term_trigrams, self._trigrams[word])
+            if score >= FUZZY_THRESHOLD:
+                matches[word] = 0.6 * score
+        return matches
+
+    def search(self, q: str, limit: int) -> List[int]:
+        """Identifiants des repas contenant tous les termes, par pertinence puis du plus récent"""
+        terms = words(q)
+        if not terms:
+            return []
+        scores: Optional[Dict[int, float]] = None
+        for term in terms:
+            term_scores: Dict[int, float] = {}
+            for word, weight in self._matches(term).items():
+                for meal_id in self._postings[word]:
+                    name_words, _ = self._fields[meal_id]
+                    score = weight if word in name_words else weight * DESCRIPTION_WEIGHT
+                    if score > term_scores.get(meal_id, 0.0):
+                        term_scores[meal_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {meal_id: scores[meal_id] + score for meal_id, score in term_scores.items() if meal_id in scores}
+            if not scores:
+                return []
+        # Identifiants croissants dans le temps : à pertinence égale, les plus récents d'abord
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [meal_id for meal_id, _ in ranked[:limit]]
+
+    def __len__(self):
+        return len(self._fields)
+
+
+class SearchIndexRegistry:
+    """Index en mémoire des derniers utilisateurs ayant cherché (LRU)"""
+
+    def __init__(self, max_users: int = SEARCH_INDEX_USERS):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[int, UserSearchIndex]" = OrderedDict()
+
+    async def get(self, user_id: int) -> UserSearchIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+        index = UserSearchIndex()
+        async with SessionLocal() as session:
+            result = await session.stream(
+                select(Meal.id, Meal.name, Meal.description).where(Meal.user_id == user_id)
+            )
+            async for meal_id, name, description in result:
+                index.add(meal_id, name, description)
+        self._indexes[user_id] = index
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+        return index
+
+    # Mises à jour après écriture : sans effet si l'index de l'utilisateur n'est pas chargé
+
+    def meals_added(self, user_id: int, meals: Iterable[Tuple[int, Optional[str], Optional[str]]]):
+        index = self._indexes.get(user_id)
+        if index is not None:
+            for meal_id, name, description in meals:
+                index.add(meal_id, name, description)
+
+    def meal_removed(self, user_id: int, meal_id: int):
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.remove(meal_id)
+
+    def invalidate_user(self, user_id: int):
+        self._indexes.pop(user_id, None)
+
+    def clear(self):
+        self._indexes.clear()
+
+
+search_indexes = SearchIndexRegistry()
+
+
+async def search_meals(user_id: int, q: str, limit: int) -> List:
+    """Lignes MealRead (voir serialization.py) des repas correspondant à la recherche"""
+    if await trigram_available():
+        async with SessionLocal() as session:
+            return (await session.execute(trigram_search_query(user_id, q, limit))).all()
+    ids = (await search_indexes.get(user_id)).search(q, limit)
+    if not ids:
+        return []
+    async with SessionLocal() as session:
+        rows = (await session.execute(meal_read_query().where(Meal.user_id == user_id, Meal.id.in_(ids)))).all()
+    rank = {meal_id: position for position, meal_id in enumerate(ids)}
+    return sorted(rows, key=lambda row: rank[row.id])
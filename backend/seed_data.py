@@ -1,70 +1,94 @@
 #!/usr/bin/env python3
 """
-Script pour insérer des données de test dans la base de données
+Générateur de données de test, de la démo au dimensionnement.
+
+    python seed_data.py                                   # démo : test@example.com, 33 jours
+    python seed_data.py --users 5000 --days 1095 --skew 0.8 --workers 4
+
+Les utilisateurs sont créés par le processus principal (un seul hachage du mot
+de passe commun), puis répartis par paquets entre des processus : chacun génère
+les repas de ses utilisateurs avec un générateur aléatoire propre à chaque
+utilisateur (résultat identique quel que soit le nombre de processus), les
+charge par lots (COPY sur Postgres, INSERT multi-lignes sur SQLite) et
+recalcule leurs cumuls (daily_totals, frequent_foods).
+Les utilisateurs générés existants (même e-mail) sont d'abord supprimés avec
+toutes leurs données.
 """
+import argparse
 import asyncio
+import csv
+import io
 import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import User, Meal
-from db import sync_engine
-from passlib.context import CryptContext
-
-# Configuration pour le hashage des mots de passe
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def generate_random_meal_data(meal_type):
-    """Génère des données de repas aléatoires mais réalistes pour un type donné"""
-    meal_names = {
-        "breakfast": ["Petit déjeuner", "Breakfast", "Déjeuner matinal"],
-        "lunch": ["Déjeuner", "Lunch", "Repas de midi"],
-        "dinner": ["Dîner", "Dinner", "Repas du soir"]
-    }
-    meal_descriptions = {
-        "breakfast": [
-            "Yaourt grec + fruits", "Omelette + avocat + toast", "Céréales + lait + banane",
-            "Shake protéiné + flocons d'avoine", "Thé + biscottes + confiture",
-            "Pancakes + sirop d'érable + bacon", "Pain au chocolat + café au lait",
-            "Smoothie bowl + granola", "Tartines + beurre + confiture", "Œufs brouillés + saumon"
-        ],
-        "lunch": [
-            "Poulet grillé + riz + légumes", "Burger + frites", "Salade composée + lentilles",
-            "Pâtes carbonara + salade", "Poisson blanc + riz basmati + légumes",
-            "Pizza margherita + soda", "Salade niçoise + baguette", "Quiche lorraine + salade",
-            "Sushi + soupe miso", "Tacos + guacamole", "Risotto aux champignons"
-        ],
-        "dinner": [
-            "Soupe de légumes + pain complet", "Saumon + quinoa + brocoli", "Smoothie protéiné + noix",
-            "Steak + pommes de terre + haricots", "Curry de légumes + riz complet",
-            "Soupe miso + sushi", "Lasagnes + salade verte", "Poulet rôti + légumes",
-            "Pâtes aux fruits de mer", "Salade composée + fromage", "Soupe à l'oignon + croûtons"
-        ]
-    }
-    
-    name = random.choice(meal_names[meal_type])
-    description = random.choice(meal_descriptions[meal_type])
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+MEAL_TYPES = ["breakfast", "lunch", "dinner"]
+# Heure de début de chaque type de repas (UTC) ; les minutes sont tirées au hasard
+MEAL_HOURS = {"breakfast": 7, "lunch": 12, "dinner": 19}
+MEAL_COLUMNS = [
+    "user_id", "name", "description", "calories", "proteins", "carbohydrates", "fats", "fiber",
+    "meal_type", "date", "updated_at", "change_seq",
+]
+# Utilisateurs par tâche confiée à un processus
+USERS_PER_TASK = 20
+# Adresses supprimées par requête lors du nettoyage
+DELETE_CHUNK = 500
+
+MEAL_NAMES = {
+    "breakfast": ["Petit déjeuner", "Breakfast", "Déjeuner matinal"],
+    "lunch": ["Déjeuner", "Lunch", "Repas de midi"],
+    "dinner": ["Dîner", "Dinner", "Repas du soir"]
+}
+MEAL_DESCRIPTIONS = {
+    "breakfast": [
+        "Yaourt grec + fruits", "Omelette + avocat + toast", "Céréales + lait + banane",
+        "Shake protéiné + flocons d'avoine", "Thé + biscottes + confiture",
+        "Pancakes + sirop d'érable + bacon", "Pain au chocolat + café au lait",
+        "Smoothie bowl + granola", "Tartines + beurre + confiture", "Œufs brouillés + saumon"
+    ],
+    "lunch": [
+        "Poulet grillé + riz + légumes", "Burger + frites", "Salade composée + lentilles",
+        "Pâtes carbonara + salade", "Poisson blanc + riz basmati + légumes",
+        "Pizza margherita + soda", "Salade niçoise + baguette", "Quiche lorraine + salade",
+        "Sushi + soupe miso", "Tacos + guacamole", "Risotto aux champignons"
+    ],
+    "dinner": [
+        "Soupe de légumes + pain complet", "Saumon + quinoa + brocoli", "Smoothie protéiné + noix",
+        "Steak + pommes de terre + haricots", "Curry de légumes + riz complet",
+        "Soupe miso + sushi", "Lasagnes + salade verte", "Poulet rôti + légumes",
+        "Pâtes aux fruits de mer", "Salade composée + fromage", "Soupe à l'oignon + croûtons"
+    ]
+}
+
+
+def generate_random_meal_data(meal_type, rng=random):
+    """Génère des données de repas aléatoires mais réalistes pour un type donné (rng : générateur à utiliser)"""
+    name = rng.choice(MEAL_NAMES[meal_type])
+    description = rng.choice(MEAL_DESCRIPTIONS[meal_type])
     
     # Générer des macros réalistes selon le type de repas
     if meal_type == "breakfast":
-        calories = random.randint(250, 600)
-        proteins = random.randint(15, 40)
-        carbohydrates = random.randint(30, 80)
-        fats = random.randint(8, 35)
-        fiber = random.randint(5, 15)
+        calories = rng.randint(250, 600)
+        proteins = rng.randint(15, 40)
+        carbohydrates = rng.randint(30, 80)
+        fats = rng.randint(8, 35)
+        fiber = rng.randint(5, 15)
     elif meal_type == "lunch":
-        calories = random.randint(450, 850)
-        proteins = random.randint(25, 55)
-        carbohydrates = random.randint(50, 100)
-        fats = random.randint(15, 45)
-        fiber = random.randint(8, 25)
+        calories = rng.randint(450, 850)
+        proteins = rng.randint(25, 55)
+        carbohydrates = rng.randint(50, 100)
+        fats = rng.randint(15, 45)
+        fiber = rng.randint(8, 25)
     else:  # dinner
-        calories = random.randint(350, 700)
-        proteins = random.randint(20, 50)
-        carbohydrates = random.randint(40, 80)
-        fats = random.randint(10, 35)
-        fiber = random.randint(8, 22)
+        calories = rng.randint(350, 700)
+        proteins = rng.randint(20, 50)
+        carbohydrates = rng.randint(40, 80)
+        fats = rng.randint(10, 35)
+        fiber = rng.randint(8, 22)
     
     return {
         "name": name,
@@ -77,116 +101,210 @@ def generate_random_meal_data(meal_type):
         "meal_type": meal_type
     }
 
-async def create_test_user():
-    """Créer un utilisateur de test"""
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
-    session = SessionLocal()
-    
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str
+    days: int
+    meals_per_day: int
+    skew: float
+    seed: int
+    batch_size: int
+    end: datetime
+
+
+def sync_database_url(url: str) -> str:
+    """URL synchrone (psycopg2 / sqlite3) correspondant à DATABASE_URL"""
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url)
+    driver = "postgresql+psycopg2" if url.get_backend_name() == "postgresql" else "sqlite"
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def user_email(prefix: str, domain: str, rank: int) -> str:
+    # Le premier utilisateur garde l'adresse de démo (test@example.com)
+    return f"{prefix}@{domain}" if rank == 0 else f"{prefix}{rank}@{domain}"
+
+
+def history_days(settings: Settings, rank: int) -> int:
+    """Historique du rang `rank` : loi de Zipf d'exposant skew (0 = tous identiques)"""
+    return max(1, round(settings.days * (rank + 1) ** -settings.skew))
+
+
+def generate_user_meals(settings: Settings, user_id: int, rank: int) -> Iterator[Dict]:
+    """Repas d'un utilisateur, déterministes pour (seed, rang)"""
+    rng = random.Random(f"{settings.seed}-{rank}")
+    days = history_days(settings, rank)
+    first_day = (settings.end - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in range(days):
+        midnight = first_day + timedelta(days=day)
+        for slot in range(settings.meals_per_day):
+            meal_type = MEAL_TYPES[slot % len(MEAL_TYPES)]
+            # Au-delà de trois repas par jour, les suivants sont décalés de deux heures
+            hour = MEAL_HOURS[meal_type] + 2 * (slot // len(MEAL_TYPES))
+            meal_date = midnight + timedelta(hours=hour, minutes=rng.randrange(60))
+            yield {
+                **generate_random_meal_data(meal_type, rng),
+                "user_id": user_id, "date": meal_date, "updated_at": meal_date, "change_seq": 0,
+            }
+
+
+def batches(rows: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_meals(conn, rows: Sequence[Dict]):
+    """COPY ... FROM STDIN (Postgres) : le chargement le plus rapide, sans paramètres liés"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in MEAL_COLUMNS])
+    buffer.seek(0)
+    cursor = conn.connection.driver_connection.cursor()
     try:
-        # Supprimer l'ancien utilisateur de test s'il existe
-        existing_user = session.query(User).filter(User.email == "test@example.com").first()
-        if existing_user:
-            print(f"🗑️ Suppression de l'ancien utilisateur de test (ID: {existing_user.id})")
-            session.delete(existing_user)
-            session.commit()
-        
-        # Créer un nouvel utilisateur de test avec le bon mot de passe hashé
-        hashed_password = pwd_context.hash("test123")
-        test_user = User(
-            email="test@example.com",
-            hashed_password=hashed_password,
-            is_active=True,
-            is_superuser=False,
-            is_verified=True
-        )
-        session.add(test_user)
-        session.commit()
-        session.refresh(test_user)
-        print(f"✅ Utilisateur de test créé (ID: {test_user.id})")
-        print(f"📧 Email: test@example.com")
-        print(f"🔑 Mot de passe: test123")
-        return test_user.id
-        
-    except Exception as e:
-        print(f"❌ Erreur lors de la création de l'utilisateur: {e}")
-        session.rollback()
-        return None
+        cursor.copy_expert(f"COPY meal ({', '.join(MEAL_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
     finally:
-        session.close()
+        cursor.close()
 
-async def insert_test_meals(user_id: int):
-    """Insérer les repas de test pour 33 jours"""
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
-    session = SessionLocal()
-    
+
+def load_users(settings: Settings, users: Sequence[Tuple[int, int]]) -> int:
+    """Génère et charge les repas de (user_id, rang) ; exécuté dans un processus de travail"""
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.pool import NullPool
+
+    from foods import rebuild_frequent_foods
+    from models import Meal
+    from rollup import rebuild_daily_totals
+
+    engine = create_engine(settings.database_url, poolclass=NullPool)
+    total = 0
     try:
-        # Supprimer les anciens repas de test pour cet utilisateur
-        existing_meals = session.query(Meal).filter(Meal.user_id == user_id).all()
-        if existing_meals:
-            print(f"🗑️ Suppression de {len(existing_meals)} anciens repas de test")
-            for meal in existing_meals:
-                session.delete(meal)
-            session.commit()
-        
-        # Créer les repas sur les 33 derniers jours
-        base_date = datetime.now() - timedelta(days=33)
-        total_meals = 0
-        
-        print(f"📅 Génération des repas du {base_date.strftime('%d/%m/%Y')} au {datetime.now().strftime('%d/%m/%Y')}")
-        
-        for day in range(33):
-            meal_date = base_date + timedelta(days=day)
-            day_meals = 0
-            
-            # Générer 3 repas par jour (petit déjeuner, déjeuner, dîner)
-            for meal_type in ["breakfast", "lunch", "dinner"]:
-                meal_data = generate_random_meal_data(meal_type)
-                
-                meal = Meal(
-                    user_id=user_id,
-                    name=meal_data["name"],
-                    description=meal_data["description"],
-                    calories=meal_data["calories"],
-                    proteins=meal_data["proteins"],
-                    carbohydrates=meal_data["carbohydrates"],
-                    fats=meal_data["fats"],
-                    fiber=meal_data["fiber"],
-                    meal_type=meal_data["meal_type"],
-                    date=meal_date
-                )
-                session.add(meal)
-                total_meals += 1
-                day_meals += 1
-            
-            if day % 10 == 0:  # Log tous les 10 jours
-                print(f"   Jour {day + 1}: {day_meals} repas générés")
-        
-        session.commit()
-        print(f"✅ {total_meals} repas de test insérés avec succès (33 jours × 3 repas)")
-        print(f"📅 Période: du {base_date.strftime('%d/%m/%Y')} au {datetime.now().strftime('%d/%m/%Y')}")
-        
-    except Exception as e:
-        print(f"❌ Erreur lors de l'insertion des repas: {e}")
-        session.rollback()
+        with engine.begin() as conn:
+            postgres = conn.dialect.name == "postgresql"
+            for user_id, rank in users:
+                for batch in batches(generate_user_meals(settings, user_id, rank), settings.batch_size):
+                    if postgres:
+                        copy_meals(conn, batch)
+                    else:
+                        conn.execute(insert(Meal), batch)
+                    total += len(batch)
+                rebuild_daily_totals(conn, user_id)
+                rebuild_frequent_foods(conn, user_id)
     finally:
-        session.close()
+        engine.dispose()
+    return total
+
+
+def delete_users(conn, emails: Sequence[str]) -> int:
+    """Supprime les utilisateurs (et toutes leurs données) par requêtes groupées"""
+    from sqlalchemy import delete, select
+
+    from models import DailyTotal, DataVersion, FrequentFood, Meal, MealTombstone, User
+
+    deleted = 0
+    for start in range(0, len(emails), DELETE_CHUNK):
+        ids = conn.execute(select(User.id).where(User.email.in_(emails[start:start + DELETE_CHUNK]))).scalars().all()
+        if not ids:
+            continue
+        for model in (Meal, DailyTotal, FrequentFood, DataVersion, MealTombstone):
+            conn.execute(delete(model).where(model.user_id.in_(ids)))
+        deleted += conn.execute(delete(User).where(User.id.in_(ids))).rowcount
+    return deleted
+
+
+def create_users(conn, emails: Sequence[str], hashed_password: str) -> List[int]:
+    from sqlalchemy import insert
+
+    from models import User
+
+    rows = [
+        {"email": email, "hashed_password": hashed_password, "is_active": True, "is_superuser": False, "is_verified": True}
+        for email in emails
+    ]
+    result = conn.execute(insert(User).returning(User.id, sort_by_parameter_order=True), rows)
+    return result.scalars().all()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Génération de données de test CalorieTrack")
+    parser.add_argument("--users", type=int, default=1, help="Utilisateurs générés")
+    parser.add_argument("--days", type=int, default=33, help="Jours d'historique de l'utilisateur le plus actif")
+    parser.add_argument("--meals-per-day", type=int, default=3)
+    parser.add_argument("--skew", type=float, default=0.0,
+                        help="Répartition de l'historique entre utilisateurs (0 = uniforme, 1 = Zipf)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processus de chargement")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Repas par lot chargé")
+    parser.add_argument("--prefix", default="test", help="Préfixe des adresses e-mail générées")
+    parser.add_argument("--domain", default="example.com")
+    parser.add_argument("--password", default="test123", help="Mot de passe commun des utilisateurs générés")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from sqlalchemy import create_engine
+
+    from db import DATABASE_URL, engine as async_engine
+    from migrations import migrate
+    from passwords import password_pool
+
+    print("🌱 Début de la génération des données de test...")
+    asyncio.run(migrate(async_engine))
+
+    settings = Settings(
+        database_url=sync_database_url(DATABASE_URL),
+        days=args.days,
+        meals_per_day=args.meals_per_day,
+        skew=args.skew,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        end=datetime.utcnow(),
+    )
+    expected = sum(history_days(settings, rank) for rank in range(args.users)) * args.meals_per_day
+    print(f"📅 {args.users} utilisateurs, jusqu'à {args.days} jours, {args.meals_per_day} repas par jour : {expected} repas")
+
+    # Un seul hachage (coûteux) pour tous les utilisateurs : même mot de passe
+    hashed_password = password_pool.hash(args.password)
+    emails = [user_email(args.prefix, args.domain, rank) for rank in range(args.users)]
+    engine = create_engine(settings.database_url)
+    with engine.begin() as conn:
+        deleted = delete_users(conn, emails)
+        if deleted:
+            print(f"🗑️ Suppression de {deleted} anciens utilisateurs de test et de leurs repas")
+        user_ids = create_users(conn, emails, hashed_password)
+        # SQLite n'accepte qu'un écrivain à la fois
+        workers = 1 if conn.dialect.name == "sqlite" else max(1, args.workers)
+    engine.dispose()
+
+    users = list(zip(user_ids, range(args.users)))
+    tasks = [users[start:start + USERS_PER_TASK] for start in range(0, len(users), USERS_PER_TASK)]
+    started = time.perf_counter()
+    loaded = 0
+    if workers == 1:
+        for task in tasks:
+            loaded += load_users(settings, task)
+            print(f"   {loaded}/{expected} repas")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(load_users, settings, task) for task in tasks]
+            for future in as_completed(futures):
+                loaded += future.result()
+                print(f"   {loaded}/{expected} repas")
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ {loaded} repas insérés en {elapsed:.1f} s ({loaded / max(elapsed, 1e-9):.0f} repas/s, {workers} processus)")
+    print(f"📧 Email de test: {emails[0]}")
+    print(f"🔑 Mot de passe: {args.password}")
 
-async def main():
-    """Fonction principale"""
-    print("🌱 Début de l'insertion des données de test...")
-    
-    # Créer l'utilisateur de test
-    user_id = await create_test_user()
-    if not user_id:
-        print("❌ Impossible de créer l'utilisateur de test")
-        return
-    
-    # Insérer les repas de test
-    await insert_test_meals(user_id)
-    
-    print("🎉 Insertion des données de test terminée !")
-    print(f"📧 Email de test: test@example.com")
-    print(f"🔑 Mot de passe: test123")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    main()
@@ -0,0 +1,65 @@
+"""
+Sérialisation rapide des listes de repas.
+
+Plutôt que de charger des objets ORM puis de construire un MealRead par ligne,
+on sélectionne directement les colonnes de MealRead et on encode les lignes en
+octets avec orjson (dates comprises). La correspondance colonnes / schéma
+MealRead est vérifiée une seule fois, à l'import du module.
+"""
+import typing
+from datetime import datetime
+from typing import AsyncIterator, Iterable
+
+import orjson
+from sqlalchemy import select
+
+from models import Meal
+from schemas import MealRead
+
+# Champs de MealRead, dans l'ordre du schéma (même JSON que la réponse pydantic)
+MEAL_READ_FIELDS = tuple(MealRead.model_fields)
+
+_PYTHON_TYPES = {float: (float, int), int: (int,), str: (str,), datetime: (datetime,)}
+
+
+def check_meal_read_schema():
+    """Vérifie que chaque champ de MealRead correspond à une colonne de meal de type compatible"""
+    table = Meal.__table__
+    for name, field in MealRead.model_fields.items():
+        if name not in table.c:
+            raise RuntimeError(f"MealRead.{name} n'a pas de colonne correspondante dans meal")
+        column = table.c[name]
+        annotation = field.annotation
+        optional = type(None) in typing.get_args(annotation)
+        if optional:
+            annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+        if column.type.python_type not in _PYTHON_TYPES.get(annotation, (annotation,)):
+            raise RuntimeError(
+                f"MealRead.{name} ({annotation.__name__}) incompatible avec la colonne "
+                f"meal.{name} ({column.type.python_type.__name__})"
+            )
+        if column.nullable and not optional:
+            raise RuntimeError(f"meal.{name} peut être NULL mais MealRead.{name} ne l'accepte pas")
+
+
+check_meal_read_schema()
+
+
+def meal_read_query():
+    """SELECT des seules colonnes de MealRead (lignes brutes, pas d'objets ORM)"""
+    return select(*(Meal.__table__.c[name] for name in MEAL_READ_FIELDS))
+
+
+def encode_meals(rows: Iterable) -> bytes:
+    """Tableau JSON des repas"""
+    return orjson.dumps([dict(zip(MEAL_READ_FIELDS, row)) for row in rows])
+
+
+def encode_meals_ndjson(rows: Iterable) -> bytes:
+    """Un repas JSON par ligne"""
+    return b"".join(orjson.dumps(dict(zip(MEAL_READ_FIELDS, row)), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+async def ndjson_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    async for rows in partitions:
+        yield encode_meals_ndjson(rows)
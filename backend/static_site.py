@@ -0,0 +1,132 @@
+"""
+Service du frontend compilé (frontend/dist) depuis la mémoire.
+
+Au démarrage, chaque fichier est lu une fois : empreinte du contenu (ETag),
+variantes gzip et brotli précalculées (gardées si plus petites), en-têtes prêts.
+Une requête ne fait ensuite ni accès disque ni compression :
+- fichiers à empreinte de Vite (assets/index-3f9a1c2b.js), listés par le
+  manifeste du build (.vite/manifest.json) : Cache-Control immutable d'un an,
+  leur nom change à chaque build ;
+- index.html et autres fichiers : revalidés à chaque fois (If-None-Match -> 304) ;
+- toute autre route non API renvoie index.html (routage côté React).
+Les fichiers trop gros pour la mémoire sont servis depuis le disque.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from compression import MAX_LEVELS, available_encodings, compress, compressible, negotiate
+from versions import etag_matches
+
+# Fichiers gardés en mémoire jusqu'à cette taille (octets)
+STATIC_MAX_MEMORY_FILE = int(os.getenv("STATIC_MAX_MEMORY_FILE", str(4 * 1024 * 1024)))
+# En dessous, la compression ne vaut pas l'en-tête Content-Encoding
+STATIC_MIN_COMPRESS = 256
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Suffixe d'empreinte ajouté par Vite (nom-<hash de 8 caractères>.ext), si le manifeste manque
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+MANIFEST = ".vite/manifest.json"
+
+
+@dataclass
+class StaticFile:
+    path: str
+    content_type: str
+    etag: str
+    cache_control: str
+    # encodage ("identity", "gzip", "br") -> contenu ; vide si servi depuis le disque
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    def response(self, request: Request) -> Response:
+        encoding = negotiate(request.headers.get("accept-encoding"), [e for e in self.variants if e != "identity"])
+        # ETag fort propre à chaque représentation
+        etag = f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if not self.variants:
+            return FileResponse(self.path, media_type=self.content_type, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding or "identity"], media_type=self.content_type, headers=headers)
+
+
+def hashed_files(root: str) -> Optional[Set[str]]:
+    """Fichiers produits avec une empreinte d'après le manifeste de Vite ; None sans manifeste"""
+    try:
+        with open(os.path.join(root, MANIFEST), "rb") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    files = set()
+    for chunk in manifest.values():
+        files.add(chunk["file"])
+        files.update(chunk.get("css", ()))
+        files.update(chunk.get("assets", ()))
+    return files
+
+
+def load_file(path: str, relative: str, hashed: Optional[Set[str]] = None) -> StaticFile:
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if hashed is not None:
+        immutable = relative in hashed
+    else:
+        immutable = relative.startswith("assets/") and bool(HASHED_NAME.search(relative))
+    cache_control = IMMUTABLE if immutable else REVALIDATE
+    if os.path.getsize(path) > STATIC_MAX_MEMORY_FILE:
+        stat = os.stat(path)
+        return StaticFile(path, content_type, f"{stat.st_mtime_ns:x}-{stat.st_size:x}", cache_control)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    static_file = StaticFile(path, content_type, hashlib.sha256(data).hexdigest()[:20], cache_control, {"identity": data})
+    if compressible(content_type) and len(data) >= STATIC_MIN_COMPRESS:
+        for encoding in available_encodings():
+            compressed = compress(data, encoding, MAX_LEVELS[encoding])
+            if len(compressed) < len(data):
+                static_file.variants[encoding] = compressed
+    return static_file
+
+
+class StaticSite:
+    def __init__(self, root: str):
+        self.root = root
+        self.files: Dict[str, StaticFile] = {}
+
+    def scan(self) -> int:
+        """(Re)charge tous les fichiers de `root` ; retourne leur nombre"""
+        files = {}
+        hashed = hashed_files(self.root)
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if relative.startswith(".vite/"):
+                    # Métadonnées du build, pas servies
+                    continue
+                files[relative] = load_file(path, relative, hashed)
+        self.files = files
+        return len(files)
+
+    @property
+    def index(self) -> Optional[StaticFile]:
+        return self.files.get("index.html")
+
+    def lookup(self, path: str) -> Optional[StaticFile]:
+        """Fichier demandé, sinon index.html ; None pour un asset absent (pas de HTML à la place d'un script)"""
+        static_file = self.files.get(path.lstrip("/"))
+        if static_file is not None:
+            return static_file
+        if path.startswith(("assets/", "static/")):
+            return None
+        return self.index
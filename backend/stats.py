@@ -0,0 +1,149 @@
+"""
+Agrégations statistiques des repas calculées côté base de données
+"""
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import List, Sequence
+
+from sqlalchemy import Date, cast, func, literal_column, select
+
+from models import DailyTotal
+
+# Macros agrégeables (colonnes numériques de Meal)
+MACROS = ("calories", "proteins", "carbohydrates", "fats", "fiber")
+GRANULARITIES = ("day", "week", "month")
+# Intervalles au plus par requête /meals/stats/range (10 ans de jours)
+MAX_BUCKETS = 3660
+
+
+def bucket_expression(column, granularity: str, dialect_name: str):
+    """Expression SQL qui tronque une date au début de son intervalle (jour, semaine ISO, mois)"""
+    if dialect_name == "sqlite":
+        # SQLite n'a pas date_trunc : on passe par les modificateurs de date()
+        if granularity == "day":
+            return func.date(column)
+        if granularity == "week":
+            # Lundi de la semaine courante
+            return func.date(column, "weekday 0", "-6 days")
+        return func.date(column, "start of month")
+    # Littéral (valeur validée contre GRANULARITIES) pour que le GROUP BY
+    # reconnaisse la même expression que celle du SELECT
+    return cast(func.date_trunc(literal_column(f"'{granularity}'"), column), Date)
+
+
+def range_stats_query(
+    user_id: int,
+    start: date,
+    end: date,
+    granularity: str,
+    macros: Sequence[str],
+    dialect_name: str,
+):
+    """
+    Construit la requête des totaux par intervalle.
+
+    Le GROUP BY sur la table de cumul daily_totals (une ligne par jour) produit
+    un total par intervalle non vide, sans jamais ramener les repas en Python ;
+    range_stats_payload complète les intervalles vides et calcule les moyennes.
+    """
+    bucket = bucket_expression(DailyTotal.day, granularity, dialect_name).label("bucket")
+    totals = [func.sum(DailyTotal.meal_count).label("meal_count")]
+    for macro in macros:
+        totals.append(func.sum(getattr(DailyTotal, macro)).label(macro))
+
+    return (
+        select(bucket, *totals)
+        .where(DailyTotal.user_id == user_id)
+        .where(DailyTotal.day >= start)
+        .where(DailyTotal.day <= end)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+
+
+def all_time_query(user_id: int, end: date, macros: Sequence[str]):
+    """Premier jour saisi et totaux de tout l'historique jusqu'à `end` (daily_totals, une ligne)"""
+    return (
+        select(func.min(DailyTotal.day).label("first_day"), *(func.sum(getattr(DailyTotal, m)).label(m) for m in macros))
+        .where(DailyTotal.user_id == user_id)
+        .where(DailyTotal.day <= end)
+    )
+
+
+def all_time_averages(row, end: date, macros: Sequence[str]):
+    """Moyenne par jour depuis le premier repas, jours sans repas compris (comme range_stats_payload)"""
+    mapping = row._mapping
+    if mapping["first_day"] is None:
+        return {macro: 0.0 for macro in macros}
+    first_day = date.fromisoformat(format_bucket(mapping["first_day"]))
+    days = (end - first_day).days + 1
+    return {macro: float(mapping[macro] or 0) / days for macro in macros}
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    """Début de l'intervalle d'un jour, comme bucket_expression"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucket_count(start: date, end: date, granularity: str) -> int:
+    """Nombre d'intervalles de la période, sans les énumérer (comparé à MAX_BUCKETS)"""
+    if granularity == "week":
+        return (bucket_start(end, "week") - bucket_start(start, "week")).days // 7 + 1
+    if granularity == "month":
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days + 1
+
+
+def calendar_buckets(start: date, end: date, granularity: str) -> List[date]:
+    """Tous les intervalles de la période, y compris ceux sans repas"""
+    buckets, current = [], bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        if granularity == "day":
+            current += timedelta(days=1)
+        elif granularity == "week":
+            current += timedelta(weeks=1)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+    return buckets
+
+
+def format_bucket(value) -> str:
+    """Normalise la clé d'intervalle (date, datetime ou texte selon le dialecte) en YYYY-MM-DD"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()[:10]
+    return str(value)[:10]
+
+
+def range_stats_payload(rows, macros: Sequence[str], start: date, end: date, granularity: str, window: int):
+    """
+    Met en forme les lignes de range_stats_query pour la réponse JSON.
+
+    Les intervalles sans repas sont ajoutés à zéro avant le calcul : la moyenne
+    glissante couvre toujours `window` intervalles du calendrier (7 jours, pas
+    7 jours saisis) et la moyenne de la période porte sur tous ses intervalles.
+    """
+    found = {format_bucket(row._mapping["bucket"]): row._mapping for row in rows}
+    buckets = []
+    sums = {macro: 0.0 for macro in macros}
+    recent = deque()
+    for bucket in calendar_buckets(start, end, granularity):
+        mapping = found.get(bucket.isoformat())
+        totals = {macro: float(mapping[macro] or 0) if mapping else 0.0 for macro in macros}
+        recent.append(totals)
+        if len(recent) > window:
+            recent.popleft()
+        for macro in macros:
+            sums[macro] += totals[macro]
+        buckets.append({
+            "bucket": bucket.isoformat(),
+            "meal_count": mapping["meal_count"] if mapping else 0,
+            "totals": totals,
+            "rolling_avg": {macro: sum(t[macro] for t in recent) / len(recent) for macro in macros},
+        })
+    averages = {macro: sums[macro] / len(buckets) if buckets else 0.0 for macro in macros}
+    return buckets, averages
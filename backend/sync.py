@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Synchronisation incrémentale des repas (clients hors ligne).
+
+La version des données de l'utilisateur (data_versions, voir versions.py) sert
+de numéro de changement : chaque écriture l'incrémente et inscrit la nouvelle
+valeur dans meal.change_seq des repas créés ou modifiés, ou dans une pierre
+tombale (meal_tombstones) pour les repas supprimés. Un client garde la version
+reçue lors de sa dernière synchronisation et ne demande ensuite que ce qui a
+changé depuis (/meals/changes?since=<version>).
+
+Les pierres tombales plus anciennes que TOMBSTONE_RETENTION_DAYS sont purgées ;
+data_versions.compacted_seq retient la plus haute version purgée. Un client plus
+ancien que cette version a pu manquer des suppressions : il reçoit alors
+l'ensemble de ses repas avec reset=true et remplace ses données locales.
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, exists, func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import DataVersion, Meal, MealTombstone
+from rollup import dialect_insert
+from serialization import MEAL_READ_FIELDS, meal_read_query
+
+# Durée de conservation des suppressions (jours)
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "90"))
+# Intervalle entre deux purges automatiques (heures)
+TOMBSTONE_COMPACT_INTERVAL = float(os.getenv("TOMBSTONE_COMPACT_INTERVAL", "24"))
+
+
+async def record_tombstones(session: AsyncSession, user_id: int, meal_ids: Iterable[int], change_seq: int):
+    rows = [{"meal_id": meal_id, "user_id": user_id, "change_seq": change_seq} for meal_id in meal_ids]
+    if not rows:
+        return
+    insert = dialect_insert(session.bind.dialect.name)
+    stmt = insert(MealTombstone)
+    # SQLite peut réutiliser l'identifiant d'un repas supprimé
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MealTombstone.meal_id],
+        set_={"user_id": stmt.excluded.user_id, "change_seq": stmt.excluded.change_seq, "deleted_at": datetime.utcnow()},
+    )
+    await session.execute(stmt, rows)
+
+
+async def changes_since(session: AsyncSession, user_id: int, since: int) -> Dict:
+    """
+    Repas créés ou modifiés et identifiants supprimés après la version `since`.
+    `version` est à renvoyer comme `since` à la synchronisation suivante.
+    """
+    # Version lue avant les repas : une écriture concurrente sera au pire renvoyée deux fois
+    state = (await session.execute(
+        select(DataVersion.version, DataVersion.compacted_seq).where(DataVersion.user_id == user_id)
+    )).first()
+    version, compacted_seq = state if state else (0, 0)
+    reset = since > version or 0 < since < compacted_seq
+    if reset:
+        since = 0
+    elif since and since == version:
+        return {"since": since, "version": version, "reset": False, "meals": [], "deleted": []}
+
+    query = meal_read_query().where(Meal.user_id == user_id)
+    if since:
+        query = query.where(Meal.change_seq > since)
+    meals = [dict(zip(MEAL_READ_FIELDS, row)) for row in await session.execute(query.order_by(Meal.change_seq, Meal.id))]
+
+    deleted = []
+    if since:
+        live = {meal["id"] for meal in meals}
+        deleted = [
+            meal_id
+            for meal_id in (await session.execute(
+                select(MealTombstone.meal_id)
+                .where(MealTombstone.user_id == user_id, MealTombstone.change_seq > since)
+                .order_by(MealTombstone.change_seq, MealTombstone.meal_id)
+            )).scalars()
+            if meal_id not in live
+        ]
+    return {"since": since, "version": version, "reset": reset, "meals": meals, "deleted": deleted}
+
+
+def compact_tombstones(conn: Connection, older_than: Optional[timedelta] = None) -> int:
+    """Purge les pierres tombales anciennes ; retourne le nombre de lignes supprimées"""
+    cutoff = datetime.utcnow() - (older_than if older_than is not None else timedelta(days=TOMBSTONE_RETENTION_DAYS))
+    expired = (MealTombstone.user_id == DataVersion.user_id, MealTombstone.deleted_at < cutoff)
+    # Les versions croissent avec le temps : la plus haute purgée dépasse les précédentes
+    conn.execute(
+        update(DataVersion)
+        .where(exists().where(*expired))
+        .values(compacted_seq=select(func.max(MealTombstone.change_seq)).where(*expired).scalar_subquery())
+    )
+    return conn.execute(delete(MealTombstone).where(MealTombstone.deleted_at < cutoff)).rowcount
+
+
+async def compaction_loop(engine):
+    """Purge périodique (tâche de fond du serveur)"""
+    while True:
+        try:
+            async with engine.begin() as conn:
+                count = await conn.run_sync(compact_tombstones)
+            if count:
+                print(f"🧹 {count} suppressions de plus de {TOMBSTONE_RETENTION_DAYS} jours purgées")
+        except Exception as e:
+            print(f"⚠️ Purge des suppressions : {e}")
+        await asyncio.sleep(TOMBSTONE_COMPACT_INTERVAL * 3600)
+
+
+async def main():
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Purge des repas supprimés conservés pour la synchronisation")
+    parser.add_argument("--days", type=int, default=TOMBSTONE_RETENTION_DAYS, help="Conserver les suppressions plus récentes")
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        count = await conn.run_sync(compact_tombstones, timedelta(days=args.days))
+    print(f"✅ {count} suppressions purgées")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,9 @@
+"""
+Tests du backend : lancer `python -m pytest` depuis backend/ (pip install -r requirements-dev.txt)
+"""
+import os
+import sys
+
+# Modules du backend importables comme dans le conteneur (WORKDIR /app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
@@ -0,0 +1,57 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from admission import RATE_LIMIT_IP_FACTOR, AdmissionMiddleware
+
+PROXY = ("172.18.0.3", 51000)
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def login(middleware, client, forwarded_for=None):
+    """Statut de POST /auth/jwt/login vu par le middleware"""
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    scope = {"type": "http", "method": "POST", "path": "/auth/jwt/login", "client": client, "headers": headers}
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(middleware(scope, None, send))
+    return statuses[0]
+
+
+def admission(**kwargs):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    return AdmissionMiddleware(ok_app, engine, "secret", limits={"auth": (0.001, 1)}, **kwargs)
+
+
+IP_BURST = int(RATE_LIMIT_IP_FACTOR)
+
+
+def test_clients_behind_trusted_proxy_get_separate_buckets():
+    middleware = admission(trusted_proxies="172.16.0.0/12")
+    for _ in range(IP_BURST):
+        assert login(middleware, PROXY, "203.0.113.1") == 200
+    assert login(middleware, PROXY, "203.0.113.1") == 429
+    assert login(middleware, PROXY, "203.0.113.2") == 200
+
+
+def test_forwarded_for_prefix_set_by_the_client_is_ignored():
+    middleware = admission(trusted_proxies="172.16.0.0/12")
+    for _ in range(IP_BURST):
+        assert login(middleware, PROXY, "203.0.113.1") == 200
+    # nginx ajoute l'adresse réelle après celle inventée par le client
+    assert login(middleware, PROXY, "198.51.100.7, 203.0.113.1") == 429
+
+
+def test_forwarded_for_from_untrusted_peer_is_ignored():
+    middleware = admission(trusted_proxies="172.16.0.0/12")
+    for _ in range(IP_BURST):
+        assert login(middleware, ("192.0.2.10", 40000), "203.0.113.1") == 200
+    assert login(middleware, ("192.0.2.10", 40000), "203.0.113.2") == 429
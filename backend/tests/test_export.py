@@ -0,0 +1,38 @@
+import asyncio
+from collections import namedtuple
+
+from export import merge_partitions
+
+Row = namedtuple("Row", ("id", "date"))
+
+
+async def partitions(*chunks):
+    for chunk in chunks:
+        yield [Row(*row) for row in chunk]
+
+
+def merged(first, second, **kwargs):
+    async def collect():
+        return [[row.id for row in chunk] async for chunk in merge_partitions(first, second, **kwargs)]
+
+    return asyncio.run(collect())
+
+
+def test_merge_interleaves_by_date_and_id():
+    db = partitions([(1, 1), (4, 4)], [], [(6, 6)])
+    archived = partitions([(2, 2), (3, 3)], [(5, 5)])
+    assert sum(merged(db, archived), []) == [1, 2, 3, 4, 5, 6]
+
+
+def test_merge_descending_stops_at_limit():
+    db = partitions([(9, 9), (5, 5)])
+    archived = partitions([(8, 8), (7, 7)], [(1, 1)])
+    assert merged(db, archived, reverse=True, limit=3) == [[9, 8, 7]]
+
+
+def test_merge_yields_chunks_of_bounded_size():
+    db = partitions([(i, i) for i in range(0, 10, 2)])
+    archived = partitions([(i, i) for i in range(1, 10, 2)])
+    chunks = merged(db, archived, chunk_size=4)
+    assert sum(chunks, []) == list(range(10))
+    assert max(len(chunk) for chunk in chunks) <= 5
@@ -0,0 +1,25 @@
+from datetime import date
+
+import pytest
+
+from stats import MAX_BUCKETS, bucket_count, calendar_buckets
+
+
+@pytest.mark.parametrize("granularity", ["day", "week", "month"])
+@pytest.mark.parametrize("start, end", [
+    (date(2026, 10, 1), date(2026, 10, 1)),
+    (date(2025, 12, 30), date(2026, 3, 2)),
+    (date(2024, 2, 29), date(2026, 10, 18)),
+])
+def test_bucket_count_matches_calendar(granularity, start, end):
+    assert bucket_count(start, end, granularity) == len(calendar_buckets(start, end, granularity))
+
+
+def test_ten_years_of_days_fit_the_cap():
+    assert bucket_count(date(2016, 10, 19), date(2026, 10, 18), "day") <= MAX_BUCKETS
+
+
+def test_unbounded_range_exceeds_the_cap_without_enumerating():
+    assert bucket_count(date(1, 1, 1), date(9999, 12, 31), "day") > MAX_BUCKETS
+    assert bucket_count(date(1, 1, 1), date(9999, 12, 31), "month") > MAX_BUCKETS
+    assert bucket_count(date(2000, 1, 1), date(2026, 10, 18), "month") <= MAX_BUCKETS
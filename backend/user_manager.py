@@ -1,6 +1,10 @@
 import os
-from fastapi_users import BaseUserManager, IntegerIDMixin
+from fastapi import HTTPException
+from fastapi_users import BaseUserManager, IntegerIDMixin, exceptions
 from models import User
+from auth_cache import user_cache
+from invalidation import USER_CHANGED, invalidation_bus
+from passwords import PasswordQueueFull, password_pool
 
 SECRET = os.environ.get("SECRET", "changeme")
 
@@ -8,6 +12,63 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     reset_password_token_secret = SECRET
     verification_token_secret = SECRET
 
+    def __init__(self, user_db, password_helper=None):
+        super().__init__(user_db, password_helper or password_pool)
+
+    # Connexion, inscription et changement de mot de passe : calculs dans le
+    # pool de hachage (passwords.py), la boucle reste libre pendant ce temps
+    async def _offload(self, operation, *args):
+        try:
+            return await getattr(password_pool, operation)(*args)
+        except PasswordQueueFull as e:
+            raise HTTPException(
+                status_code=503,
+                detail="Trop de connexions en cours, réessayez plus tard",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+    async def authenticate(self, credentials):
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Même coût qu'un compte existant (pas d'indice sur les e-mails inscrits)
+            await self._offload("hash_async", credentials.password)
+            return None
+
+        verified, updated_password_hash = await self._offload(
+            "verify_and_update_async", credentials.password, user.hashed_password
+        )
+        if not verified:
+            return None
+        # Paramètres de coût modifiés (ou ancien hachage bcrypt) : rehachage transparent
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        return user
+
+    async def create(self, user_create, safe: bool = False, request=None) -> User:
+        await self.validate_password(user_create.password, user_create)
+
+        existing_user = await self.user_db.get_by_email(user_create.email)
+        if existing_user is not None:
+            raise exceptions.UserAlreadyExists()
+
+        user_dict = user_create.create_update_dict() if safe else user_create.create_update_dict_superuser()
+        password = user_dict.pop("password")
+        user_dict["hashed_password"] = await self._offload("hash_async", password)
+
+        created_user = await self.user_db.create(user_dict)
+        await self.on_after_register(created_user, request)
+        return created_user
+
+    async def _update(self, user: User, update_dict):
+        password = update_dict.get("password")
+        if password is None:
+            return await super()._update(user, update_dict)
+        await self.validate_password(password, user)
+        update_dict = {field: value for field, value in update_dict.items() if field != "password"}
+        update_dict["hashed_password"] = await self._offload("hash_async", password)
+        return await super()._update(user, update_dict)
+
     async def on_after_register(self, user: User, request=None):
         print(f"Utilisateur enregistré : {user.id}")
 
@@ -15,4 +76,25 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         print(f"Mot de passe oublié pour l'utilisateur {user.id}. Token: {token}")
 
     async def on_after_request_verify(self, user: User, token: str, request=None):
-        print(f"Vérification demandée pour l'utilisateur {user.id}. Token: {token}") 
\ No newline at end of file
+        print(f"Vérification demandée pour l'utilisateur {user.id}. Token: {token}") 
+
+    # Toute modification d'un utilisateur invalide ses sessions en cache,
+    # dans ce processus et dans les autres workers
+    async def _user_changed(self, user: User):
+        user_cache.invalidate_user(user.id)
+        await invalidation_bus.publish(USER_CHANGED, user.id)
+
+    async def on_after_update(self, user: User, update_dict, request=None):
+        await self._user_changed(user)
+
+    async def on_after_verify(self, user: User, request=None):
+        await self._user_changed(user)
+
+    async def on_after_reset_password(self, user: User, request=None):
+        await self._user_changed(user)
+
+    async def on_before_delete(self, user: User, request=None):
+        await self._user_changed(user)
+
+    async def on_after_delete(self, user: User, request=None):
+        await self._user_changed(user)
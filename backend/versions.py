@@ -0,0 +1,73 @@
+"""
+Version des données par utilisateur et requêtes conditionnelles (ETag / 304).
+
+Chaque écriture de repas incrémente la version de l'utilisateur dans la même
+transaction. Les réponses de liste et de statistiques portent un ETag dérivé
+de cette version et des paramètres de la requête : si le client renvoie le même
+ETag (If-None-Match), on répond 304 après une simple lecture par clé primaire,
+sans exécuter la requête sur les repas ni sérialiser quoi que ce soit.
+"""
+import hashlib
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import SessionLocal
+from models import DataVersion
+from rollup import dialect_insert
+
+
+async def bump_data_version(session: AsyncSession, user_id: int) -> int:
+    """
+    Incrémente la version et la retourne (change_seq des repas écrits, voir
+    sync.py). La ligne reste verrouillée jusqu'à la fin de la transaction : les
+    écritures d'un même utilisateur sont validées dans l'ordre de leur version.
+    """
+    insert = dialect_insert(session.bind.dialect.name)
+    stmt = insert(DataVersion).values(user_id=user_id, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DataVersion.user_id],
+        set_={"version": DataVersion.version + 1},
+    ).returning(DataVersion.version)
+    return await session.scalar(stmt)
+
+
+async def get_data_version(user_id: int) -> int:
+    async with SessionLocal() as session:
+        version = await session.scalar(select(DataVersion.version).where(DataVersion.user_id == user_id))
+    return version or 0
+
+
+def compute_etag(version: int, user_id: int, request: Request, extra: str = "") -> str:
+    """
+    ETag fort : version des données + chemin, paramètres et format demandés.
+    `extra` porte ce qui ne figure pas dans l'URL (ex. le jour par défaut « aujourd'hui »).
+    """
+    params = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    accept = request.headers.get("accept", "")
+    key = f"{user_id}|{request.url.path}|{params}|{accept}|{extra}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def check_not_modified(request: Request, user_id: int, extra: str = "") -> Tuple[str, Optional[Response]]:
+    """Retourne (etag, réponse 304 ou None si le client n'a pas la version courante)"""
+    etag = compute_etag(await get_data_version(user_id), user_id, request, extra)
+    if etag_matches(request, etag):
+        return etag, Response(status_code=304, headers=cache_headers(etag))
+    return etag, None
+
+
+def cache_headers(etag: str) -> dict:
+    # Le navigateur garde la réponse mais la revalide à chaque fois
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
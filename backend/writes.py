@@ -0,0 +1,95 @@
+"""
+Modification et suppression de repas en une seule requête SQL.
+
+Les cumuls (daily_totals, frequent_foods) ont besoin des anciennes valeurs du
+repas : plutôt que de charger l'objet ORM avant de l'écrire puis de le relire,
+- UPDATE ... FROM (SELECT ... FOR UPDATE) old ... RETURNING renvoie à la fois la
+  nouvelle ligne et l'ancienne (Postgres) ;
+- DELETE ... RETURNING renvoie la ligne supprimée.
+SQLite ne permet pas de référencer la clause FROM dans RETURNING : les anciennes
+valeurs y sont lues juste avant, dans la même transaction.
+Un repas absent ou appartenant à un autre utilisateur n'apparaît simplement
+pas dans le résultat (404 côté API).
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Meal
+from serialization import MEAL_READ_FIELDS
+
+# Colonnes dont dépendent daily_totals et frequent_foods
+CONTRIBUTION_COLUMNS = ("date", "name", "meal_type", "calories", "proteins", "carbohydrates", "fats", "fiber")
+OLD_PREFIX = "old_"
+
+meal_table = Meal.__table__
+
+
+def _columns(names: Sequence[str]):
+    return [meal_table.c[name] for name in names]
+
+
+def _shifted_date(dialect_name: str, shift: timedelta):
+    if dialect_name == "sqlite":
+        # Même format que celui écrit par SQLAlchemy (microsecondes comprises)
+        return func.strftime("%Y-%m-%d %H:%M:%f", meal_table.c.date, f"{shift.total_seconds():+f} seconds")
+    return meal_table.c.date + shift
+
+
+async def update_meals(
+    session: AsyncSession,
+    user_id: int,
+    ids: Sequence[int],
+    values: Dict,
+    date_shift: Optional[timedelta] = None,
+) -> List[Tuple[Dict, Dict]]:
+    """
+    Applique `values` (et éventuellement un décalage de date) aux repas `ids`
+    de l'utilisateur ; retourne (anciennes valeurs, nouveau repas au format
+    MealRead) pour chaque repas modifié.
+    """
+    dialect_name = session.bind.dialect.name
+    values = dict(values)
+    if date_shift:
+        values["date"] = _shifted_date(dialect_name, date_shift)
+    owned = (meal_table.c.id.in_(ids), meal_table.c.user_id == user_id)
+
+    if dialect_name == "postgresql":
+        old = (
+            select(meal_table.c.id, *_columns(CONTRIBUTION_COLUMNS))
+            .where(*owned)
+            .with_for_update()
+            .subquery("old")
+        )
+        stmt = (
+            update(meal_table)
+            .where(meal_table.c.id == old.c.id)
+            .values(**values)
+            .returning(*_columns(MEAL_READ_FIELDS), *(old.c[name].label(OLD_PREFIX + name) for name in CONTRIBUTION_COLUMNS))
+        )
+        width = len(MEAL_READ_FIELDS)
+        return [
+            (dict(zip(CONTRIBUTION_COLUMNS, row[width:])), dict(zip(MEAL_READ_FIELDS, row[:width])))
+            for row in await session.execute(stmt)
+        ]
+
+    before = {
+        row.id: row._asdict()
+        for row in await session.execute(select(meal_table.c.id, *_columns(CONTRIBUTION_COLUMNS)).where(*owned))
+    }
+    if not before:
+        return []
+    result = await session.execute(update(meal_table).where(*owned).values(**values).returning(*_columns(MEAL_READ_FIELDS)))
+    return [(before[row.id], row._asdict()) for row in result]
+
+
+async def delete_meals(session: AsyncSession, user_id: int, ids: Sequence[int]) -> List[Dict]:
+    """Supprime les repas `ids` de l'utilisateur ; retourne leurs anciennes valeurs (id compris)"""
+    stmt = (
+        delete(meal_table)
+        .where(meal_table.c.id.in_(ids), meal_table.c.user_id == user_id)
+        .returning(meal_table.c.id, *_columns(CONTRIBUTION_COLUMNS))
+    )
+    return [row._asdict() for row in await session.execute(stmt)]
@@ -1,16 +1,35 @@
 #!/bin/bash
 
-# Charger les variables d'environnement du projet
+# Sauvegarde via l'export complet de l'API (/meals/export/all) : repas archivés
+# inclus, colonnes de synchronisation (updated_at, change_seq) comprises.
+# Restauration : \copy meal (id, user_id, name, description, calories, proteins,
+#   carbohydrates, fats, fiber, meal_type, date, updated_at, change_seq)
+#   FROM 'calorietrack_backup.csv' WITH CSV HEADER
+
+# Charger les variables d'environnement du projet (BACKUP_EMAIL, BACKUP_PASSWORD d'un administrateur)
 set -a
 source /home/gzi/Desktop/calorie/calorieTracker/.env
 set +a
 
+API_URL="${API_URL:-http://localhost:8000}"
 BACKUP_DIR="/home/gzi/Desktop/calorie/backup"
 CSV_FILE="$BACKUP_DIR/calorietrack_backup.csv"
-TABLE="meal"
 
 mkdir -p "$BACKUP_DIR"
 
-echo "Export de la table $TABLE en CSV..."
-docker exec -t "$POSTGRES_CONTAINER" psql -U "$POSTGRES_USER" -d "$POSTGRES_DB" -c "\copy $TABLE TO STDOUT WITH CSV HEADER" > "$CSV_FILE"
-echo "Backup terminé : $CSV_FILE" 
+echo "Connexion à $API_URL..."
+TOKEN=$(curl -sf -X POST "$API_URL/auth/jwt/login" \
+    --data-urlencode "username=$BACKUP_EMAIL" --data-urlencode "password=$BACKUP_PASSWORD" \
+    | python3 -c "import json, sys; print(json.load(sys.stdin)['access_token'])") || {
+    echo "Connexion impossible" >&2
+    exit 1
+}
+
+echo "Export de tous les repas en CSV..."
+curl -sf -H "Authorization: Bearer $TOKEN" "$API_URL/meals/export/all?format=csv&gzip=false" -o "$CSV_FILE.tmp" || {
+    echo "Export impossible" >&2
+    rm -f "$CSV_FILE.tmp"
+    exit 1
+}
+mv "$CSV_FILE.tmp" "$CSV_FILE"
+echo "Backup terminé : $CSV_FILE"
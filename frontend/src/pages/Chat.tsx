@@ -132,20 +132,89 @@ export default function Chat() {
     }
   }, [jwt, selectedDate]);
 
-  const handleSend = (e: React.FormEvent) => {
+  const handleSend = async (e: React.FormEvent) => {
     e.preventDefault();
-    if (!input.trim()) return;
+    const description = input.trim();
+    if (!description) return;
     setMessages((msgs) => [
       ...msgs,
-      { type: 'user', text: input }
+      { type: 'user', text: description },
+      { type: 'ai', text: 'Estimation en cours…' }
     ]);
     setInput('');
-    setTimeout(() => {
-      setMessages((msgs) => [
-        ...msgs,
-        { type: 'ai', text: 'coucou' }
-      ]);
-    }, 400);
+    // Remplace le dernier message (celui de l'assistant) au fil des événements
+    const showStatus = (text: string) => {
+      setMessages((msgs) => [...msgs.slice(0, -1), { type: 'ai', text }]);
+    };
+    try {
+      const response = await fetch('/api/meals/estimate/stream', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${jwt}`,
+        },
+        body: JSON.stringify({ description }),
+      });
+      if (response.status === 401) {
+        setShowLogoutDialog(true);
+        return;
+      }
+      if (!response.ok || !response.body) {
+        const error = await response.json().catch(() => null);
+        const retryAfter = response.headers.get('Retry-After');
+        throw new Error((error?.detail || `Erreur ${response.status}`) + (retryAfter ? ` (dans ${retryAfter} s)` : ''));
+      }
+
+      // Server-Sent Events : blocs « event: ...\ndata: {...} » séparés par une ligne vide
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let tokens = 0;
+      let estimate: any = null;
+      while (!estimate) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop() || '';
+        for (const block of blocks) {
+          const event = block.match(/^event: (.*)$/m)?.[1];
+          const data = block.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          if (event === 'queued') {
+            showStatus(`En attente du modèle (position ${payload.position})…`);
+          } else if (event === 'token' || event === 'progress') {
+            tokens = event === 'token' ? tokens + 1 : payload.tokens;
+            showStatus(`Estimation en cours… (${tokens} jetons)`);
+          } else if (event === 'error') {
+            throw new Error(payload.detail);
+          } else if (event === 'result') {
+            estimate = payload;
+          }
+        }
+      }
+      if (!estimate) throw new Error('flux interrompu');
+
+      // Pré-remplit le formulaire : l'utilisateur valide ou corrige avant l'ajout
+      setMacros((prev) => ({
+        ...prev,
+        calories: String(Math.round(estimate.calories)),
+        proteins: String(Math.round(estimate.proteins)),
+        carbohydrates: String(Math.round(estimate.carbohydrates)),
+        fats: String(Math.round(estimate.fats)),
+        fiber: String(Math.round(estimate.fiber)),
+        name: estimate.name,
+        description,
+      }));
+      showStatus(
+        `${estimate.name} : ${Math.round(estimate.calories)} kcal, ${Math.round(estimate.proteins)} g de protéines, ` +
+        `${Math.round(estimate.carbohydrates)} g de glucides, ${Math.round(estimate.fats)} g de lipides. ` +
+        `Vérifiez les macros puis ajoutez le repas.`
+      );
+    } catch (error: any) {
+      showStatus(`Estimation impossible : ${error.message || 'erreur inconnue'}`);
+    }
   };
 
   const handleMacroChange = (e: React.ChangeEvent<HTMLInputElement | HTMLSelectElement>) => {
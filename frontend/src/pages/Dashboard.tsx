@@ -12,37 +12,28 @@ const macroOptions = [
   { value: 'fats', label: 'Lipides' },
 ];
 
-const API_URL = '/api/meals/';
+const STATS_URL = '/api/meals/stats/range';
 
-function aggregateMealsByDay(meals: any[]) {
-  // Regroupe les repas par date et somme les macros
-  const byDay: Record<string, any> = {};
-  meals.forEach(m => {
-    const date = m.date?.slice(0, 10);
-    if (!date) return;
-    if (!byDay[date]) {
-      byDay[date] = {
-        date,
-        calories: 0,
-        proteins: 0,
-        carbohydrates: 0,
-        fats: 0,
-        fiber: 0,
-      };
-    }
-    byDay[date].calories += m.calories || 0;
-    byDay[date].proteins += m.proteins || 0;
-    byDay[date].carbohydrates += m.carbohydrates || 0;
-    byDay[date].fats += m.fats || 0;
-    byDay[date].fiber += m.fiber || 0;
-  });
-  // Retourne un tableau trié par date croissante
-  return Object.values(byDay).sort((a: any, b: any) => a.date.localeCompare(b.date));
+interface RangeBucket {
+  bucket: string;
+  meal_count: number;
+  totals: Record<string, number>;
+  rolling_avg: Record<string, number>;
+}
+
+interface RangeStats {
+  buckets: RangeBucket[];
+  averages: Record<string, number>;
+  all_time_averages: Record<string, number>;
+}
+
+function formatDay(d: Date) {
+  return d.toISOString().split('T')[0];
 }
 
 export default function Dashboard() {
   const [macro, setMacro] = useState('calories');
-  const [meals, setMeals] = useState<any[]>([]);
+  const [stats, setStats] = useState<RangeStats | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const navigate = useNavigate();
@@ -50,11 +41,21 @@ export default function Dashboard() {
   const [showLogoutDialog, setShowLogoutDialog] = useState(false);
 
   useEffect(() => {
-    async function fetchMeals() {
+    async function fetchStats() {
       setLoading(true);
       setError(null);
       try {
-        const res = await fetch(API_URL, {
+        // Agrégation faite côté serveur sur les 30 derniers jours
+        const to = new Date();
+        const from = new Date(to.getTime() - 29 * 24 * 3600 * 1000);
+        const params = new URLSearchParams({
+          from: formatDay(from),
+          to: formatDay(to),
+          granularity: 'day',
+          macros: macroOptions.map(opt => opt.value).join(','),
+          window: '7',
+        });
+        const res = await fetch(`${STATS_URL}?${params}`, {
           headers: {
             'Authorization': `Bearer ${jwt}`,
           },
@@ -65,7 +66,7 @@ export default function Dashboard() {
         }
         if (!res.ok) throw new Error('Erreur lors de la récupération des repas');
         const data = await res.json();
-        setMeals(data);
+        setStats(data);
       } catch (e: any) {
         if (e.message && e.message.includes('401')) {
           setShowLogoutDialog(true);
@@ -76,21 +77,17 @@ export default function Dashboard() {
         setLoading(false);
       }
     }
-    if (jwt) fetchMeals();
+    if (jwt) fetchStats();
   }, [jwt]);
 
-  // Agrégation par jour
-  const mealsByDay = aggregateMealsByDay(meals);
-  // On ne garde que les 30 derniers jours
-  const last30Days = mealsByDay.slice(-30);
-  // Adapter la donnée pour Victory (x = date, y = macro)
-  const data = last30Days.map(d => ({ x: d.date, y: d[macro as keyof typeof mealsByDay[0]] as number }));
+  // Totaux par jour (x = date, y = macro) pour Victory
+  const buckets = stats?.buckets ?? [];
+  const data = buckets.map(b => ({ x: b.bucket, y: b.totals[macro] ?? 0 }));
 
-  // Calcul des moyennes
-  const allValues = data.map(d => d.y);
-  const allTimeAvg = allValues.length ? allValues.reduce((a, b) => a + b, 0) / allValues.length : 0;
-  const avg30 = allValues.length ? allValues.slice(-30).reduce((a, b) => a + b, 0) / Math.min(30, allValues.length) : 0;
-  const avg7 = allValues.length ? allValues.slice(-7).reduce((a, b) => a + b, 0) / Math.min(7, allValues.length) : 0;
+  // Moyennes calculées par le serveur (tout l'historique, période et glissante sur 7 jours)
+  const allTimeAvg = stats?.all_time_averages[macro] ?? 0;
+  const avg30 = stats?.averages[macro] ?? 0;
+  const avg7 = buckets.length ? buckets[buckets.length - 1].rolling_avg[macro] ?? 0 : 0;
 
   // Pour n'afficher qu'une date sur deux
   const xTickValues = data.map((d, i) => (i % 2 === 0 ? d.x : ''));
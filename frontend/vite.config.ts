@@ -4,4 +4,8 @@ import react from '@vitejs/plugin-react'
 // https://vite.dev/config/
 export default defineConfig({
   plugins: [react()],
+  build: {
+    // dist/.vite/manifest.json : liste des fichiers à empreinte, servis immutable par le backend
+    manifest: true,
+  },
 })